@@ -1,126 +1,562 @@
-import io
-
-import chess
-import chess.engine
-import chess.pgn
-from fastapi import HTTPException
-
-from app.api.utils import chess_utils, openai_utils
+import asyncio
+import json
+import time
+from typing import Dict, NamedTuple, Optional
+
+from fastapi import BackgroundTasks, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+from app.api.utils import (
+    chess_utils,
+    commentary_utils,
+    openai_utils,
+    pgn_utils,
+    request_utils,
+)
+from app.api.utils.cache_utils import (
+    CommentaryCache,
+    EvalCache,
+    PositionCommentaryCache,
+)
+from app.core.config import OPENAIConfig, PGNConfig, StockfishConfig
+from app.engine.engine_pool import EnginePriority
+from app.jobs.job_queue import ZuJobQueue
+from app.models.analysis import AnalysisMode, CommentaryMode, CommentaryStatus
+from app.models.board import BoardsRequest
+from app.models.job import JobStatus
 
 
 async def delete_this_route() -> dict:
     return {"msg": "This is dummy route to show basic get request"}
 
 
-async def analyse_pgn(pgn_string):
+class AnalysisRun(NamedTuple):
+    """Outcome of one engine analysis, shared by coalesced duplicate submissions."""
+
+    response: dict
+    pgn_id: str
+    analysis: list
+    critical_moments: dict
+    is_new: bool
+
+
+class InFlightAnalysis(object):
+    """
+    An engine analysis in progress, shared by coalesced duplicate submissions.
+
+    Attributes:
+    - future (asyncio.Future[AnalysisRun]): The running analysis.
+    - analysis (list): Best move and evaluation of every ply searched so far,
+      None for the others.
+    - waiters (int): Requests and jobs waiting for the analysis; it is
+      cancelled when the last of them is a request that disconnects.
+    """
+
+    def __init__(
+        self,
+        parsed: pgn_utils.ParsedGame,
+        workers: int = None,
+        priority: EnginePriority = EnginePriority.STANDARD,
+    ):
+        self.analysis = [None] * len(parsed.fens)
+        self.waiters = 0
+        self.future = asyncio.ensure_future(
+            run_analysis(
+                parsed,
+                workers,
+                on_result=chess_utils.analysis_recorder(self.analysis),
+                priority=priority,
+            )
+        )
+
+
+# Engine analyses in progress, keyed by game hash
+IN_FLIGHT_ANALYSES: Dict[str, InFlightAnalysis] = {}
+
+
+async def analyse_pgn(
+    pgn_string,
+    background_tasks: BackgroundTasks,
+    request: Request,
+    workers: int = None,
+    commentary_mode: CommentaryMode = None,
+):
     """
-    Validates if the given string is a valid PGN.
+    Validates and analyses the given PGN. The engine analysis and critical
+    moments are saved and returned right away; the commentary is generated in
+    the background and can be polled with `get_commentary`.
+
+    Games are content addressed by their start position and moves: a game that
+    was already analysed is returned from the database, and concurrent
+    submissions of the same game share one analysis.
+
+    The analysis is cancelled when every client waiting for it disconnected.
+    When the request deadline passes first, the plies analysed so far are
+    returned marked incomplete; the analysis goes on and is saved, so the
+    game can be submitted again later.
 
     Parameters:
     - pgn_string (str): The PGN string to be validated.
+    - background_tasks (BackgroundTasks): Runs the commentary after the response.
+    - request (Request): The request, to watch the client connection.
+    - workers (int, optional): Number of engines to analyse the game with.
+    - commentary_mode (CommentaryMode, optional): `llm`, `hybrid` or `local`
+      commentary of a newly analysed game. Defaults to COMMENTARY_MODE.
 
     Returns:
-    - A JSON response indicating whether the PGN is valid or not.
-    """
-    is_valid_pgn = await chess_utils.validate_pgn_format(pgn_string)
-    if is_valid_pgn:
-        pgn_dict = chess_utils.pgn_to_dict(pgn_string)
-
-        moves_dict = await chess_utils.pgn_to_moves_dict(pgn_dict["Moves"][0])
-        if "Moves" in pgn_dict:
-            pgn_dict["Moves"] = {str(k): v for k, v in moves_dict.items()}
-        save_result = await save_pgn_to_db(pgn_dict)
-        analysis = await get_best_moves(pgn_string)
-        critical_moments = await chess_utils.get_critical_moments(analysis, pgn_string)
-        critical_moments = {str(k): v for k, v in critical_moments.items()}
-        openai_analysis = await openai_utils.analyze_chess_game(
-            pgn_string, analysis, critical_moments
+    - A JSON response with the saved game, its critical moments and the
+      commentary status.
+    """
+    parsed = pgn_utils.parse_pgn(pgn_string)
+    if not parsed.is_valid:
+        return {"message": "Invalid PGN format", "status": "error"}, 400
+    deadline = request_utils.request_deadline(request)
+
+    analysed = await get_analysed_game(parsed.game_hash)
+    if analysed:
+        return analysed
+
+    in_flight = IN_FLIGHT_ANALYSES.get(parsed.game_hash)
+    if in_flight is None:
+        in_flight = start_analysis(parsed, workers)
+        background_tasks.add_task(
+            comment_when_analysed, in_flight, parsed, commentary_mode
         )
-        await chess_utils.save_analysis(
-            analysis,
-            pgn_dict["id"],
-            critical_moments,
-            pgn_dict["Moves"],
-            openai_analysis,
+    return await await_analysis(in_flight, request, deadline)
+
+
+def start_analysis(
+    parsed: pgn_utils.ParsedGame,
+    workers: int = None,
+    priority: EnginePriority = EnginePriority.STANDARD,
+):
+    in_flight = InFlightAnalysis(parsed, workers, priority)
+    IN_FLIGHT_ANALYSES[parsed.game_hash] = in_flight
+    in_flight.future.add_done_callback(
+        lambda _: IN_FLIGHT_ANALYSES.pop(parsed.game_hash, None)
+    )
+    return in_flight
+
+
+async def await_analysis(
+    in_flight: InFlightAnalysis, request: Request, deadline: float = None
+):
+    in_flight.waiters += 1
+    try:
+        done = await request_utils.wait_while_connected(
+            request, in_flight.future, deadline
+        )
+    except request_utils.ClientDisconnected:
+        if in_flight.waiters == 1:
+            in_flight.future.cancel()
+        raise
+    finally:
+        in_flight.waiters -= 1
+    if not done:
+        return partial_analysis_response(in_flight.analysis)
+    return in_flight.future.result().response
+
+
+def partial_analysis_response(analysis: list) -> dict:
+    return {
+        "message": "Deadline reached before the analysis finished",
+        "complete": False,
+        "analysis": analysis,
+        "analysed_plies": sum(ply is not None for ply in analysis),
+        "total_plies": len(analysis),
+    }
+
+
+async def comment_when_analysed(
+    in_flight: InFlightAnalysis,
+    parsed: pgn_utils.ParsedGame,
+    mode: CommentaryMode = None,
+):
+    """
+    Generates the commentary once a new game is analysed, unless the analysis
+    failed or was cancelled.
+    """
+    await asyncio.wait({in_flight.future})
+    if in_flight.future.cancelled() or in_flight.future.exception():
+        return
+    run = in_flight.future.result()
+    if run.is_new:
+        await generate_commentary(
+            run.pgn_id, parsed, run.analysis, run.critical_moments, mode
         )
 
-        if save_result:
-            pgn_dict.pop("_id", None)  # Remove ObjectId which is not serializable
-            return {
-                "message": "PGN saved successfully",
-                "data": pgn_dict,
-                "critical_moments": critical_moments,
-                "openai_analysis": openai_analysis,
-            }
 
-        else:
-            return {
-                "message": "Failed to save PGN",
-                "data": pgn_dict,
-                "critical_moments": critical_moments,
-            }, 500
+async def submit_analysis_job(
+    pgn_string: str, workers: int = None, commentary_mode: CommentaryMode = None
+):
+    """
+    Queues the analysis of the given PGN and returns its job id right away.
+    The job runs the engine analysis and the commentary, like `analyse_pgn`,
+    and its status and result can be polled with `get_job`.
 
-    else:
-        return {"message": "Invalid PGN format", "status": "error"}, 400
+    Parameters:
+    - pgn_string (str): The PGN string to be validated.
+    - workers (int, optional): Number of engines to analyse the game with.
+    - commentary_mode (CommentaryMode, optional): `llm`, `hybrid` or `local`
+      commentary of a newly analysed game. Defaults to COMMENTARY_MODE.
+
+    Raises:
+    - HTTPException: 400 for an invalid PGN, 429 when the job queue is full.
+    """
+    parsed = pgn_utils.parse_pgn(pgn_string)
+    if not parsed.is_valid:
+        raise HTTPException(status_code=400, detail="Invalid PGN format")
+    job_id = await ZuJobQueue.submit(
+        "analysis",
+        run_analysis_job,
+        parsed=parsed,
+        workers=workers,
+        commentary_mode=commentary_mode,
+    )
+    return {"job_id": job_id, "status": JobStatus.QUEUED}
+
+
+async def run_analysis_job(
+    parsed: pgn_utils.ParsedGame,
+    workers: int = None,
+    commentary_mode: CommentaryMode = None,
+) -> dict:
+    """
+    Analyses a game and, when it is new, generates its commentary before
+    returning, so queued jobs also bound the LLM calls in flight.
+    """
+    analysed = await get_analysed_game(parsed.game_hash)
+    if analysed:
+        return analysed
+
+    in_flight = IN_FLIGHT_ANALYSES.get(parsed.game_hash)
+    if in_flight is not None:
+        return (await await_job_analysis(in_flight)).response
+    in_flight = start_analysis(parsed, workers, EnginePriority.BULK)
+    run = await await_job_analysis(in_flight)
+    if not run.is_new:
+        return run.response
+    await generate_commentary(
+        run.pgn_id, parsed, run.analysis, run.critical_moments, commentary_mode
+    )
+    analysed = await get_analysed_game(parsed.game_hash)
+    if analysed is None:
+        return run.response
+    return {**analysed, "message": "PGN analysed"}
+
+
+async def await_job_analysis(in_flight: InFlightAnalysis) -> AnalysisRun:
+    """
+    Waits for an analysis on behalf of a job. The job counts as a waiter, so a
+    request sharing the analysis cannot cancel it by disconnecting.
+    """
+    in_flight.waiters += 1
+    try:
+        return await asyncio.shield(in_flight.future)
+    finally:
+        in_flight.waiters -= 1
 
 
-async def save_pgn_to_db(pgn_dict: dict):
+async def get_job(job_id: str):
     """
-    Saves the PGN data to the MongoDB database by calling the utility function.
+    Returns the status of a queued job, and its result or error once it has
+    finished.
 
-    Args:
-        pgn_dict (dict): A dictionary containing the PGN data.
+    Parameters:
+    - job_id (str): The id returned when the job was submitted.
+    """
+    job = await ZuJobQueue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+async def upload_pgn_file(
+    request: Request,
+    analyse: bool = False,
+    workers: int = None,
+    commentary_mode: CommentaryMode = None,
+):
+    """
+    Saves every game of a multi-game PGN file sent as the request body, e.g. a
+    monthly chess.com or Lichess archive, optionally gzip-encoded. The body is
+    streamed and split into games as it arrives, so memory stays bounded by
+    one batch of PGN_UPLOAD_BATCH_SIZE games whatever the file size.
+
+    Every game is validated and normalised like a single `/pgn` submission,
+    and saved with one insert per batch. Games already stored are counted as
+    duplicates. With `analyse`, an analysis job is queued for every new game
+    at bulk priority until the job queue is full; the remaining games are
+    saved but not queued, and can be submitted to `/jobs` later.
+
+    Parameters:
+    - request (Request): The request, with the PGN file as its body.
+    - analyse (bool): Whether to queue the analysis of the new games.
+    - workers (int, optional): Number of engines to analyse each game with.
+    - commentary_mode (CommentaryMode, optional): `llm`, `hybrid` or `local`
+      commentary of the analysed games. Defaults to COMMENTARY_MODE.
+
+    Returns:
+    - The number of games read, saved, duplicate, invalid and queued, the
+      first PGN_UPLOAD_MAX_ERRORS validation errors, and the throughput in
+      games per second.
     """
+    start = time.perf_counter()
+    report = {"games": 0, "saved": 0, "duplicates": 0, "invalid": 0, "queued": 0}
+    report["errors"] = []
+    queue = (
+        {"workers": workers, "commentary_mode": commentary_mode} if analyse else None
+    )
+    batch = []
+    chunks = request_utils.body_chunks(request)
+    async for pgn_string in pgn_utils.iter_pgn_games(chunks):
+        report["games"] += 1
+        parsed = pgn_utils.parse_pgn(pgn_string)
+        if parsed.is_valid:
+            batch.append((parsed, chess_utils.parsed_game_to_dict(parsed)))
+        else:
+            record_invalid_game(report, parsed)
+        if len(batch) >= PGNConfig.PGN_UPLOAD_BATCH_SIZE:
+            await save_upload_batch(batch, report, queue)
+            batch = []
+        # Parsing is CPU bound: let other requests in between games
+        await asyncio.sleep(0)
+    await save_upload_batch(batch, report, queue)
+
+    seconds = time.perf_counter() - start
+    games_per_second = report["games"] / seconds if seconds else 0
+    print(f"Ingested {report['games']} games in {seconds:.1f}s")
+    return {
+        "message": "PGN file ingested",
+        **report,
+        "seconds": round(seconds, 3),
+        "games_per_second": round(games_per_second, 1),
+    }
+
+
+def record_invalid_game(report: dict, parsed: pgn_utils.ParsedGame):
+    report["invalid"] += 1
+    if len(report["errors"]) < PGNConfig.PGN_UPLOAD_MAX_ERRORS:
+        report["errors"].append({"game": report["games"], "error": parsed.errors[0]})
+
+
+async def save_upload_batch(batch: list, report: dict, queue: Optional[dict]):
+    """
+    Saves a batch of uploaded games, and queues the analysis of the new ones
+    when `queue` holds the job arguments.
+    """
+    if not batch:
+        return
     try:
-        # Ensure all keys in pgn_dict are strings to comply with MongoDB requirements
-        # This includes converting the 'Moves' keys to strings if present
+        saved = await chess_utils.save_pgns_to_db([pgn_dict for _, pgn_dict in batch])
+    except Exception as e:
+        print(f"Failed to save uploaded games. Error: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to save games after game {report['games'] - len(batch)}",
+        )
+    report["saved"] += len(saved)
+    report["duplicates"] += len(batch) - len(saved)
+    if queue:
+        report["queued"] += await queue_analysis_jobs(
+            [batch[index][0] for index in saved], **queue
+        )
 
-        # Call the utility function to save PGN data to the database
-        await chess_utils.save_pgn_to_db(pgn_dict)
+
+async def queue_analysis_jobs(games: list, **kwargs) -> int:
+    """Queues an analysis job per parsed game until the job queue is full."""
+    for queued, parsed in enumerate(games):
+        try:
+            await ZuJobQueue.submit(
+                "analysis", run_analysis_job, parsed=parsed, **kwargs
+            )
+        except HTTPException:
+            return queued
+    return len(games)
+
+
+async def get_analysed_game(game_hash: str) -> Optional[dict]:
+    """
+    Returns the response of an earlier analysis of the same game, or None if
+    the game was never analysed.
+    """
+    document = await chess_utils.fetch_analysis_by_hash(game_hash)
+    pgn_dict = document and await chess_utils.fetch_pgn_by_hash(game_hash)
+    if not pgn_dict:
+        return None
+    response = {
+        "message": "PGN already analysed",
+        "data": pgn_dict,
+        "critical_moments": document["critical_moments"],
+        "commentary_status": document.get("commentary_status", CommentaryStatus.DONE),
+    }
+    if document.get("openai_analysis") is not None:
+        response["openai_analysis"] = document["openai_analysis"]
+    return response
+
+
+async def run_analysis(
+    parsed: pgn_utils.ParsedGame,
+    workers: int = None,
+    on_result=None,
+    priority: EnginePriority = EnginePriority.STANDARD,
+):
+    pgn_dict = chess_utils.parsed_game_to_dict(parsed)
+    pgn_id = await save_pgn_to_db(pgn_dict)
+    if pgn_id:
+        pgn_dict["id"] = pgn_id
+    analysis = await chess_utils.get_best_moves(
+        parsed, workers=workers, on_result=on_result, priority=priority
+    )
+    critical_moments = await chess_utils.get_critical_moments(analysis, parsed)
+    critical_moments = {str(k): v for k, v in critical_moments.items()}
+    is_new = await chess_utils.save_analysis(
+        analysis,
+        pgn_dict["id"],
+        critical_moments,
+        pgn_dict.get("Moves", {}),
+        commentary_status=CommentaryStatus.PENDING,
+        game_hash=parsed.game_hash,
+    )
+
+    pgn_dict.pop("_id", None)  # Remove ObjectId which is not serializable
+    # Boards are served per ply by /board, not with the game
+    pgn_dict.pop("fens", None)
+    response = {
+        "data": pgn_dict,
+        "critical_moments": critical_moments,
+        "commentary_status": CommentaryStatus.PENDING,
+    }
+    if not pgn_id:
+        response = {"message": "Failed to save PGN", **response}, 500
+    else:
+        response = {"message": "PGN saved successfully", **response}
+    return AnalysisRun(response, pgn_dict["id"], analysis, critical_moments, is_new)
+
+
+async def generate_commentary(
+    pgn_id: str,
+    parsed: pgn_utils.ParsedGame,
+    analysis: list,
+    critical_moments: dict,
+    mode: CommentaryMode = None,
+):
+    """
+    Generates the commentary of an analysed game in the given mode and stores
+    it, or the failure, on its analysis document. Commentary missing some plies
+    is stored as PARTIAL. Runs after the response is sent.
+    """
+    try:
+        openai_analysis = await commentary_utils.generate_game_commentary(
+            parsed, analysis, critical_moments, mode
+        )
+    except openai_utils.IncompleteCommentary as e:
+        print(f"Partial commentary for {pgn_id}. Error: {e}")
+        await chess_utils.save_commentary(
+            pgn_id, CommentaryStatus.PARTIAL, e.commentary, error=str(e)
+        )
+        return
     except Exception as e:
-        print(f"An error occurred while saving PGN data to the database: {e}")
-        return False
-    return True
+        print(f"Failed to generate commentary for {pgn_id}. Error: {e}")
+        await chess_utils.save_commentary(pgn_id, CommentaryStatus.FAILED, error=str(e))
+        return
+    if not openai_analysis:
+        await chess_utils.save_commentary(
+            pgn_id, CommentaryStatus.FAILED, error="No commentary within the deadline"
+        )
+        return
+    await chess_utils.save_commentary(pgn_id, CommentaryStatus.DONE, openai_analysis)
 
 
-def go_to_move_number(game, move_number):
+async def get_commentary(pgn_id: str):
     """
-    Advances the game to a specific move number and returns the board at that position.
+    Returns the commentary status of an analysed game and the commentary once
+    it is done.
 
     Parameters:
-    - game (chess.pgn.Game): The game object.
-    - move_number (int): The move number to advance to.
+    - pgn_id (str): The id of the analysed game.
+    """
+    document = await chess_utils.fetch_analysis(pgn_id=pgn_id)
+    if document is None:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    return {
+        "pgn_id": pgn_id,
+        # Analyses saved before commentary moved to the background were complete
+        "commentary_status": document.get("commentary_status", CommentaryStatus.DONE),
+        "openai_analysis": document.get("openai_analysis"),
+        "commentary_error": document.get("commentary_error"),
+    }
+
+
+async def save_pgn_to_db(pgn_dict: dict) -> Optional[str]:
+    """
+    Saves the PGN data to the MongoDB database by calling the utility function.
+
+    Args:
+        pgn_dict (dict): A dictionary containing the PGN data.
 
     Returns:
-    - chess.Board: The board position at the specified move number.
+        str: The id of the stored game, None if it could not be saved.
     """
-    # Initialize a board from the game's starting position
-    board = game.board()
-    # Iterate over the mainline moves up to the specified move number
-    for move in game.mainline_moves():
-        if board.fullmove_number > move_number:
-            break
-        board.push(move)
-    return board
+    try:
+        # Call the utility function to save PGN data to the database
+        return await chess_utils.save_pgn_to_db(pgn_dict)
+    except Exception as e:
+        print(f"An error occurred while saving PGN data to the database: {e}")
+        return None
 
 
-async def get_best_moves(pgn_string: str):
+async def get_best_moves(
+    pgn_string: str,
+    request: Request,
+    workers: int = None,
+    analysis_mode: AnalysisMode = None,
+    time_budget: float = None,
+    node_budget: int = None,
+):
     """
     Finds the best move at each move in the given game and returns them.
 
     Parameters:
     - pgn_string (str): The PGN string of the game.
+    - request (Request): The request; the analysis stops when the client
+      disconnects, and returns the plies analysed so far, marked incomplete,
+      when the request deadline passes.
+    - workers (int, optional): Number of engines to analyse the game with.
+    - analysis_mode (AnalysisMode, optional): `fixed` or `adaptive`. Defaults
+      to ANALYSIS_MODE.
+    - time_budget (float, optional): Seconds for an adaptive analysis.
+    - node_budget (int, optional): Nodes for an adaptive analysis.
 
     Returns:
-    - A list of best moves and their evaluations for each move in the game.
+    - A list of best moves and their evaluations for each move in the game. An
+      adaptive analysis also returns the depth of every ply.
     """
-    pgn_io = io.StringIO(pgn_string)
-    game = chess.pgn.read_game(pgn_io)
+    parsed = pgn_utils.parse_pgn(pgn_string)
 
-    if game is None:
+    if not parsed.is_valid:
         return {"error": "Invalid PGN string"}
 
-    return await chess_utils.get_best_moves(game)
+    progress = [None] * len(parsed.fens)
+    on_result = chess_utils.analysis_recorder(progress)
+    mode = AnalysisMode(analysis_mode or StockfishConfig.ANALYSIS_MODE)
+    if mode == AnalysisMode.ADAPTIVE:
+        search = chess_utils.analyse_game_adaptive(
+            parsed,
+            workers=workers,
+            time_budget=time_budget,
+            node_budget=node_budget,
+            on_result=on_result,
+        )
+    else:
+        search = chess_utils.get_best_moves(
+            parsed, workers=workers, mode=mode, on_result=on_result
+        )
+    try:
+        result = await request_utils.wait_for_request(search, request)
+    except asyncio.TimeoutError:
+        return partial_analysis_response(progress)
+    return result._asdict() if mode == AnalysisMode.ADAPTIVE else result
 
 
 async def get_board_at_move(move_no: int, pgn_string: str):
@@ -136,29 +572,285 @@ async def get_board_at_move(move_no: int, pgn_string: str):
     """
 
     try:
-        pgn_io = io.StringIO(pgn_string)
-        game = chess.pgn.read_game(pgn_io)
-
-        board = game.board()
-        # Iterate through the moves up to the specified move number
-        for i, move in enumerate(game.mainline_moves(), start=1):
-            if i == move_no:
-                break
-            board.push(move)
+        parsed = pgn_utils.parse_pgn(pgn_string)
+        if not parsed.is_valid:
+            raise ValueError(parsed.errors[0])
         # If the move number exceeds the total moves in the game
-        if move_no > i:
+        if move_no > len(parsed.fens):
             raise ValueError("Move number exceeds the total moves in the game.")
-        print(board)
-        return {"fen": board.fen(), "move_no": move_no}
+        # The board just before the given move is played
+        return {"fen": parsed.fen_at(move_no - 1), "move_no": move_no}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
+async def get_board_by_id(pgn_id: str, ply: int):
+    """
+    Returns the board state after a given ply of a stored game, read from its
+    precomputed FEN index.
+
+    Parameters:
+    - pgn_id (str): The id of the stored game.
+    - ply (int): Number of half-moves played, 0 being the starting position.
+
+    Returns:
+    - A JSON response with the board state after the given ply.
+    """
+    fens = await chess_utils.get_fen_index(pgn_id)
+    if fens is None:
+        raise HTTPException(status_code=404, detail="PGN not found")
+    if not 0 <= ply < len(fens):
+        raise HTTPException(
+            status_code=400, detail="Ply exceeds the total moves in the game."
+        )
+    return {"fen": fens[ply], "pgn_id": pgn_id, "ply": ply}
+
+
+async def stream_commentary(pgn_id: str) -> StreamingResponse:
+    """
+    Streams the commentary of an analysed game as NDJSON, one
+    {"ply", "text"} line per ply as soon as the model has written it, then a
+    final {"commentary_status"} line. The assembled commentary is saved on the
+    analysis document. A commentary that is already done is replayed, and one
+    still being generated in the background is waited for.
+
+    Parameters:
+    - pgn_id (str): The id of the analysed game.
+    """
+    document = await chess_utils.fetch_analysis(pgn_id=pgn_id)
+    pgn_document = document and await chess_utils.fetch_pgn(pgn_id)
+    if not pgn_document:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    parsed = pgn_utils.parse_pgn(chess_utils.document_to_pgn(pgn_document))
+    return StreamingResponse(
+        commentary_lines(pgn_id, document, parsed),
+        media_type="application/x-ndjson",
+    )
+
+
+def ndjson_line(data: dict) -> str:
+    return json.dumps(data) + "\n"
+
+
+async def await_pending_commentary(pgn_id: str, document: dict) -> dict:
+    """
+    Polls the analysis document while its commentary is generated in the
+    background, so a stream does not ask the model a second time. Gives up
+    after COMMENTARY_PENDING_WAIT seconds, e.g. when the process generating it
+    stopped.
+    """
+    deadline = time.perf_counter() + OPENAIConfig.COMMENTARY_PENDING_WAIT
+    while (
+        document.get("commentary_status") == CommentaryStatus.PENDING
+        and time.perf_counter() < deadline
+    ):
+        await asyncio.sleep(OPENAIConfig.COMMENTARY_POLL_INTERVAL)
+        document = await chess_utils.fetch_analysis(pgn_id=pgn_id) or document
+    return document
+
+
+async def commentary_lines(pgn_id: str, document: dict, parsed: pgn_utils.ParsedGame):
+    document = await await_pending_commentary(pgn_id, document)
+    stored = document.get("openai_analysis")
+    if document.get("commentary_status") == CommentaryStatus.DONE and stored:
+        for ply, text in stored.items():
+            yield ndjson_line({"ply": ply, "text": text})
+        yield ndjson_line({"commentary_status": CommentaryStatus.DONE})
+        return
+
+    commentary = {}
+    try:
+        async for ply, text in openai_utils.stream_game_commentary(
+            parsed, document["analysis"], document["critical_moments"]
+        ):
+            commentary[ply] = text
+            yield ndjson_line({"ply": ply, "text": text})
+    except Exception as e:
+        print(f"Failed to stream commentary for {pgn_id}. Error: {e}")
+        await chess_utils.save_commentary(pgn_id, CommentaryStatus.FAILED, error=str(e))
+        yield ndjson_line({"commentary_status": CommentaryStatus.FAILED})
+        return
+
+    commentary = dict(sorted(commentary.items(), key=lambda item: int(item[0])))
+    await chess_utils.save_commentary(pgn_id, CommentaryStatus.DONE, commentary)
+    yield ndjson_line({"commentary_status": CommentaryStatus.DONE})
+
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def sse_response(events) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def analysis_events(
+    parsed: pgn_utils.ParsedGame, workers: int = None, on_done=None
+):
+    """
+    Server-sent events of a game analysis: a `ply` event with the best move and
+    evaluation of every ply as soon as an engine finishes it, then the
+    `critical_moments` and a final `summary`. `on_done(analysis,
+    critical_moments)` may add fields to the summary. Failures end the stream
+    with an `error` event.
+    """
+    analysis = [None] * len(parsed.fens)
+    try:
+        async for ply, best_move, score in chess_utils.stream_best_moves(
+            parsed, workers=workers
+        ):
+            analysis[ply - 1] = (best_move, score)
+            yield sse_event("ply", {"ply": ply, "best_move": best_move, "eval": score})
+        critical_moments = await chess_utils.get_critical_moments(analysis, parsed)
+        critical_moments = {str(k): v for k, v in critical_moments.items()}
+        yield sse_event("critical_moments", critical_moments)
+        summary = {"plies": len(analysis), "critical_moments": len(critical_moments)}
+        if on_done:
+            summary.update(await on_done(analysis, critical_moments))
+    except Exception as e:
+        print(f"Failed to stream the analysis. Error: {e}")
+        yield sse_event("error", {"detail": str(e)})
+        return
+    yield sse_event("summary", summary)
+
+
+async def stream_best_moves(pgn_string: str, workers: int = None) -> StreamingResponse:
+    """
+    Streams the best move and evaluation of every ply of the given game as
+    server-sent events, see `analysis_events`.
+
+    Parameters:
+    - pgn_string (str): The PGN string of the game.
+    - workers (int, optional): Number of engines to analyse the game with.
+    """
+    parsed = pgn_utils.parse_pgn(pgn_string)
+    if not parsed.is_valid:
+        raise HTTPException(status_code=400, detail="Invalid PGN string")
+    return sse_response(analysis_events(parsed, workers))
+
+
+async def stream_analysis(
+    pgn_string: str,
+    background_tasks: BackgroundTasks,
+    workers: int = None,
+    commentary_mode: CommentaryMode = None,
+) -> StreamingResponse:
+    """
+    Streaming variant of `analyse_pgn`: the plies, critical moments and summary
+    are sent as server-sent events while the engines work, see
+    `analysis_events`. The summary carries the `pgn_id` and commentary status;
+    the analysis is saved and the commentary generated in the background as
+    with `analyse_pgn`. A game that was already analysed is replayed.
+
+    Parameters:
+    - pgn_string (str): The PGN string to be validated.
+    - background_tasks (BackgroundTasks): Runs the commentary after the response.
+    - workers (int, optional): Number of engines to analyse the game with.
+    - commentary_mode (CommentaryMode, optional): `llm`, `hybrid` or `local`
+      commentary of a newly analysed game. Defaults to COMMENTARY_MODE.
+    """
+    parsed = pgn_utils.parse_pgn(pgn_string)
+    if not parsed.is_valid:
+        raise HTTPException(status_code=400, detail="Invalid PGN format")
+
+    document = await chess_utils.fetch_analysis_by_hash(parsed.game_hash)
+    if document:
+        return sse_response(stored_analysis_events(document))
+
+    async def save(analysis: list, critical_moments: dict) -> dict:
+        pgn_dict = chess_utils.parsed_game_to_dict(parsed)
+        pgn_id = await save_pgn_to_db(pgn_dict) or pgn_dict["id"]
+        is_new = await chess_utils.save_analysis(
+            analysis,
+            pgn_id,
+            critical_moments,
+            pgn_dict.get("Moves", {}),
+            commentary_status=CommentaryStatus.PENDING,
+            game_hash=parsed.game_hash,
+        )
+        if is_new:
+            background_tasks.add_task(
+                generate_commentary,
+                pgn_id,
+                parsed,
+                analysis,
+                critical_moments,
+                commentary_mode,
+            )
+        return {"pgn_id": pgn_id, "commentary_status": CommentaryStatus.PENDING}
+
+    return sse_response(analysis_events(parsed, workers, on_done=save))
+
+
+async def stored_analysis_events(document: dict):
+    for ply, (best_move, score) in enumerate(document["analysis"], start=1):
+        yield sse_event("ply", {"ply": ply, "best_move": best_move, "eval": score})
+    yield sse_event("critical_moments", document["critical_moments"])
+    yield sse_event(
+        "summary",
+        {
+            "plies": len(document["analysis"]),
+            "critical_moments": len(document["critical_moments"]),
+            "pgn_id": document["pgn_id"],
+            "commentary_status": document.get(
+                "commentary_status", CommentaryStatus.DONE
+            ),
+        },
+    )
+
+
+async def get_request_fens(request: BoardsRequest) -> list:
+    if request.pgn_id:
+        fens = await chess_utils.get_fen_index(request.pgn_id)
+        if fens is None:
+            raise HTTPException(status_code=404, detail="PGN not found")
+        return fens
+
+    parsed = pgn_utils.parse_pgn(request.pgn_string)
+    if not parsed.is_valid:
+        raise HTTPException(status_code=400, detail=parsed.errors[0])
+    return [parsed.start_fen, *parsed.fens]
+
+
+async def get_boards(request: BoardsRequest):
+    """
+    Returns the board state, and optionally the known evaluation, of many plies of
+    one game in a single response. The game is parsed or looked up once.
+
+    Parameters:
+    - request (BoardsRequest): The game and the plies to return.
+
+    Returns:
+    - A JSON response with one board per requested ply.
+    """
+    fens = await get_request_fens(request)
+    try:
+        plies = chess_utils.select_plies(
+            len(fens), request.plies, request.start, request.end
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    boards = [{"ply": ply, "fen": fens[ply]} for ply in plies]
+    if request.include_evals:
+        evals = await chess_utils.get_cached_evals(
+            [board["fen"] for board in boards], plies, request.pgn_id
+        )
+        for board, evaluation in zip(boards, evals):
+            board["eval"] = evaluation
+    return {"pgn_id": request.pgn_id, "boards": boards}
+
+
 async def get_best_move(pgn_string: str, move_no: int):
-    pgn_io = io.StringIO(pgn_string)
-    game = chess.pgn.read_game(pgn_io)
+    parsed = pgn_utils.parse_pgn(pgn_string)
+    if not parsed.is_valid:
+        raise HTTPException(status_code=400, detail=parsed.errors[0])
 
-    best_move, score = chess_utils.get_best_move(game, move_no)
+    best_move, score = await chess_utils.get_best_move(parsed, move_no)
 
     return {"best_move": best_move, "evaluation": score}
 
@@ -174,3 +866,11 @@ async def get_analysis_by_id(pgn_id: str):
     document = await chess_utils.fetch_analysis(pgn_id=pgn_id)
     document.pop("_id", None)
     return document
+
+
+async def get_eval_cache_stats():
+    return await EvalCache.stats()
+
+
+async def get_commentary_cache_stats():
+    return {**CommentaryCache.stats(), "positions": PositionCommentaryCache.stats()}
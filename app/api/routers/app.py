@@ -1,10 +1,29 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, BackgroundTasks, Depends, Query, Request
 from fastapi_jwt_auth import AuthJWT
 
 from app.api.controllers import app
+from app.api.utils import request_utils
+from app.models.analysis import AnalysisMode, CommentaryMode
+from app.models.board import BoardsRequest
 
 router = APIRouter()
 
+# The PGN body read by request_utils.pgn_string_param, for the docs
+PGN_BODY = {
+    "requestBody": {
+        "content": {
+            "text/plain": {"schema": {"type": "string"}},
+            "application/json": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"pgn_string": {"type": "string"}},
+                    "required": ["pgn_string"],
+                }
+            },
+        }
+    }
+}
+
 
 @router.get("/delete_this_route")
 async def delete_this_route(
@@ -14,9 +33,92 @@ async def delete_this_route(
     return res
 
 
-@router.post("/pgn")
-async def analyse_pgn(pgn_string: str):
-    return await app.analyse_pgn(pgn_string=pgn_string)
+@router.post("/pgn", openapi_extra=PGN_BODY)
+async def analyse_pgn(
+    background_tasks: BackgroundTasks,
+    request: Request,
+    pgn_string: str = Depends(request_utils.pgn_string_param),
+    workers: int = Query(None, ge=1),
+    commentary_mode: CommentaryMode = None,
+):
+    return await app.analyse_pgn(
+        pgn_string=pgn_string,
+        background_tasks=background_tasks,
+        request=request,
+        workers=workers,
+        commentary_mode=commentary_mode,
+    )
+
+
+@router.post("/pgn/upload")
+async def upload_pgn_file(
+    request: Request,
+    analyse: bool = False,
+    workers: int = Query(None, ge=1),
+    commentary_mode: CommentaryMode = None,
+):
+    return await app.upload_pgn_file(
+        request=request,
+        analyse=analyse,
+        workers=workers,
+        commentary_mode=commentary_mode,
+    )
+
+
+@router.get("/pgn/stream")
+async def stream_analysis(
+    pgn_string: str,
+    background_tasks: BackgroundTasks,
+    workers: int = Query(None, ge=1),
+    commentary_mode: CommentaryMode = None,
+):
+    return await app.stream_analysis(
+        pgn_string=pgn_string,
+        background_tasks=background_tasks,
+        workers=workers,
+        commentary_mode=commentary_mode,
+    )
+
+
+@router.post("/pgn/stream", openapi_extra=PGN_BODY)
+async def post_stream_analysis(
+    background_tasks: BackgroundTasks,
+    pgn_string: str = Depends(request_utils.pgn_string_param),
+    workers: int = Query(None, ge=1),
+    commentary_mode: CommentaryMode = None,
+):
+    return await app.stream_analysis(
+        pgn_string=pgn_string,
+        background_tasks=background_tasks,
+        workers=workers,
+        commentary_mode=commentary_mode,
+    )
+
+
+@router.post("/jobs", status_code=202, openapi_extra=PGN_BODY)
+async def submit_analysis_job(
+    pgn_string: str = Depends(request_utils.pgn_string_param),
+    workers: int = Query(None, ge=1),
+    commentary_mode: CommentaryMode = None,
+):
+    return await app.submit_analysis_job(
+        pgn_string=pgn_string, workers=workers, commentary_mode=commentary_mode
+    )
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    return await app.get_job(job_id=job_id)
+
+
+@router.get("/commentary")
+async def get_commentary(pgn_id: str):
+    return await app.get_commentary(pgn_id=pgn_id)
+
+
+@router.get("/commentary/stream")
+async def stream_commentary(pgn_id: str):
+    return await app.stream_commentary(pgn_id=pgn_id)
 
 
 @router.get("/get_analysis_feed")
@@ -29,16 +131,96 @@ async def get_analysis_by_id(pgn_id: str):
     return await app.get_analysis_by_id(pgn_id=pgn_id)
 
 
+@router.get("/board")
+async def get_board_by_id(pgn_id: str, ply: int):
+    return await app.get_board_by_id(pgn_id=pgn_id, ply=ply)
+
+
+@router.post("/boards")
+async def get_boards(request: BoardsRequest):
+    return await app.get_boards(request=request)
+
+
 @router.get("/board/{move_no}")
 async def get_board_at_move(move_no: int, pgn_string: str):
     return await app.get_board_at_move(move_no=move_no, pgn_string=pgn_string)
 
 
+@router.post("/board/{move_no}", openapi_extra=PGN_BODY)
+async def post_board_at_move(
+    move_no: int, pgn_string: str = Depends(request_utils.pgn_string_param)
+):
+    return await app.get_board_at_move(move_no=move_no, pgn_string=pgn_string)
+
+
 @router.get("/get_best_move")
 async def get_best_move(pgn_string: str, move_no: int):
     return await app.get_best_move(pgn_string=pgn_string, move_no=move_no)
 
 
+@router.post("/get_best_move", openapi_extra=PGN_BODY)
+async def post_best_move(
+    move_no: int, pgn_string: str = Depends(request_utils.pgn_string_param)
+):
+    return await app.get_best_move(pgn_string=pgn_string, move_no=move_no)
+
+
 @router.get("/get_best_moves")
-async def getBestMoves(pgn_string: str):
-    return await app.get_best_moves(pgn_string=pgn_string)
+async def getBestMoves(
+    pgn_string: str,
+    request: Request,
+    workers: int = Query(None, ge=1),
+    analysis_mode: AnalysisMode = None,
+    time_budget: float = Query(None, gt=0),
+    node_budget: int = Query(None, ge=1),
+):
+    return await app.get_best_moves(
+        pgn_string=pgn_string,
+        request=request,
+        workers=workers,
+        analysis_mode=analysis_mode,
+        time_budget=time_budget,
+        node_budget=node_budget,
+    )
+
+
+@router.post("/get_best_moves", openapi_extra=PGN_BODY)
+async def postBestMoves(
+    request: Request,
+    pgn_string: str = Depends(request_utils.pgn_string_param),
+    workers: int = Query(None, ge=1),
+    analysis_mode: AnalysisMode = None,
+    time_budget: float = Query(None, gt=0),
+    node_budget: int = Query(None, ge=1),
+):
+    return await app.get_best_moves(
+        pgn_string=pgn_string,
+        request=request,
+        workers=workers,
+        analysis_mode=analysis_mode,
+        time_budget=time_budget,
+        node_budget=node_budget,
+    )
+
+
+@router.get("/get_best_moves/stream")
+async def streamBestMoves(pgn_string: str, workers: int = Query(None, ge=1)):
+    return await app.stream_best_moves(pgn_string=pgn_string, workers=workers)
+
+
+@router.post("/get_best_moves/stream", openapi_extra=PGN_BODY)
+async def postStreamBestMoves(
+    pgn_string: str = Depends(request_utils.pgn_string_param),
+    workers: int = Query(None, ge=1),
+):
+    return await app.stream_best_moves(pgn_string=pgn_string, workers=workers)
+
+
+@router.get("/eval_cache_stats")
+async def get_eval_cache_stats():
+    return await app.get_eval_cache_stats()
+
+
+@router.get("/commentary_cache_stats")
+async def get_commentary_cache_stats():
+    return await app.get_commentary_cache_stats()
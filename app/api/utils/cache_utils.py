@@ -0,0 +1,420 @@
+import asyncio
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import chess
+import chess.polyglot
+
+from app.core.config import CacheConfig
+from app.core.mongo_config import MongoConfig
+from app.db.mongo_client import ZuMongoClient
+from app.db.redis_client import ZuRedisClient
+
+
+def with_hit_rate(counters: Dict) -> Dict:
+    total = counters["hits"] + counters["misses"]
+    counters["hit_rate"] = counters["hits"] / total if total else 0.0
+    return counters
+
+
+class EvalCache(object):
+    """Position evaluation cache backed by Redis.
+
+    Entries are keyed by the Zobrist hash of the position and the engine name,
+    and hold the result of the deepest search seen so far: a store never
+    replaces an entry searched deeper. A lookup is a hit when the cached depth
+    is at least the requested depth. Entries expire after
+    ``CacheConfig.EVAL_CACHE_TTL`` seconds; Redis' own eviction policy applies
+    on top of that.
+
+    Hits and misses are counted per process and, when Redis is up, in shared
+    counters so the hit rate covers every worker.
+    """
+
+    hits: int = 0
+    misses: int = 0
+    log: logging.Logger = logging.getLogger(__name__)
+
+    # ARGV holds the depth and entry of every key, then the TTL. Depths are
+    # compared on the server, so concurrent stores keep the deepest search.
+    SET_IF_DEEPER_SCRIPT: str = """
+        local ttl = ARGV[#ARGV]
+        for index, key in ipairs(KEYS) do
+            local depth = tonumber(ARGV[2 * index - 1])
+            local stored = redis.call("GET", key)
+            local stored_depth = 0
+            if stored then
+                local ok, entry = pcall(cjson.decode, stored)
+                if ok and type(entry) == "table" then
+                    stored_depth = tonumber(entry["depth"]) or 0
+                end
+            end
+            if stored_depth <= depth then
+                redis.call("SET", key, ARGV[2 * index], "EX", ttl)
+            end
+        end
+    """
+
+    @classmethod
+    def enabled(cls) -> bool:
+        return CacheConfig.EVAL_CACHE_ENABLED and ZuRedisClient.redis_client is not None
+
+    @classmethod
+    def key(cls, zobrist_hash: int, engine_id: str) -> str:
+        engine_id = engine_id.replace(" ", "_") or "engine"
+        return f"{CacheConfig.EVAL_CACHE_PREFIX}:{engine_id}:{zobrist_hash:016x}"
+
+    @classmethod
+    async def _count(cls, hits: int, misses: int):
+        cls.hits += hits
+        cls.misses += misses
+        amounts = {
+            f"{CacheConfig.EVAL_CACHE_PREFIX}:hits": hits,
+            f"{CacheConfig.EVAL_CACHE_PREFIX}:misses": misses,
+        }
+        try:
+            # Both counters in one round trip
+            await ZuRedisClient.incrby_many(
+                {key: amount for key, amount in amounts.items() if amount}
+            )
+        except Exception as e:
+            cls.log.warning(f"Failed to update eval cache counters: {str(e)}")
+
+    @classmethod
+    async def get_many(cls, keys: List[str], min_depth: int) -> List[Optional[Dict]]:
+        """Fetch cached evaluations searched at least `min_depth` plies deep.
+
+        Args:
+            keys (list): Cache keys built with `key`.
+            min_depth (int): Requested search depth.
+
+        Returns:
+            list: Cached entry for every hit, None for every miss.
+
+        """
+        if not keys or not cls.enabled():
+            return [None] * len(keys)
+        try:
+            values = await ZuRedisClient.mget(keys)
+        except Exception as e:
+            cls.log.warning(f"Eval cache lookup failed: {str(e)}")
+            return [None] * len(keys)
+
+        entries = []
+        for value in values:
+            entry = json.loads(value) if value else None
+            if entry is not None and (entry.get("depth") or 0) < min_depth:
+                entry = None
+            entries.append(entry)
+
+        hits = sum(entry is not None for entry in entries)
+        await cls._count(hits, len(entries) - hits)
+        return entries
+
+    @classmethod
+    async def set_many(cls, entries: Dict[str, Dict]):
+        """Store evaluations, keyed by cache key, except where the cached
+        entry was searched deeper.
+
+        Args:
+            entries (dict): Serialized position analyses keyed by cache key.
+
+        """
+        if not entries or not cls.enabled():
+            return
+        args = []
+        for entry in entries.values():
+            args += [entry.get("depth") or 0, json.dumps(entry)]
+        try:
+            await ZuRedisClient.eval(
+                cls.SET_IF_DEEPER_SCRIPT,
+                list(entries),
+                args + [CacheConfig.EVAL_CACHE_TTL],
+            )
+        except Exception as e:
+            cls.log.warning(f"Eval cache store failed: {str(e)}")
+
+    @classmethod
+    async def stats(cls) -> Dict:
+        """Hit and miss counters of this process and of all workers."""
+        shared = {}
+        if cls.enabled():
+            try:
+                values = await ZuRedisClient.mget(
+                    [
+                        f"{CacheConfig.EVAL_CACHE_PREFIX}:hits",
+                        f"{CacheConfig.EVAL_CACHE_PREFIX}:misses",
+                    ]
+                )
+                shared = {
+                    "hits": int(values[0] or 0),
+                    "misses": int(values[1] or 0),
+                }
+            except Exception as e:
+                cls.log.warning(f"Failed to read eval cache counters: {str(e)}")
+
+        return {
+            "enabled": cls.enabled(),
+            "process": with_hit_rate({"hits": cls.hits, "misses": cls.misses}),
+            "shared": with_hit_rate(shared) if shared else None,
+        }
+
+
+class CommentaryCache(object):
+    """LLM commentary cache backed by Redis, with Mongo as a fallback.
+
+    Entries are keyed by a hash of the normalised prompt inputs, the model and
+    the prompt version, so changing either of the last two starts a new cache.
+    Both stores expire entries after ``CacheConfig.COMMENTARY_CACHE_TTL``
+    seconds, Mongo through a TTL index. Commentaries larger than
+    ``CacheConfig.COMMENTARY_CACHE_MAX_BYTES`` are not cached.
+
+    A Mongo hit is copied back to Redis. Hits are counted per store.
+    """
+
+    collection: str = "commentary_cache"
+    hits: int = 0
+    mongo_hits: int = 0
+    misses: int = 0
+    log: logging.Logger = logging.getLogger(__name__)
+
+    @classmethod
+    def enabled(cls) -> bool:
+        return CacheConfig.COMMENTARY_CACHE_ENABLED
+
+    @classmethod
+    def key(cls, model: str, prompt_version: str, *inputs) -> str:
+        """Build the cache key of a completion.
+
+        Args:
+            model (str): Model the completion is requested from.
+            prompt_version (str): Version of the prompt template.
+            *inputs: JSON serializable prompt inputs. Whitespace runs in strings
+                are collapsed before hashing.
+
+        """
+        normalised = json.dumps(
+            [model, prompt_version, *map(normalise_prompt_input, inputs)],
+            sort_keys=True,
+            separators=(",", ":"),
+            default=str,
+        )
+        digest = hashlib.sha256(normalised.encode()).hexdigest()
+        return f"{CacheConfig.COMMENTARY_CACHE_PREFIX}:{digest}"
+
+    @classmethod
+    async def ensure_indexes(cls):
+        for keys, options in (
+            ("key", {"unique": True}),
+            ("expires_at", {"expireAfterSeconds": 0}),
+        ):
+            await ZuMongoClient.call_func(
+                "create_index",
+                db=MongoConfig.MONGO_PROD_DATABASE,
+                col=cls.collection,
+                keys=keys,
+                **options,
+            )
+
+    @classmethod
+    async def _get_redis(cls, key: str) -> Optional[Dict]:
+        if ZuRedisClient.redis_client is None:
+            return None
+        try:
+            value = await ZuRedisClient.get(key)
+        except Exception as e:
+            cls.log.warning(f"Commentary cache lookup failed: {str(e)}")
+            return None
+        return json.loads(value) if value else None
+
+    @classmethod
+    async def _get_mongo(cls, key: str) -> Optional[Dict]:
+        try:
+            document = await ZuMongoClient.find_one(
+                col=cls.collection,
+                filter_data={"key": key, "expires_at": {"$gt": datetime.utcnow()}},
+                project={"_id": 0, "commentary": 1},
+            )
+        except Exception as e:
+            cls.log.warning(f"Commentary cache fallback lookup failed: {str(e)}")
+            return None
+        return document["commentary"] if document else None
+
+    @classmethod
+    async def get(cls, key: str) -> Optional[Dict]:
+        """Fetch a cached commentary from Redis, then Mongo.
+
+        Returns:
+            dict: The cached commentary, None on a miss.
+
+        """
+        if not cls.enabled():
+            return None
+        commentary = await cls._get_redis(key)
+        if commentary is not None:
+            cls.hits += 1
+            return commentary
+        commentary = await cls._get_mongo(key)
+        if commentary is not None:
+            cls.mongo_hits += 1
+            await cls._set_redis(key, json.dumps(commentary))
+            return commentary
+        cls.misses += 1
+        return None
+
+    @classmethod
+    async def _set_redis(cls, key: str, value: str):
+        if ZuRedisClient.redis_client is None:
+            return
+        try:
+            await ZuRedisClient.set(key, value, ext=CacheConfig.COMMENTARY_CACHE_TTL)
+        except Exception as e:
+            cls.log.warning(f"Commentary cache store failed: {str(e)}")
+
+    @classmethod
+    async def set(cls, key: str, commentary: Dict):
+        """Store a commentary in Redis and Mongo, unless it is empty or too large."""
+        value = json.dumps(commentary)
+        too_large = len(value) > CacheConfig.COMMENTARY_CACHE_MAX_BYTES
+        if not cls.enabled() or not commentary or too_large:
+            return
+        await cls._set_redis(key, value)
+        expires_at = datetime.utcnow() + timedelta(
+            seconds=CacheConfig.COMMENTARY_CACHE_TTL
+        )
+        try:
+            await ZuMongoClient.update_one(
+                col=cls.collection,
+                filter_data={"key": key},
+                update_data={
+                    "$set": {"commentary": commentary, "expires_at": expires_at}
+                },
+                upsert=True,
+                handle_exception=False,
+            )
+        except Exception as e:
+            cls.log.warning(f"Commentary cache fallback store failed: {str(e)}")
+
+    @classmethod
+    def stats(cls) -> Dict:
+        """Hit and miss counters of this process."""
+        counters = with_hit_rate(
+            {"hits": cls.hits + cls.mongo_hits, "misses": cls.misses}
+        )
+        return {
+            "enabled": cls.enabled(),
+            "redis_hits": cls.hits,
+            "mongo_hits": cls.mongo_hits,
+            **counters,
+        }
+
+
+class PositionCommentaryCache(object):
+    """Commentary of single opening moves, reused across games.
+
+    Entries are keyed by the Zobrist hash of the position a move was played
+    from, the move in UCI, the model and the prompt version, and hold the
+    text the model wrote for that move. Only moves within the first
+    ``CacheConfig.POSITION_COMMENTARY_PLIES`` plies that are not critical
+    moments are stored: their explanation does not depend on the rest of
+    the game. Entries expire after ``CacheConfig.POSITION_COMMENTARY_TTL``
+    seconds.
+    """
+
+    hits: int = 0
+    misses: int = 0
+    log: logging.Logger = logging.getLogger(__name__)
+
+    @classmethod
+    def enabled(cls) -> bool:
+        return (
+            CacheConfig.POSITION_COMMENTARY_ENABLED
+            and ZuRedisClient.redis_client is not None
+        )
+
+    @classmethod
+    def key(cls, fen: str, move: str, model: str, prompt_version: str) -> str:
+        zobrist_hash = chess.polyglot.zobrist_hash(chess.Board(fen))
+        return (
+            f"{CacheConfig.POSITION_COMMENTARY_PREFIX}:{model}:{prompt_version}:"
+            f"{zobrist_hash:016x}:{move}"
+        )
+
+    @classmethod
+    async def get_many(cls, keys: List[str]) -> List[Optional[str]]:
+        """Fetch the stored commentary of every key, None where there is none."""
+        if not keys or not cls.enabled():
+            return [None] * len(keys)
+        try:
+            values = await ZuRedisClient.mget(keys)
+        except Exception as e:
+            cls.log.warning(f"Position commentary lookup failed: {str(e)}")
+            return [None] * len(keys)
+
+        texts = [
+            value.decode() if isinstance(value, bytes) else value or None
+            for value in values
+        ]
+        hits = sum(text is not None for text in texts)
+        cls.hits += hits
+        cls.misses += len(texts) - hits
+        return texts
+
+    @classmethod
+    async def set_many(cls, entries: Dict[str, str]):
+        """Store commentaries, keyed by cache key."""
+        if not entries or not cls.enabled():
+            return
+        try:
+            await asyncio.gather(
+                *(
+                    ZuRedisClient.set(
+                        key, text, ext=CacheConfig.POSITION_COMMENTARY_TTL
+                    )
+                    for key, text in entries.items()
+                )
+            )
+        except Exception as e:
+            cls.log.warning(f"Position commentary store failed: {str(e)}")
+
+    @classmethod
+    def stats(cls) -> Dict:
+        """Hit and miss counters of this process."""
+        return {
+            "enabled": cls.enabled(),
+            **with_hit_rate({"hits": cls.hits, "misses": cls.misses}),
+        }
+
+
+def normalise_prompt_input(value):
+    if isinstance(value, str):
+        return " ".join(value.split())
+    return value
+
+
+class FenIndexLRU(object):
+    """In-process LRU of per-ply FEN arrays, keyed by pgn id.
+
+    Holds the ``CacheConfig.FEN_INDEX_LRU_SIZE`` most recently used games so
+    scrubbing through a game does not hit Mongo for every ply.
+    """
+
+    entries: "OrderedDict[str, List[str]]" = OrderedDict()
+
+    @classmethod
+    def get(cls, pgn_id: str) -> Optional[List[str]]:
+        fens = cls.entries.get(pgn_id)
+        if fens is not None:
+            cls.entries.move_to_end(pgn_id)
+        return fens
+
+    @classmethod
+    def put(cls, pgn_id: str, fens: List[str]):
+        cls.entries[pgn_id] = fens
+        cls.entries.move_to_end(pgn_id)
+        while len(cls.entries) > CacheConfig.FEN_INDEX_LRU_SIZE:
+            cls.entries.popitem(last=False)
@@ -1,13 +1,25 @@
+import asyncio
 import re
+import time
 import uuid
-from typing import List, Tuple
+from typing import AsyncIterator, Callable, Iterator, List, NamedTuple, Optional, Tuple
 
 import chess
 import chess.engine
 import chess.pgn
+import chess.polyglot
 from fastapi import HTTPException
+from pymongo import errors
 
+from app.api.utils import pgn_utils
+from app.api.utils.cache_utils import EvalCache, FenIndexLRU
+from app.api.utils.pgn_utils import ParsedGame
+from app.core.config import StockfishConfig
+from app.core.mongo_config import MongoConfig
 from app.db.mongo_client import ZuMongoClient
+from app.engine.engine_pool import EnginePriority, ZuEnginePool
+from app.models.analysis import AnalysisMode, CommentaryStatus
+from app.models.board import MAX_BOARD_PLIES
 
 
 async def validate_pgn_format(pgn_string: str) -> bool:
@@ -20,84 +32,32 @@ async def validate_pgn_format(pgn_string: str) -> bool:
     Returns:
         bool: True if the PGN format is correct, False otherwise.
     """
+    return pgn_utils.is_valid_pgn(pgn_string)
 
-    # Define a regular expression pattern for PGN format validation
-    # print(pgn_string)
-    pgn_pattern = r"""
-        (\[Event\s+".*"\]\s*)?
-        (\[Site\s+".*"\]\s*)?
-        (\[Date\s+"\d{4}\.\d{2}\.\d{2}"\]\s*)?
-        (\[Round\s+".*"\]\s*)?
-        (\[White\s+".*"\]\s*)?
-        (\[Black\s+".*"\]\s*)?
-        (\[Result\s+".*"\]\s*)?
-        (\[CurrentPosition\s+".*"\]\s*)?
-        (\[Timezone\s+".*"\]\s*)?
-        (\[ECO\s+".*"\]\s*)?
-        (\[ECOUrl\s+".*"\]\s*)?
-        (\[UTCDate\s+"\d{4}\.\d{2}\.\d{2}"\]\s*)?
-        (\[UTCTime\s+"\d{2}:\d{2}:\d{2}"\]\s*)?
-        (\[WhiteElo\s+"\d*"\]\s*)?
-        (\[BlackElo\s+"\d*"\]\s*)?
-        (\[TimeControl\s+".*"\]\s*)?
-        (\[Termination\s+".*"\]\s*)?
-        (\[StartTime\s+".*"\]\s*)?
-        (\[EndDate\s+"\d{4}\.\d{2}\.\d{2}"\]\s*)?
-        (\[EndTime\s+".*"\]\s*)?
-        (\[Link\s+".*"\]\s*)?
-        (\[WhiteUrl\s+".*"\]\s*)?
-        (\[WhiteCountry\s+".*"\]\s*)?
-        (\[WhiteTitle\s+".*"\]\s*)?
-        (\[BlackUrl\s+".*"\]\s*)?
-        (\[BlackCountry\s+".*"\]\s*)?
-        (\[BlackTitle\s+".*"\]\s*)?
-        (\d+\.\s+([a-zA-Z0-9+]+(\s+[a-zA-Z0-9+]+)?\s*)+)
-    """
-
-    # Use VERBOSE flag to allow multi-line regex for better readability
-    match = re.match(pgn_pattern, pgn_string, re.VERBOSE)
-
-    return bool(match)
-
-
-def pgn_to_dict(pgn_string: str) -> dict:
-    """
-    Converts a PGN string to a dictionary with key-value pairs.
+
+# Fields of a 'pgn_data' document that are not PGN headers
+PGN_DOCUMENT_FIELDS = ("_id", "id", "game_hash", "Moves", "fens")
+# Mongo error code of a unique index violation
+DUPLICATE_KEY_ERROR = 11000
+
+
+def parsed_game_to_dict(parsed: ParsedGame) -> dict:
+    """
+    Converts a parsed game to the document stored in the 'pgn_data' collection.
 
     Args:
-        pgn_string (str): The PGN string to convert.
+        parsed (ParsedGame): The parsed game.
 
     Returns:
-        dict: A dictionary representation of the PGN string.
-    """
-    pgn_dict = {}
-    pgn_dict["id"] = generate_hex_uuid()
-    # Initialize a list to accumulate move data
-    moves_list = []
-    # Iterate over the string character by character
-    i = 0
-    while i < len(pgn_string):
-        # Check if the current part of the string contains PGN metadata
-        if pgn_string[i] == "[":
-            end_bracket_index = pgn_string.find("]", i)
-            line = pgn_string[i : end_bracket_index + 1]
-            # Extract the key and value
-            key = line.split(" ")[0][1:]
-            value = line.split('"')[1]
-            pgn_dict[key] = value
-            i = end_bracket_index + 1
-        # Accumulate move data if not part of metadata
-        else:
-            move_start = i
-            while i < len(pgn_string) and pgn_string[i] != "[":
-                i += 1
-            move_data = pgn_string[move_start:i].strip()
-            if move_data:
-                moves_list.append(move_data)
-            # Skip to the next character without incrementing i as it's already at the start of the next segment or end of string
-    # Add accumulated moves data to the dictionary under a special key, if any
-    if moves_list:
-        pgn_dict["Moves"] = moves_list
+        dict: The headers, a new unique 'id', the content address 'game_hash', the SAN
+        moves keyed by ply under 'Moves' and the FEN after every ply under 'fens',
+        index 0 being the starting position.
+    """
+    pgn_dict = {"id": generate_hex_uuid(), "game_hash": parsed.game_hash}
+    pgn_dict.update(parsed.headers)
+    if parsed.sans:
+        pgn_dict["Moves"] = parsed.moves_dict()
+    pgn_dict["fens"] = [parsed.start_fen, *parsed.fens]
     return pgn_dict
 
 
@@ -113,7 +73,8 @@ def generate_hex_uuid():
 
 def moves_to_dict(moves_str: str) -> dict:
     """
-    Converts a string of moves separated by move identifiers into a dictionary with move numbers as keys.
+    Converts a string of moves separated by move identifiers into a dictionary
+    with move numbers as keys.
 
     Args:
         moves_str (str): A string of moves separated by identifiers like "1.", "2.", ...
@@ -137,23 +98,158 @@ def moves_to_dict(moves_str: str) -> dict:
     return moves_dict
 
 
-async def save_pgn_to_db(pgn_dict):
+async def ensure_indexes():
+    """
+    Creates the unique 'game_hash' indexes that deduplicate games and analyses.
+    Documents saved before the hash existed are left out of the index.
+    """
+    for col in ("pgn_data", "analysis"):
+        await ZuMongoClient.call_func(
+            "create_index",
+            db=MongoConfig.MONGO_PROD_DATABASE,
+            col=col,
+            keys="game_hash",
+            unique=True,
+            partialFilterExpression={"game_hash": {"$type": "string"}},
+        )
+
+
+async def save_pgn_to_db(pgn_dict) -> Optional[str]:
     """
     Saves the PGN data to the MongoDB database.
 
     Args:
         pgn_dict (dict): A dictionary containing the PGN data.
+
+    Returns:
+        str: The id of the stored game, which is the id of the game saved earlier
+        when this one is a duplicate. None if it could not be saved.
     """
-    # Assuming there's a collection specifically for storing PGN data
-    # and 'pgn_dict' contains all necessary data including a unique 'id'
     try:
         # Insert the PGN data into the 'pgn_data' collection
         await ZuMongoClient.insert_one(
             col="pgn_data", insert_data=pgn_dict, handle_exception=False
         )
+        FenIndexLRU.put(pgn_dict["id"], pgn_dict["fens"])
         print("PGN data saved successfully.")
+        return pgn_dict["id"]
+    except errors.DuplicateKeyError:
+        document = await fetch_pgn_by_hash(pgn_dict["game_hash"])
+        return document["id"] if document else None
     except Exception as e:
         print(f"Failed to save PGN data to DB. Error: {e}")
+        return None
+
+
+async def save_pgns_to_db(pgn_dicts: List[dict]) -> List[int]:
+    """
+    Saves a batch of games to the 'pgn_data' collection in one unordered
+    insert, skipping the ones already stored.
+
+    Args:
+        pgn_dicts (List[dict]): The games, as built by `parsed_game_to_dict`.
+
+    Returns:
+        List[int]: Indexes in `pgn_dicts` of the games that were saved.
+
+    Raises:
+        pymongo.errors.BulkWriteError: If a game failed for another reason than
+        being a duplicate.
+    """
+    try:
+        await ZuMongoClient.insert_many(
+            col="pgn_data", insert_data=pgn_dicts, ordered=False, handle_exception=False
+        )
+        return list(range(len(pgn_dicts)))
+    except errors.BulkWriteError as e:
+        failed = e.details.get("writeErrors", [])
+        if any(error["code"] != DUPLICATE_KEY_ERROR for error in failed):
+            raise
+        duplicates = {error["index"] for error in failed}
+        return [index for index in range(len(pgn_dicts)) if index not in duplicates]
+
+
+async def fetch_pgn(pgn_id: str) -> Optional[dict]:
+    return await ZuMongoClient.find_one(
+        col="pgn_data", filter_data={"id": pgn_id}, project={"_id": 0, "fens": 0}
+    )
+
+
+def document_to_pgn(document: dict) -> str:
+    """
+    Rebuilds the PGN of a game from its 'pgn_data' document: its headers and
+    mainline moves, without comments or variations.
+    """
+    # Header values are stored as read from the PGN, escapes included
+    headers = "\n".join(
+        f'[{name} "{value}"]'
+        for name, value in document.items()
+        if name not in PGN_DOCUMENT_FIELDS
+    )
+    moves = document.get("Moves") or {}
+    movetext = " ".join(
+        f"{(int(ply) + 1) // 2}. {moves[ply]}" if int(ply) % 2 else moves[ply]
+        for ply in sorted(moves, key=int)
+    )
+    return f"{headers}\n\n{movetext}" if headers else movetext
+
+
+async def fetch_pgn_by_hash(game_hash: str) -> Optional[dict]:
+    # The FEN index is served per ply by get_fen_index, not with the game
+    return await ZuMongoClient.find_one(
+        col="pgn_data",
+        filter_data={"game_hash": game_hash},
+        project={"_id": 0, "fens": 0},
+    )
+
+
+async def backfill_fen_index(document: dict) -> List[str]:
+    """
+    Builds and stores the FEN index of a game saved before 'fens' existed, by
+    replaying its stored SAN moves once. Older documents also hold the result
+    and stray comment text as moves, so the replay stops at the first token
+    that is not a legal move and the index covers the moves before it.
+    """
+    board = chess.Board(document.get("FEN", chess.STARTING_FEN))
+    fens = [board.fen()]
+    moves = document.get("Moves") or {}
+    for ply in sorted(moves, key=int):
+        try:
+            board.push_san(moves[ply])
+        except ValueError:
+            break
+        fens.append(board.fen())
+    await ZuMongoClient.update_one(
+        col="pgn_data",
+        filter_data={"id": document["id"]},
+        update_data={"$set": {"fens": fens}},
+    )
+    return fens
+
+
+async def get_fen_index(pgn_id: str) -> Optional[List[str]]:
+    """
+    Returns the FEN after every ply of a stored game, index 0 being the starting
+    position, from the in-process LRU or the 'pgn_data' collection.
+
+    Args:
+        pgn_id (str): The id of the stored game.
+
+    Returns:
+        List[str]: The FEN index, or None if there is no such game.
+    """
+    fens = FenIndexLRU.get(pgn_id)
+    if fens is None:
+        document = await ZuMongoClient.find_one(
+            col="pgn_data",
+            filter_data={"id": pgn_id},
+            project={"id": 1, "fens": 1, "Moves": 1, "FEN": 1},
+        )
+        if document is None:
+            return None
+        fens = document.get("fens") or await backfill_fen_index(document)
+        FenIndexLRU.put(pgn_id, fens)
+    return fens
 
 
 async def save_analysis(
@@ -161,15 +257,23 @@ async def save_analysis(
     pgn_id: str,
     critical_moments: dict,
     moves: dict,
-    openai_analysis: dict,
-):
+    openai_analysis: dict = None,
+    commentary_status: CommentaryStatus = CommentaryStatus.DONE,
+    game_hash: str = None,
+) -> bool:
+    """
+    Saves the analysis of a game. Returns False if it was not saved, including
+    when an analysis of the same game already exists.
+    """
     analysis_dict = {
         "id": generate_hex_uuid(),
         "pgn_id": pgn_id,
+        "game_hash": game_hash,
         "moves": moves,
         "critical_moments": critical_moments,
         "analysis": analysis,
         "openai_analysis": openai_analysis,
+        "commentary_status": commentary_status.value,
     }
 
     try:
@@ -177,39 +281,172 @@ async def save_analysis(
             col="analysis", insert_data=analysis_dict, handle_exception=False
         )
         print("Analysis saved successfully.")
+        return True
+    except errors.DuplicateKeyError:
+        print(f"Analysis of game {game_hash} already saved.")
     except Exception as e:
         print(f"Failed to save analysis to DB. Error: {e}")
+    return False
+
+
+async def save_commentary(
+    pgn_id: str,
+    commentary_status: CommentaryStatus,
+    openai_analysis: dict = None,
+    error: str = None,
+):
+    """
+    Records the outcome of the commentary generated after a game's analysis
+    was saved.
+
+    Parameters:
+    - pgn_id (str): The id of the analysed game.
+    - commentary_status (CommentaryStatus): DONE, PARTIAL or FAILED.
+    - openai_analysis (dict, optional): The commentary, keyed by ply.
+    - error (str, optional): Why the commentary failed or is partial.
+    """
+    await ZuMongoClient.update_one(
+        col="analysis",
+        filter_data={"pgn_id": pgn_id},
+        update_data={
+            "$set": {
+                "openai_analysis": openai_analysis,
+                "commentary_status": commentary_status.value,
+                "commentary_error": error,
+            }
+        },
+    )
+
+
+class PositionAnalysis(NamedTuple):
+    """
+    Result of a single engine search on one position.
+
+    Attributes:
+    - best_move (str): Best move in UCI format, None if the game is over.
+    - score (chess.engine.PovScore): Evaluation of the position.
+    - pv (List[str]): Principal variation in UCI format.
+    - depth (int): Depth reached by the search.
+    - nodes (int): Nodes searched.
+    """
+
+    best_move: Optional[str]
+    score: Optional[chess.engine.PovScore]
+    pv: List[str]
+    depth: Optional[int]
+    nodes: Optional[int]
+
+
+def position_to_dict(result: PositionAnalysis) -> dict:
+    """
+    Serializes a PositionAnalysis, with the score from White's point of view.
+    """
+    score = result.score.white() if result.score is not None else None
+    return {
+        "best_move": result.best_move,
+        "cp": score.score() if score is not None and not score.is_mate() else None,
+        "mate": score.mate() if score is not None and score.is_mate() else None,
+        "pv": result.pv,
+        "depth": result.depth,
+        "nodes": result.nodes,
+    }
+
+
+def position_from_dict(entry: dict) -> PositionAnalysis:
+    if entry.get("mate") is not None:
+        score = chess.engine.PovScore(chess.engine.Mate(entry["mate"]), chess.WHITE)
+    elif entry.get("cp") is not None:
+        score = chess.engine.PovScore(chess.engine.Cp(entry["cp"]), chess.WHITE)
+    else:
+        score = None
+    return PositionAnalysis(
+        best_move=entry.get("best_move"),
+        score=score,
+        pv=entry.get("pv") or [],
+        depth=entry.get("depth"),
+        nodes=entry.get("nodes"),
+    )
+
+
+def default_limit() -> chess.engine.Limit:
+    return chess.engine.Limit(depth=StockfishConfig.ANALYSIS_DEPTH)
+
+
+async def analyse_position(
+    engine, board: chess.Board, limit: chess.engine.Limit = None
+) -> PositionAnalysis:
+    """
+    Runs one engine search on the given position. The best move is the head of the
+    principal variation, so no separate play() search is needed.
+
+    Parameters:
+    - engine (PooledEngine): Engine checked out of the pool.
+    - board (chess.Board): The position to analyse.
+    - limit (chess.engine.Limit, optional): Search limit. Defaults to the configured depth.
+
+    Returns:
+    - PositionAnalysis: Best move, score, PV, depth and nodes of the search.
+    """
+    info = await engine.analyse(board, limit or default_limit())
+    pv = [move.uci() for move in info.get("pv", [])]
+    return PositionAnalysis(
+        best_move=pv[0] if pv else None,
+        score=info.get("score"),
+        pv=pv,
+        depth=info.get("depth"),
+        nodes=info.get("nodes"),
+    )
+
+
+MATE_SCORE = 10000
+# Eval change between consecutive plies that makes a critical moment
+CRITICAL_SWING_CP = 200
+
+
+def white_score(evaluation: Optional[chess.engine.PovScore]):
+    """
+    Formats a score from White's point of view as used in the game analysis:
+    centipawns, or a "Mate in N by <side>" string.
+    """
+    if evaluation is None:
+        return "N/A"
+    if evaluation.is_mate():
+        mate = evaluation.white().mate()
+        return f"Mate in {abs(mate)} by {'White' if mate > 0 else 'Black'}"
+    return evaluation.white().score(mate_score=MATE_SCORE)
+
+
+def score_to_cp(score) -> Optional[int]:
+    """
+    White's advantage in centipawns of a `white_score`, mates counted as
+    +/-MATE_SCORE. None when the position was not evaluated.
+    """
+    if isinstance(score, int):
+        return score
+    if isinstance(score, str) and score.startswith("Mate in"):
+        return MATE_SCORE if score.endswith("White") else -MATE_SCORE
+    return None
 
 
-async def get_best_move(game, move_number):
+async def get_best_move(parsed: ParsedGame, move_number):
     """
     Uses Stockfish to predict the best move at a specified move number in a given game.
 
     Parameters:
-    - game (str): The game.
+    - parsed (ParsedGame): The game.
     - move_number (int): The move number for which to predict the best move.
 
     Returns:
     - A tuple of (best move in UCI format, evaluation score).
     """
 
-    stockfish_path = "./stockfish/stockfish-windows-x86-64-avx2.exe"
-
-    # Go to the specified move number in the game
-    board = game.board()
-    for i, move in enumerate(game.mainline_moves(), start=1):
-        board.push(move)
-        if i == move_number:
-            break
+    # Go to the specified move number in the game, or its last position
+    board = chess.Board(parsed.fen_at(min(max(move_number, 1), len(parsed.fens))))
 
-    # Initialize the Stockfish engine
-    with chess.engine.SimpleEngine.popen_uci(stockfish_path) as engine:
-        # Ask Stockfish for the best move at the current position
-        result = engine.play(board, chess.engine.Limit(time=0.1))
-
-        # Optional: Get evaluation of the position
-        info = engine.analyse(board, chess.engine.Limit(depth=20))
-        evaluation = info.get("score", None)
+    (result,) = await analyse_fens(
+        [board.fen()], workers=1, priority=EnginePriority.INTERACTIVE
+    )
+    evaluation = result.score
 
     # Convert the evaluation to a more readable format
     if evaluation is not None:
@@ -222,90 +459,428 @@ async def get_best_move(game, move_number):
     else:
         score = None
 
-    return result.move.uci(), score
+    return result.best_move, score
+
+
+def eval_cache_keys(fens: List[str]) -> List[str]:
+    return [
+        EvalCache.key(
+            chess.polyglot.zobrist_hash(chess.Board(fen)), ZuEnginePool.engine_id
+        )
+        for fen in fens
+    ]
+
+
+def pool_workers(workers: int = None) -> int:
+    """Engines a game is spread over: `workers`, or ANALYSIS_WORKERS, capped by the pool size."""
+    workers = workers or StockfishConfig.ANALYSIS_WORKERS
+    return max(1, min(workers, len(ZuEnginePool.engines) or 1))
 
 
-async def get_best_moves(game) -> List[Tuple[str, int]]:
+async def search_pending(
+    engine,
+    fens: List[str],
+    pending: Iterator[int],
+    results: List[Optional[PositionAnalysis]],
+    limit: chess.engine.Limit,
+    on_result: Optional[Callable[[int, PositionAnalysis], None]],
+    priority: EnginePriority,
+) -> bool:
+    """
+    Searches plies from the shared `pending` iterator on one checked out engine.
+
+    Returns:
+    - True once no plies are left, False as soon as a more urgent checkout is
+      waiting for the engine.
+    """
+    for ply in pending:
+        results[ply] = await analyse_position(engine, chess.Board(fens[ply]), limit)
+        if on_result:
+            on_result(ply, results[ply])
+        if ZuEnginePool.is_wanted(priority):
+            return False
+    return True
+
+
+async def search_fens(
+    fens: List[str],
+    plies: List[int],
+    results: List[Optional[PositionAnalysis]],
+    limit: chess.engine.Limit,
+    workers: int = None,
+    on_result: Callable[[int, PositionAnalysis], None] = None,
+    priority: EnginePriority = EnginePriority.STANDARD,
+):
+    """
+    Searches the given plies across up to `workers` pooled engines. Each worker
+    checks out one engine and pulls the next pending ply until none are left,
+    writing its result into `results` at the ply's index and passing it to
+    `on_result` when given. A worker hands its engine back between plies while
+    a more urgent checkout waits, then checks one out again.
+    """
+    if not plies:
+        return
+    pending = iter(plies)
+
+    async def worker():
+        done = False
+        while not done:
+            async with ZuEnginePool.checkout(priority=priority) as engine:
+                done = await search_pending(
+                    engine, fens, pending, results, limit, on_result, priority
+                )
+
+    workers = min(pool_workers(workers), len(plies))
+    await asyncio.gather(*(worker() for _ in range(workers)))
+
+
+async def analyse_fens(
+    fens: List[str],
+    workers: int = None,
+    limit: chess.engine.Limit = None,
+    on_result: Callable[[int, PositionAnalysis], None] = None,
+    priority: EnginePriority = EnginePriority.STANDARD,
+) -> List[PositionAnalysis]:
+    """
+    Analyses a list of positions across up to `workers` pooled engines. Positions
+    already in the evaluation cache at the requested depth or deeper are served
+    from it, the rest are searched. Results come back in the same order as `fens`.
+
+    Parameters:
+    - fens (List[str]): The positions to analyse.
+    - workers (int, optional): Number of engines to use. Defaults to
+      StockfishConfig.ANALYSIS_WORKERS, capped by the pool size.
+    - limit (chess.engine.Limit, optional): Search limit. Defaults to the configured depth.
+    - on_result (Callable, optional): Called with the index and result of every
+      position as soon as it is known, cached ones first.
+    - priority (EnginePriority): Scheduling class of the engine checkouts.
+
+    Returns:
+    - A list of PositionAnalysis, one per FEN.
+    """
+    limit = limit or default_limit()
+    results: List[Optional[PositionAnalysis]] = [None] * len(fens)
+
+    # Only depth-limited searches are comparable, so time limits bypass the cache
+    keys = eval_cache_keys(fens) if limit.depth is not None else []
+    if keys:
+        cached = await EvalCache.get_many(keys, limit.depth)
+        results = [position_from_dict(e) if e else None for e in cached]
+
+    todo = [ply for ply, result in enumerate(results) if result is None]
+    if on_result:
+        for ply, result in enumerate(results):
+            if result is not None:
+                on_result(ply, result)
+    await search_fens(
+        fens,
+        todo,
+        results,
+        limit,
+        workers=workers,
+        on_result=on_result,
+        priority=priority,
+    )
+
+    if keys:
+        await EvalCache.set_many(
+            {keys[ply]: position_to_dict(results[ply]) for ply in todo}
+        )
+    return results
+
+
+async def get_best_moves(
+    parsed: ParsedGame,
+    workers: int = None,
+    mode: AnalysisMode = None,
+    on_result: Callable[[int, PositionAnalysis], None] = None,
+    priority: EnginePriority = EnginePriority.STANDARD,
+) -> List[Tuple[str, int]]:
     """
     Analyzes the entire game, predicting the best move at each position.
 
     Parameters:
-    - game (chess.pgn.Game): The game to analyze.
+    - parsed (ParsedGame): The game to analyze.
+    - workers (int, optional): Number of engines to spread the plies over.
+    - mode (AnalysisMode, optional): Defaults to StockfishConfig.ANALYSIS_MODE.
+    - on_result (Callable, optional): Called with the index and result of every
+      position as soon as it is searched, see `analyse_fens`.
+    - priority (EnginePriority): Scheduling class of the engine checkouts.
 
     Returns:
     - A list of tuples with best moves in UCI format and their evaluation scores.
     """
-    stockfish_path = "./stockfish/stockfish-windows-x86-64-avx2.exe"
-    best_moves = []
+    if AnalysisMode(mode or StockfishConfig.ANALYSIS_MODE) == AnalysisMode.ADAPTIVE:
+        result = await analyse_game_adaptive(
+            parsed, workers=workers, on_result=on_result, priority=priority
+        )
+        return result.analysis
+    results = await analyse_fens(
+        list(parsed.fens), workers=workers, on_result=on_result, priority=priority
+    )
+    return [(result.best_move, white_score(result.score)) for result in results]
 
-    board = game.board()
-    with chess.engine.SimpleEngine.popen_uci(stockfish_path) as engine:
-        for move in game.mainline_moves():
-            board.push(move)
-            result = engine.play(board, chess.engine.Limit(time=0.1))
-            info = engine.analyse(board, chess.engine.Limit(depth=20))
-            evaluation = info.get("score", None)
 
-            if evaluation is not None:
-                if evaluation.is_mate():
-                    score = f"Mate in {abs(evaluation.mate())} by {'White' if evaluation.mate() > 0 else 'Black'}"
-                else:
-                    score = evaluation.white().score(mate_score=10000)
-            else:
-                score = "N/A"
+def analysis_recorder(
+    analysis: List[Optional[Tuple[str, int]]],
+) -> Callable[[int, PositionAnalysis], None]:
+    """
+    An `on_result` callback writing the best move and evaluation of every
+    searched position into `analysis`, so partial results can be returned.
+    """
 
-            best_moves.append((result.move.uci(), score))
+    def record(index: int, result: PositionAnalysis):
+        analysis[index] = (result.best_move, white_score(result.score))
 
-    return best_moves
+    return record
 
 
-async def pgn_to_moves_dict(pgn_string: str) -> dict:
+class GameAnalysis(NamedTuple):
+    """
+    Result of an adaptive game analysis.
+
+    Attributes:
+    - analysis (List[Tuple[str, int]]): Best move and evaluation after every ply.
+    - depths (List[int]): Depth each ply was searched to.
+    - deep_plies (List[int]): Plies searched again in the deep pass, from 1.
+    - nodes (int): Nodes searched by both passes, cached positions included.
+    - seconds (float): Wall time of the analysis.
     """
-    Converts a string of moves separated by move identifiers into a dictionary with move numbers as keys and moves as values.
 
-    Args:
-        pgn_string (str): A string of moves separated by identifiers like "1.", "2.", ...
+    analysis: List[Tuple[str, int]]
+    depths: List[Optional[int]]
+    deep_plies: List[int]
+    nodes: int
+    seconds: float
+
+
+def swing_positions(analysis: list, neighbours: int) -> List[int]:
+    """
+    Indexes into `analysis` of the positions on both sides of every critical
+    moment, then of up to `neighbours` positions around them, nearest first.
+    """
+    swings = find_critical_moments(analysis)
+    ordered = {}
+    for distance in range(neighbours + 1):
+        for index in swings:
+            # The swing is between the positions at index - 1 and index
+            for position in (index - 1 - distance, index + distance):
+                if 0 <= position < len(analysis):
+                    ordered[position] = None
+    return list(ordered)
+
+
+def deep_limit(
+    positions: int, workers: int, seconds_left: float = None, nodes_left: int = None
+) -> Optional[chess.engine.Limit]:
+    """
+    Search limit of the deep pass: ANALYSIS_DEPTH, capped by an even share of
+    the remaining budgets. None when a budget is already spent.
+    """
+    limit = chess.engine.Limit(depth=StockfishConfig.ANALYSIS_DEPTH)
+    if seconds_left is not None:
+        if seconds_left <= 0:
+            return None
+        # Positions are searched `workers` at a time
+        limit.time = seconds_left * workers / positions
+    if nodes_left is not None:
+        if nodes_left < positions:
+            return None
+        limit.nodes = nodes_left // positions
+    return limit
+
+
+async def analyse_game_adaptive(
+    parsed: ParsedGame,
+    workers: int = None,
+    time_budget: float = None,
+    node_budget: int = None,
+    on_result: Callable[[int, PositionAnalysis], None] = None,
+    priority: EnginePriority = EnginePriority.STANDARD,
+) -> GameAnalysis:
+    """
+    Analyzes the entire game in two passes: a sweep of every ply at
+    ADAPTIVE_SWEEP_DEPTH, then a search of the plies around each eval swing,
+    as found by `find_critical_moments`, at ANALYSIS_DEPTH. The deep pass
+    shares what is left of the budgets evenly between its positions.
+
+    Parameters:
+    - parsed (ParsedGame): The game to analyze.
+    - workers (int, optional): Number of engines to spread the plies over.
+    - time_budget (float, optional): Seconds for the whole game. Defaults to
+      ADAPTIVE_TIME_BUDGET, 0 for none.
+    - node_budget (int, optional): Nodes for the whole game. Defaults to
+      ADAPTIVE_NODE_BUDGET, 0 for none.
+    - on_result (Callable, optional): Called with the index and result of every
+      position searched by either pass, see `analyse_fens`.
+    - priority (EnginePriority): Scheduling class of the engine checkouts.
 
     Returns:
-        dict: A dictionary with move numbers as keys and moves as values.
-        {1: 'e4', 2: 'b6', 3: 'c4', 4: 'Bb7', 5: 'Nc3', 6: 'e6'}
+    - GameAnalysis: The analysis with the depth of every ply.
     """
-    moves_dict = {}
-    # Split the string into individual moves based on the move number identifiers
-    moves_list = [
-        move.strip() for move in re.split(r"\d+\.", pgn_string) if move.strip()
-    ]
-    move_counter = 1
-    for move in moves_list:
-        # Split the move into individual parts, might include captures, checks, etc.
-        individual_moves = move.split(" ")
-        # Filter out empty strings that may result from extra spaces
-        individual_moves = [move for move in individual_moves if move]
-        for individual_move in individual_moves:
-            moves_dict[move_counter] = individual_move
-            move_counter += 1
-    return moves_dict
+    start = time.perf_counter()
+    time_budget = time_budget or StockfishConfig.ADAPTIVE_TIME_BUDGET or None
+    node_budget = node_budget or StockfishConfig.ADAPTIVE_NODE_BUDGET or None
+    workers = pool_workers(workers)
+    fens = list(parsed.fens)
+
+    sweep_limit = chess.engine.Limit(depth=StockfishConfig.ADAPTIVE_SWEEP_DEPTH)
+    results = await analyse_fens(
+        fens,
+        workers=workers,
+        limit=sweep_limit,
+        on_result=on_result,
+        priority=priority,
+    )
+    sweep = [(result.best_move, white_score(result.score)) for result in results]
+    deep = swing_positions(sweep, StockfishConfig.ADAPTIVE_NEIGHBOURS)
+    nodes = sum(result.nodes or 0 for result in results)
+
+    limit = deep and deep_limit(
+        len(deep),
+        workers,
+        time_budget and time_budget - (time.perf_counter() - start),
+        node_budget and node_budget - nodes,
+    )
+    if limit:
+        deep_results = await analyse_fens(
+            [fens[index] for index in deep],
+            workers=workers,
+            limit=limit,
+            on_result=on_result and (lambda i, result: on_result(deep[i], result)),
+            priority=priority,
+        )
+        for index, result in zip(deep, deep_results):
+            results[index] = result
+        nodes += sum(result.nodes or 0 for result in deep_results)
+
+    return GameAnalysis(
+        analysis=[(result.best_move, white_score(result.score)) for result in results],
+        depths=[result.depth for result in results],
+        deep_plies=sorted(index + 1 for index in deep) if limit else [],
+        nodes=nodes,
+        seconds=time.perf_counter() - start,
+    )
+
+
+async def stream_best_moves(
+    parsed: ParsedGame, workers: int = None
+) -> AsyncIterator[Tuple[int, str, int]]:
+    """
+    Analyzes the entire game like `get_best_moves`, but yields every ply as
+    soon as it is analysed, in the order the engines finish them.
+
+    Parameters:
+    - parsed (ParsedGame): The game to analyze.
+    - workers (int, optional): Number of engines to spread the plies over.
+
+    Returns:
+    - An async iterator of (ply, best move in UCI format, evaluation score)
+      tuples, plies counting from 1.
+    """
+    finished = asyncio.Queue()
+    search = asyncio.ensure_future(
+        analyse_fens(
+            list(parsed.fens),
+            workers=workers,
+            on_result=lambda ply, result: finished.put_nowait((ply, result)),
+        )
+    )
+    search.add_done_callback(lambda _: finished.put_nowait(None))
+    try:
+        while True:
+            item = await finished.get()
+            if item is None:
+                break
+            ply, result = item
+            yield ply + 1, result.best_move, white_score(result.score)
+        search.result()
+    finally:
+        search.cancel()
 
 
 def find_critical_moments(analysis):
     critical_moments = []
     # Iterate through analysis list, except the last item to avoid index out of range
     for i in range(len(analysis) - 1):
+        before, after = score_to_cp(analysis[i][1]), score_to_cp(analysis[i + 1][1])
+        if before is None or after is None:
+            continue
         # Calculate the absolute difference in evaluation between consecutive moves
-        eval_diff = abs(analysis[i + 1][1] - analysis[i][1])
-        # Check if the difference is at least 100 points
-        if eval_diff >= 200:
-            # Calculate move number; add 1 because indexing starts at 0, then divide by 2 and round up
+        eval_diff = abs(after - before)
+        # Check if the difference is at least CRITICAL_SWING_CP points
+        if eval_diff >= CRITICAL_SWING_CP:
+            # Calculate the ply; add 1 because indexing starts at 0
             critical_moments.append(i + 1)
     return critical_moments
 
 
+def select_plies(
+    total: int, plies: List[int] = None, start: int = None, end: int = None
+) -> List[int]:
+    """
+    Resolves the plies asked for in a batch request, either a list or an inclusive
+    start/end range, against a game with `total` positions. A range is checked
+    before it is expanded, so its size is bounded by the game.
+
+    Raises:
+    - ValueError: If a requested ply is outside the game, or more than
+      MAX_BOARD_PLIES plies are requested.
+    """
+    if plies is None:
+        start = 0 if start is None else start
+        end = total - 1 if end is None else end
+        check_plies_in_game([start, end], total)
+        plies = range(start, end + 1)
+    check_plies_in_game(plies, total)
+    if len(plies) > MAX_BOARD_PLIES:
+        raise ValueError(f"Request at most {MAX_BOARD_PLIES} plies at once.")
+    return list(plies)
+
+
+def check_plies_in_game(plies, total: int):
+    out_of_range = [ply for ply in plies if not 0 <= ply < total]
+    if out_of_range:
+        raise ValueError(
+            f"Plies {out_of_range[:10]} exceed the total moves in the game."
+        )
+
+
+async def get_cached_evals(
+    fens: List[str], plies: List[int], pgn_id: str = None
+) -> List[Optional[int]]:
+    """
+    Returns already known evaluations for the given positions without running the
+    engine: from the game's stored analysis when there is one, otherwise from the
+    evaluation cache. Unknown evaluations are None.
+
+    Parameters:
+    - fens (List[str]): The positions, one per ply in `plies`.
+    - plies (List[int]): Ply of every position, 0 being the starting position.
+    - pgn_id (str, optional): The id of the stored game.
+    """
+    if pgn_id:
+        document = await fetch_analysis(pgn_id)
+        analysis = (document or {}).get("analysis") or []
+        if analysis:
+            return [
+                analysis[ply - 1][1] if 0 < ply <= len(analysis) else None
+                for ply in plies
+            ]
+
+    entries = await EvalCache.get_many(eval_cache_keys(fens), 1)
+    return [
+        white_score(position_from_dict(entry).score) if entry else None
+        for entry in entries
+    ]
+
+
 # Find and print the critical moments
-async def get_critical_moments(analysis: str, pgn: str) -> dict:
+async def get_critical_moments(analysis: str, parsed: ParsedGame) -> dict:
     critical_moments = find_critical_moments(analysis)
-    moves_dict = await pgn_to_moves_dict(pgn)
     critical_moments_dict = {
-        i + 1: moves_dict.get(i + 1, "N/A") for i in critical_moments
+        i + 1: parsed.sans[i] if i < len(parsed.sans) else "N/A"
+        for i in critical_moments
     }
     print(critical_moments_dict)
     return critical_moments_dict
@@ -329,3 +904,9 @@ async def fetch_all_documents(collection: str):
 
 async def fetch_analysis(pgn_id: str):
     return await ZuMongoClient.find_one(col="analysis", filter_data={"pgn_id": pgn_id})
+
+
+async def fetch_analysis_by_hash(game_hash: str):
+    return await ZuMongoClient.find_one(
+        col="analysis", filter_data={"game_hash": game_hash}, project={"_id": 0}
+    )
@@ -0,0 +1,180 @@
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import chess
+
+from app.api.utils import openai_utils, pgn_utils
+from app.api.utils.chess_utils import MATE_SCORE, score_to_cp
+from app.core.config import OPENAIConfig
+from app.models.analysis import CommentaryMode
+
+log = logging.getLogger(__name__)
+
+# Centipawns lost by the move played, and how the move is described
+MOVE_CLASSES = (
+    (0, "a precise move"),
+    (20, "an accurate move"),
+    (50, "a reasonable move"),
+    (100, "an inaccuracy"),
+    (200, "a mistake"),
+)
+BLUNDER = "a blunder"
+PIECE_NAMES = {
+    chess.PAWN: "pawn",
+    chess.KNIGHT: "knight",
+    chess.BISHOP: "bishop",
+    chess.ROOK: "rook",
+    chess.QUEEN: "queen",
+}
+
+
+def centipawn_loss(before, after, white_to_move: bool) -> Optional[int]:
+    """Centipawns the mover gave away with the move, None if unknown."""
+    before, after = score_to_cp(before), score_to_cp(after)
+    if before is None or after is None:
+        return None
+    delta = after - before if white_to_move else before - after
+    return max(0, -delta)
+
+
+def classify_move(loss: Optional[int], is_best: bool) -> str:
+    if is_best:
+        return "the engine's top choice"
+    if loss is None:
+        return "a natural move"
+    for threshold, name in MOVE_CLASSES:
+        if loss <= threshold:
+            return name
+    return BLUNDER
+
+
+def move_features(board: chess.Board, move: chess.Move, san: str) -> List[str]:
+    features = []
+    if board.is_castling(move):
+        side = "kingside" if chess.square_file(move.to_square) > 4 else "queenside"
+        features.append(f"castles {side}")
+    elif board.is_capture(move):
+        captured = board.piece_type_at(move.to_square) or chess.PAWN
+        features.append(f"captures a {PIECE_NAMES[captured]}")
+    if san.endswith("#"):
+        features.append("delivers checkmate")
+    elif san.endswith("+"):
+        features.append("gives check")
+    return features
+
+
+def format_cp(score) -> str:
+    cp = score_to_cp(score)
+    if cp is None:
+        return ""
+    if abs(cp) == MATE_SCORE:
+        return f" {score}."
+    return f" The evaluation is now {cp / 100:+.2f}."
+
+
+def describe_ply(
+    board: chess.Board, move: chess.Move, san: str, best: Optional[str], before, after
+) -> Tuple[str, Optional[int]]:
+    """
+    Template commentary of one move, and the centipawns it lost.
+
+    Parameters:
+    - board (chess.Board): The position the move was played from.
+    - move (chess.Move): The move played.
+    - san (str): The move played in SAN.
+    - best (str, optional): The engine's best move in the position, as UCI.
+    - before, after: White's advantage before and after the move.
+    """
+    loss = centipawn_loss(before, after, board.turn == chess.WHITE)
+    features = move_features(board, move, san)
+    text = f"{san} {' and '.join(features)}" if features else san
+    text += f", {classify_move(loss, best == move.uci())}."
+    best_move = chess.Move.from_uci(best) if best else None
+    if best_move and loss and loss > 20 and board.is_legal(best_move):
+        text += f" {board.san(best_move)} was stronger."
+    return text + format_cp(after), loss
+
+
+def local_commentary(
+    parsed: pgn_utils.ParsedGame, analysis: list, critical_moments: dict
+) -> Tuple[Dict[str, str], List[str]]:
+    """
+    Explains every ply from the engine analysis alone, without a model.
+
+    Parameters:
+    - parsed (ParsedGame): The game.
+    - analysis (list): Best move and evaluation after every ply.
+    - critical_moments (dict): Critical moments, SAN keyed by ply.
+
+    Returns:
+    - The commentary keyed by ply, and the plies worth escalating to the model:
+      critical moments and moves losing more than LOCAL_COMMENTARY_MAX_LOSS
+      centipawns.
+    """
+    commentary, escalate = {}, []
+    board = chess.Board(parsed.fen_at(0))
+    # Best move and evaluation of the position each move was played from
+    best, before = None, 0
+    for ply, (uci, san, (next_best, after)) in enumerate(
+        zip(parsed.ucis, parsed.sans, analysis), start=1
+    ):
+        move = chess.Move.from_uci(uci)
+        text, loss = describe_ply(board, move, san, best, before, after)
+        board.push(move)
+        best, before = next_best, after
+        commentary[str(ply)] = text
+        routine = loss is not None and loss <= OPENAIConfig.LOCAL_COMMENTARY_MAX_LOSS
+        if str(ply) in critical_moments or not routine:
+            escalate.append(str(ply))
+    return commentary, escalate
+
+
+async def generate_game_commentary(
+    parsed: pgn_utils.ParsedGame,
+    analysis: list,
+    critical_moments: dict,
+    mode: CommentaryMode = None,
+) -> dict:
+    """
+    Generates the commentary of a game in the given mode: `llm` asks the model
+    about every ply, `local` only uses templates, and `hybrid` uses templates
+    for routine moves and asks the model about the rest.
+
+    Parameters:
+    - parsed (ParsedGame): The parsed game.
+    - analysis (list): Best move and evaluation after every ply.
+    - critical_moments (dict): Critical moments, SAN keyed by ply.
+    - mode (CommentaryMode, optional): Defaults to COMMENTARY_MODE.
+
+    Returns:
+    - The commentary keyed by ply.
+
+    Raises:
+    - IncompleteCommentary: If the model left some plies without commentary.
+      In hybrid mode it carries the templates with the model's commentary
+      laid over them, also when asking the model failed altogether.
+    """
+    mode = CommentaryMode(mode or OPENAIConfig.COMMENTARY_MODE)
+    if mode == CommentaryMode.LLM:
+        return await openai_utils.analyze_chess_game(parsed, analysis, critical_moments)
+
+    commentary, escalate = local_commentary(parsed, analysis, critical_moments)
+    if mode == CommentaryMode.LOCAL or not escalate:
+        return commentary
+
+    try:
+        escalated = await openai_utils.analyze_chess_game(
+            parsed, analysis, critical_moments, plies=escalate
+        )
+    except openai_utils.IncompleteCommentary as e:
+        commentary.update(
+            {ply: text for ply, text in e.commentary.items() if ply in commentary}
+        )
+        raise openai_utils.IncompleteCommentary(commentary, e.missing)
+    except Exception as e:
+        log.warning(f"Commentary of plies {', '.join(escalate)} failed: {e!r}")
+        raise openai_utils.IncompleteCommentary(commentary, escalate) from e
+    commentary.update(
+        {ply: text for ply, text in escalated.items() if ply in commentary}
+    )
+    return commentary
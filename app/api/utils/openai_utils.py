@@ -1,42 +1,280 @@
-# import asyncio
+import asyncio
+import json
+import logging
+import re
+from typing import AsyncIterator, List, Tuple
+
 import json_repair
-from openai import AsyncOpenAI
 
-from app.core.config import OPENAIConfig
+from app.api.utils import pgn_utils, prompt_utils
+from app.api.utils.cache_utils import CommentaryCache, PositionCommentaryCache
+from app.core.config import CacheConfig, OPENAIConfig
+from app.llm.llm_gateway import ZuLLMGateway
+
+log = logging.getLogger(__name__)
+
+gpt_35_turbo = ZuLLMGateway.client
+
+
+class IncompleteCommentary(Exception):
+    """
+    Raised when the model explained only some of the requested plies. Carries
+    the commentary it did write, keyed by ply, and the plies it is missing, so
+    the caller can keep the partial result without caching it.
+    """
+
+    def __init__(self, commentary: dict, missing: List[str]):
+        super().__init__(f"No commentary for plies {', '.join(missing)}")
+        self.commentary = commentary
+        self.missing = missing
+
+
+async def analyze_chess_game(
+    parsed: pgn_utils.ParsedGame,
+    analysis,
+    blunders,
+    segmented: bool = None,
+    plies: List[str] = None,
+):
+    """
+    Returns the commentary of a game, keyed by ply. Identical inputs are served
+    from the commentary cache instead of calling the model again.
 
-gpt_35_turbo = AsyncOpenAI(
-    api_key=OPENAIConfig.OPENAI_KEY,
-)
+    In segmented mode every ply is explained: the game is split into windows of
+    COMMENTARY_SEGMENT_PLIES plies commented in parallel. Otherwise one request
+    explains the critical moments and their context. Defaults to
+    COMMENTARY_SEGMENTED.
 
-async def analyze_chess_game(pgn_str, analysis, blunders):
-    system = (
-        "Hey chess analysis expert"
-        "Analyze each move and explain why they are the best move, a good move, mistakes, or blunders. "
-        "You are given the pgn of the game as 'pgn_str', stockfish analysis as 'analysis' and blunders as 'blunders', also explain "
-        "Return a json response in the following format as an example: "
-        '{"1":"e4 is known for leading to an open and tactical game, one of the oldest and most studied openings in chess."}'
+    `plies` limits the commentary to the given plies, all by default. A reply
+    missing some of the plies raises IncompleteCommentary and is not cached.
+    """
+    model = OPENAIConfig.COMMENTARY_MODEL
+    if segmented is None:
+        segmented = OPENAIConfig.COMMENTARY_SEGMENTED
+    key = CommentaryCache.key(
+        model,
+        prompt_utils.COMMENTARY_PROMPT_VERSION,
+        dict(parsed.headers),
+        parsed.sans,
+        analysis,
+        blunders,
+        segmented,
+        plies,
     )
+    commentary = await CommentaryCache.get(key)
+    if commentary is None:
+        request = request_segmented_commentary if segmented else request_game_commentary
+        commentary = await comment_uncovered_plies(
+            parsed, analysis, blunders, model, request, plies
+        )
+        await CommentaryCache.set(key, commentary)
+    return commentary
+
+
+def opening_position_keys(parsed: pgn_utils.ParsedGame, blunders, model) -> dict:
+    """
+    Position commentary keys of the opening plies whose explanation does not
+    depend on the rest of the game, keyed by ply.
+    """
+    plies = min(len(parsed.ucis), CacheConfig.POSITION_COMMENTARY_PLIES)
+    return {
+        str(ply): PositionCommentaryCache.key(
+            parsed.fen_at(ply - 1),
+            parsed.ucis[ply - 1],
+            model,
+            prompt_utils.COMMENTARY_PROMPT_VERSION,
+        )
+        for ply in range(1, plies + 1)
+        if str(ply) not in blunders
+    }
+
+
+async def comment_uncovered_plies(
+    parsed: pgn_utils.ParsedGame,
+    analysis,
+    blunders,
+    model,
+    request=None,
+    plies: List[str] = None,
+) -> dict:
+    """
+    Reuses the stored commentary of common opening moves and asks the model
+    only about the remaining plies, through `request`, then merges both by ply.
+
+    Raises:
+    - ValueError: If the model's reply is not a JSON object.
+    - IncompleteCommentary: If `request` left some of the plies it asked about
+      without commentary.
+    """
+    request = request or request_game_commentary
+    position_keys = opening_position_keys(parsed, blunders, model)
+    texts = await PositionCommentaryCache.get_many(list(position_keys.values()))
+    stored = {ply: text for ply, text in zip(position_keys, texts) if text}
+    plies = plies or [str(ply) for ply in range(1, len(analysis) + 1)]
+    stored = {ply: text for ply, text in stored.items() if ply in plies}
+    uncovered = [ply for ply in plies if ply not in stored]
+    if not uncovered:
+        return stored
 
-    user = (
-        f"<pgn_str>{pgn_str}</pgn_str> <analysis>{analysis}</analysis> <blunders>{blunders}</blunders>"
+    missing = []
+    try:
+        generated = await request(parsed, analysis, blunders, model, uncovered)
+    except IncompleteCommentary as e:
+        generated, missing = e.commentary, e.missing
+    if not isinstance(generated, dict):
+        raise ValueError(
+            f"Expected the commentary as a JSON object, got {type(generated).__name__}"
+        )
+    generated = {ply: text for ply, text in generated.items() if isinstance(text, str)}
+    await PositionCommentaryCache.set_many(
+        {
+            position_keys[ply]: generated[ply]
+            for ply in uncovered
+            if ply in position_keys and ply in generated
+        }
     )
+    merged = {ply: stored.get(ply) or generated.get(ply) for ply in plies}
+    merged = {ply: text for ply, text in merged.items() if text}
+    if missing:
+        raise IncompleteCommentary(merged, missing)
+    return merged
 
-    response = await gpt_35_turbo.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {
-                "role": "system",
-                "content": system,
-            },
-            {
-                "role": "user",
-                "content": user,
-            },
-        ],
-        max_tokens=500,  # Adjust as needed for the length of response you expect
+
+async def request_game_commentary(
+    parsed: pgn_utils.ParsedGame,
+    analysis,
+    blunders,
+    model,
+    plies,
+    focus_critical: bool = True,
+):
+    prompt = prompt_utils.build_commentary_prompt(
+        parsed, analysis, blunders, plies, model, focus_critical
+    )
+    content = await ZuLLMGateway.chat(prompt.messages, model, prompt.max_tokens)
+    if not content:
+        raise asyncio.TimeoutError("No commentary within the deadline")
+    reply = json_repair.loads(content)
+    if isinstance(reply, dict):
+        missing = [ply for ply in prompt.plies if not isinstance(reply.get(ply), str)]
+        if missing:
+            raise IncompleteCommentary(reply, missing)
+    return reply
+
+
+async def request_segmented_commentary(
+    parsed: pgn_utils.ParsedGame, analysis, blunders, model, plies
+):
+    """
+    Explains every ply by splitting them into windows of COMMENTARY_SEGMENT_PLIES
+    plies, at most COMMENTARY_CONCURRENCY of which are commented at once. Each
+    window only contributes its own plies, so the merge does not depend on the
+    order completions arrive in. If every window fails the first error is
+    raised, otherwise failed or incomplete windows raise IncompleteCommentary
+    with the commentary written so far.
+    """
+    size = OPENAIConfig.COMMENTARY_SEGMENT_PLIES
+    segments = [plies[start : start + size] for start in range(0, len(plies), size)]
+    semaphore = asyncio.Semaphore(OPENAIConfig.COMMENTARY_CONCURRENCY)
+
+    async def request_segment(segment):
+        async with semaphore:
+            return await request_game_commentary(
+                parsed, analysis, blunders, model, segment, focus_critical=False
+            )
+
+    results = await asyncio.gather(
+        *map(request_segment, segments), return_exceptions=True
     )
-    return json_repair.loads(response.choices[0].message.content)
+    return merge_segments(segments, results)
+
+
+def merge_segments(segments: List[List[str]], results: list) -> dict:
+    """
+    Merges the replies of the commentary windows, each result either the reply
+    to its segment or the error it failed with.
+    """
+    failures = [
+        result
+        for result in results
+        if isinstance(result, Exception)
+        and not isinstance(result, IncompleteCommentary)
+    ]
+    if len(failures) == len(results):
+        raise failures[0]
+
+    commentary, missing = {}, []
+    for segment, result in zip(segments, results):
+        if isinstance(result, IncompleteCommentary):
+            missing.extend(result.missing)
+            result = result.commentary
+        if isinstance(result, dict):
+            commentary.update({ply: result[ply] for ply in segment if ply in result})
+        else:
+            log.warning(
+                f"Commentary of plies {segment[0]}-{segment[-1]} failed: {result}"
+            )
+            missing.extend(segment)
+    if missing:
+        raise IncompleteCommentary(commentary, sorted(missing, key=int))
+    return commentary
+
+
+class CommentaryStreamParser(object):
+    """
+    Extracts "ply": "text" entries from a JSON object streamed in chunks, each as
+    soon as its closing quote arrives.
+    """
+
+    ENTRY_REGEX = re.compile(r'"(\d+)"\s*:\s*"((?:[^"\\]|\\.)*)"')
 
+    def __init__(self):
+        self.buffer = ""
+        self.position = 0
+        self.entries = {}
+
+    def feed(self, chunk: str) -> List[Tuple[str, str]]:
+        """Adds a chunk and returns the entries it completed."""
+        self.buffer += chunk
+        completed = []
+        for match in self.ENTRY_REGEX.finditer(self.buffer, self.position):
+            ply, text = match.group(1), json.loads(f'"{match.group(2)}"', strict=False)
+            self.entries[ply] = text
+            completed.append((ply, text))
+            self.position = match.end()
+        return completed
+
+    def close(self) -> List[Tuple[str, str]]:
+        """Returns the entries left in a reply the regex could not read, e.g.
+        one cut off by the token limit, repaired by json_repair."""
+        repaired = json_repair.loads(self.buffer) if self.buffer else {}
+        if not isinstance(repaired, dict):
+            return []
+        return [
+            (str(ply), text)
+            for ply, text in repaired.items()
+            if str(ply) not in self.entries and isinstance(text, str)
+        ]
+
+
+async def stream_game_commentary(
+    parsed: pgn_utils.ParsedGame, analysis, blunders
+) -> AsyncIterator[Tuple[str, str]]:
+    """
+    Streams the commentary of a game from the model, yielding every (ply, text)
+    entry as soon as the model has finished writing it.
+    """
+    model = OPENAIConfig.COMMENTARY_MODEL
+    plies = [str(ply) for ply in range(1, len(analysis) + 1)]
+    prompt = prompt_utils.build_commentary_prompt(
+        parsed, analysis, blunders, plies, model
+    )
+    parser = CommentaryStreamParser()
+    async for content in ZuLLMGateway.stream(prompt.messages, model, prompt.max_tokens):
+        for entry in parser.feed(content):
+            yield entry
+    for entry in parser.close():
+        yield entry
 
 
 async def generate_analysis(
@@ -0,0 +1,359 @@
+import codecs
+import hashlib
+import io
+import re
+from types import MappingProxyType
+from typing import AsyncIterator, Iterator, List, Mapping, NamedTuple, Optional, Tuple
+
+import chess
+import chess.pgn
+
+from app.core.config import PGNConfig
+
+# One alternative per token kind. None of them nests quantifiers, so each
+# match is linear in the token length and a scan is linear in the input.
+PGN_TOKEN_REGEX = re.compile(
+    r"""
+    (?P<space>\s+)
+    |(?P<header>\[[A-Za-z0-9_]+[ \t]+"[^"\\\n]*(?:\\.[^"\\\n]*)*"[ \t]*\])
+    |(?P<comment>\{[^}]*\})
+    |(?P<line_comment>;[^\n]*)
+    |(?P<nag>\$\d+(?=[\s(){};]|$))
+    |(?P<result>(?:1-0|0-1|1/2-1/2|\*)(?=[\s(){};]|$))
+    |(?P<move_number>\d+\.(?:\.\.)?)
+    |(?P<san>
+        (?:O-O(?:-O)?|0-0(?:-0)?|[NBRQK]?[a-h]?[1-8]?x?[a-h][1-8](?:=?[NBRQ])?)
+        [+\#]?[!?]{0,2}
+        (?=[\s(){};$]|$)
+    )
+    |(?P<open>\()
+    |(?P<close>\))
+    """,
+    re.VERBOSE,
+)
+IGNORED_TOKENS = ("space", "comment", "line_comment")
+UNEXPECTED_CHARACTER_ERRORS = {"[": "Malformed header", "{": "Unclosed comment"}
+
+
+class PGNValidationError(ValueError):
+    """
+    Raised when a PGN is malformed.
+
+    Attributes:
+    - message (str): What is wrong.
+    - position (int): Offset of the offending character.
+    - line (int): 1-based line of the offending character.
+    - column (int): 1-based column of the offending character.
+    """
+
+    def __init__(self, message: str, pgn_string: str, position: int):
+        self.message = message
+        self.position = position
+        self.line = pgn_string.count("\n", 0, position) + 1
+        self.column = position - (pgn_string.rfind("\n", 0, position) + 1) + 1
+        super().__init__(f"{message} at line {self.line}, column {self.column}")
+
+
+def tokenize_pgn(pgn_string: str) -> Iterator[Tuple[str, int]]:
+    """
+    Yields the kind and offset of every significant PGN token. Whitespace and
+    comments are skipped.
+
+    Raises:
+        PGNValidationError: On a character no token can start with.
+    """
+    position = 0
+    while position < len(pgn_string):
+        match = PGN_TOKEN_REGEX.match(pgn_string, position)
+        if match is None:
+            message = UNEXPECTED_CHARACTER_ERRORS.get(
+                pgn_string[position], "Unexpected character"
+            )
+            raise PGNValidationError(message, pgn_string, position)
+        if match.lastgroup not in IGNORED_TOKENS:
+            yield match.lastgroup, position
+        position = match.end()
+
+
+def sequence_error(previous: str, kind: str, depth: int) -> Optional[str]:
+    if previous == "result":
+        return "Unexpected text after the result"
+    if kind == "header" and previous != "header":
+        return "Header after the first move"
+    if depth < 0:
+        return "Unmatched ')'"
+    return None
+
+
+def validate_pgn(pgn_string: str, max_length: int = None):
+    """
+    Validates the structure of a single-game PGN in one left-to-right scan.
+
+    Accepts headers, move numbers, SAN moves (including checks, mates,
+    promotions and annotations), comments, NAGs, variations and a result.
+    Move legality is left to the parser.
+
+    Args:
+        pgn_string (str): The PGN string to validate.
+        max_length (int, optional): Maximum accepted length. Defaults to
+            PGNConfig.PGN_MAX_LENGTH.
+
+    Raises:
+        PGNValidationError: If the PGN is too long or malformed.
+    """
+    max_length = max_length or PGNConfig.PGN_MAX_LENGTH
+    if len(pgn_string) > max_length:
+        raise PGNValidationError(
+            f"PGN longer than {max_length} characters", pgn_string, max_length
+        )
+
+    previous, depth, moves = "header", 0, 0
+    for kind, position in tokenize_pgn(pgn_string):
+        depth += (kind == "open") - (kind == "close")
+        error = sequence_error(previous, kind, depth)
+        if error:
+            raise PGNValidationError(error, pgn_string, position)
+        moves += kind == "san"
+        previous = kind
+
+    if depth:
+        raise PGNValidationError("Unclosed variation", pgn_string, len(pgn_string))
+    if not moves:
+        raise PGNValidationError("No moves found", pgn_string, len(pgn_string))
+
+
+def is_valid_pgn(pgn_string: str) -> bool:
+    """
+    Validates if the given text is in correct PGN format.
+
+    Args:
+        pgn_string (str): The PGN string to validate.
+
+    Returns:
+        bool: True if the PGN format is correct, False otherwise.
+    """
+    try:
+        validate_pgn(pgn_string)
+    except PGNValidationError:
+        return False
+    return True
+
+
+class ParsedGame(NamedTuple):
+    """
+    A PGN parsed once and shared by every stage of the analysis pipeline.
+
+    Attributes:
+    - headers (Mapping[str, str]): Header tags present in the PGN.
+    - start_fen (str): FEN of the starting position.
+    - sans (Tuple[str, ...]): Mainline moves in SAN.
+    - ucis (Tuple[str, ...]): Mainline moves in UCI.
+    - fens (Tuple[str, ...]): FEN after every ply, index 0 being after the first move.
+    - errors (Tuple[str, ...]): Reasons the PGN is invalid, empty if it is valid.
+    """
+
+    headers: Mapping[str, str]
+    start_fen: str
+    sans: Tuple[str, ...]
+    ucis: Tuple[str, ...]
+    fens: Tuple[str, ...]
+    errors: Tuple[str, ...]
+
+    @property
+    def is_valid(self) -> bool:
+        return not self.errors
+
+    @property
+    def game_hash(self) -> str:
+        """Content address of the game: its start position and mainline UCI moves."""
+        content = " ".join((self.start_fen, *self.ucis))
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def fen_at(self, ply: int) -> str:
+        """FEN after `ply` half-moves, 0 being the starting position."""
+        return self.fens[ply - 1] if ply > 0 else self.start_fen
+
+    def moves_dict(self) -> dict:
+        """SAN moves keyed by 1-based ply, as stored in the database."""
+        return {str(ply): san for ply, san in enumerate(self.sans, start=1)}
+
+
+def invalid_game(*errors: str) -> ParsedGame:
+    return ParsedGame(
+        headers=MappingProxyType({}),
+        start_fen=chess.STARTING_FEN,
+        sans=(),
+        ucis=(),
+        fens=(),
+        errors=tuple(errors),
+    )
+
+
+class ParsedGameBuilder(chess.pgn.BaseVisitor):
+    """
+    Visitor collecting a ParsedGame straight from the PGN reader, without
+    building a chess.pgn.Game tree. Variations are skipped; SAN moves are
+    kept as written in the PGN.
+    """
+
+    def begin_game(self):
+        self.headers = {}
+        self.start_fen = None
+        self.sans, self.ucis, self.fens, self.errors = [], [], [], []
+        self.pending_san = None
+
+    def visit_header(self, tagname: str, tagvalue: str):
+        self.headers[tagname] = tagvalue
+
+    def begin_variation(self):
+        return chess.pgn.SKIP
+
+    def parse_san(self, board: chess.Board, san: str) -> chess.Move:
+        move = board.parse_san(san)
+        self.pending_san = san
+        return move
+
+    def visit_move(self, board: chess.Board, move: chess.Move):
+        self.sans.append(self.pending_san)
+        self.ucis.append(move.uci())
+
+    def visit_board(self, board: chess.Board):
+        if self.start_fen is None:
+            self.start_fen = board.fen()
+        elif len(self.fens) < len(self.ucis):
+            self.fens.append(board.fen())
+            # The reader strips check and mate suffixes from SAN tokens
+            if board.is_check():
+                self.sans[-1] += "#" if board.is_checkmate() else "+"
+
+    def handle_error(self, error: Exception):
+        self.errors.append(str(error))
+
+    def result(self) -> ParsedGame:
+        return ParsedGame(
+            headers=MappingProxyType(self.headers),
+            start_fen=self.start_fen or chess.STARTING_FEN,
+            sans=tuple(self.sans),
+            ucis=tuple(self.ucis),
+            fens=tuple(self.fens),
+            errors=tuple(self.errors),
+        )
+
+
+def parse_pgn(pgn_string: str) -> ParsedGame:
+    """
+    Validates and parses a PGN in a single pass over its mainline.
+
+    Args:
+        pgn_string (str): The PGN string to parse.
+
+    Returns:
+        ParsedGame: The parsed game. Check `errors` before using it.
+    """
+    try:
+        validate_pgn(pgn_string)
+    except PGNValidationError as e:
+        return invalid_game(str(e))
+
+    parsed = chess.pgn.read_game(io.StringIO(pgn_string), Visitor=ParsedGameBuilder)
+    if parsed is None:
+        return invalid_game("Invalid PGN string")
+    return parsed
+
+
+def ends_in_comment(line: str, in_comment: bool) -> bool:
+    """Whether a `{...}` comment is still open at the end of `line`."""
+    position = 0
+    while True:
+        if in_comment:
+            position = line.find("}", position)
+            if position < 0:
+                return True
+            in_comment = False
+        else:
+            brace, semicolon = line.find("{", position), line.find(";", position)
+            if brace < 0 or 0 <= semicolon < brace:
+                return False
+            position, in_comment = brace, True
+        position += 1
+
+
+class PGNGameSplitter(object):
+    """
+    Splits a multi-game PGN, fed in chunks of any size, into single games
+    without holding more than one game in memory. A game ends where a header
+    line, outside a comment, follows its movetext.
+
+    A game longer than `max_length` is cut just past it, so `parse_pgn`
+    rejects it as too long, and its remaining lines are dropped.
+    """
+
+    def __init__(self, max_length: int = None):
+        self.max_length = max_length or PGNConfig.PGN_MAX_LENGTH
+        self.partial = ""
+        self.lines: List[str] = []
+        self.length = 0
+        self.has_movetext = False
+        self.in_comment = False
+
+    def feed(self, text: str) -> List[str]:
+        """Adds the next chunk of text and returns the games it completed."""
+        lines = (self.partial + text).split("\n")
+        self.partial = lines.pop()
+        if len(self.partial) > self.max_length:
+            # A single line longer than any game: keep it within the bound
+            lines.append(self.partial)
+            self.partial = ""
+        games = (self.add_line(line + "\n") for line in lines)
+        return [game for game in games if game]
+
+    def close(self) -> List[str]:
+        """Returns the last games once the input is exhausted."""
+        games = [self.add_line(self.partial), self.flush()]
+        self.partial = ""
+        return [game for game in games if game]
+
+    def add_line(self, line: str) -> Optional[str]:
+        """Adds a complete line, and returns the game it ended, if any."""
+        stripped = line.lstrip()
+        game = None
+        if not self.in_comment and stripped:
+            if stripped.startswith("[") and self.has_movetext:
+                game = self.flush()
+            self.has_movetext |= not stripped.startswith(("[", "%"))
+        self.in_comment = ends_in_comment(line, self.in_comment)
+        if self.length <= self.max_length:
+            self.lines.append(line)
+        self.length += len(line)
+        return game
+
+    def flush(self) -> Optional[str]:
+        game = "".join(self.lines)
+        if self.length <= self.max_length:
+            # Stripped only when complete, so a cut game stays too long
+            game = game.strip()
+        self.lines, self.length = [], 0
+        self.has_movetext = self.in_comment = False
+        return game or None
+
+
+async def iter_pgn_games(
+    chunks: AsyncIterator[bytes], max_length: int = None
+) -> AsyncIterator[str]:
+    """
+    Yields the games of a multi-game PGN read as a stream of UTF-8 chunks, a
+    leading byte order mark being skipped. Memory stays bounded by the
+    longest accepted game whatever the size of the stream.
+
+    Args:
+        chunks (AsyncIterator[bytes]): The PGN file, e.g. a request body.
+        max_length (int, optional): Maximum accepted game length. Defaults to
+            PGNConfig.PGN_MAX_LENGTH.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    splitter = PGNGameSplitter(max_length)
+    async for chunk in chunks:
+        for game in splitter.feed(decoder.decode(chunk)):
+            yield game
+    for game in splitter.feed(decoder.decode(b"", final=True)) + splitter.close():
+        yield game
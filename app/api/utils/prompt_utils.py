@@ -0,0 +1,207 @@
+import functools
+import logging
+from typing import Dict, List, Mapping, NamedTuple, Optional, Sequence
+
+import tiktoken
+import tiktoken.model
+
+from app.api.utils import pgn_utils
+from app.core.config import OPENAIConfig
+
+log = logging.getLogger(__name__)
+
+# Bump when the commentary prompt changes, so cached commentaries are not reused
+COMMENTARY_PROMPT_VERSION = "3"
+
+# Headers worth their tokens; dates, sites, links and clocks are dropped
+PROMPT_HEADERS = (
+    "White",
+    "Black",
+    "WhiteElo",
+    "BlackElo",
+    "TimeControl",
+    "ECO",
+    "Opening",
+    "Termination",
+    "Result",
+)
+# Used to estimate token counts when no tokenizer can be loaded
+CHARS_PER_TOKEN = 3
+# Chat formatting tokens added around every message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SYSTEM_PROMPT = (
+    "You are a chess coach. Explain each listed ply: why the move played is the "
+    "best move, a good move, a mistake or a blunder.\n"
+    "Input: game headers, the moves, then one line per ply to explain: "
+    "'<ply> <move played> <engine best move> <eval>'. A '!' after the ply marks a "
+    "critical moment. The eval is White's advantage in centipawns after the move, "
+    "or #N for mate in N, negative when Black mates.\n"
+    "Reply with one JSON object mapping every listed ply to one or two sentences, "
+    'e.g. {"1":"e4 opens lines for the queen and bishop and claims the centre."}'
+)
+
+
+class CommentaryPrompt(NamedTuple):
+    """
+    Chat messages of one commentary request.
+
+    Attributes:
+    - messages (List[Dict[str, str]]): System and user messages.
+    - plies (List[str]): Plies the model is asked to explain.
+    - input_tokens (int): Token count of the messages.
+    - max_tokens (int): Completion token budget.
+    """
+
+    messages: List[Dict[str, str]]
+    plies: List[str]
+    input_tokens: int
+    max_tokens: int
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(model: str) -> Optional[tiktoken.Encoding]:
+    """
+    Tokenizer of the model, None if it cannot be loaded (tiktoken downloads
+    encodings on first use).
+    """
+    try:
+        name = tiktoken.model.encoding_name_for_model(model)
+    except KeyError:
+        name = "cl100k_base"
+    try:
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        log.warning(f"No tokenizer for {model}, estimating token counts: {str(e)}")
+        return None
+
+
+def count_tokens(messages: List[Dict[str, str]], model: str) -> int:
+    encoding = get_encoding(model)
+    tokens = 0
+    for message in messages:
+        content = message["content"]
+        if encoding:
+            tokens += len(encoding.encode(content))
+        else:
+            tokens += -(-len(content) // CHARS_PER_TOKEN)
+    return tokens + MESSAGE_OVERHEAD_TOKENS * len(messages)
+
+
+def format_eval(score) -> str:
+    """
+    Compact eval: signed centipawns, or #N / #-N for a mate by White / Black.
+    """
+    if isinstance(score, int):
+        return f"{score:+d}"
+    if isinstance(score, str) and score.startswith("Mate in"):
+        # "Mate in N by White" / "Mate in N by Black"
+        _, _, moves, _, side = score.split()
+        return f"#{moves}" if side == "White" else f"#-{moves}"
+    return "?"
+
+
+def format_movetext(sans: Sequence[str]) -> str:
+    return " ".join(
+        f"{ply // 2 + 1}.{san}" if ply % 2 == 0 else san for ply, san in enumerate(sans)
+    )
+
+
+def prioritise_plies(
+    plies: Sequence[str], critical: Mapping[str, str], context: int
+) -> List[str]:
+    """
+    Orders the plies worth explaining: the critical ones first, then their
+    neighbours up to `context` plies away, nearest first. Without any critical
+    ply every ply is kept, in order.
+    """
+    critical_plies = [ply for ply in plies if ply in critical]
+    if not critical_plies:
+        return list(plies)
+    requested = set(plies)
+    neighbours = (
+        str(int(ply) + offset)
+        for distance in range(1, context + 1)
+        for ply in critical_plies
+        for offset in (-distance, distance)
+    )
+    ordered = dict.fromkeys(critical_plies)
+    ordered.update(dict.fromkeys(ply for ply in neighbours if ply in requested))
+    return list(ordered)
+
+
+def commentary_messages(
+    parsed: pgn_utils.ParsedGame, analysis: list, critical: Mapping[str, str], plies
+) -> List[Dict[str, str]]:
+    headers = " ".join(
+        f'{name}="{parsed.headers[name]}"'
+        for name in PROMPT_HEADERS
+        if name in parsed.headers
+    )
+    # Later moves do not help explain the selected plies
+    movetext = format_movetext(parsed.sans[: int(plies[-1])])
+    lines = []
+    for ply in plies:
+        best_move, score = analysis[int(ply) - 1]
+        san = parsed.sans[int(ply) - 1] if int(ply) <= len(parsed.sans) else "?"
+        mark = "!" if ply in critical else ""
+        lines.append(f"{ply}{mark} {san} {best_move or '-'} {format_eval(score)}")
+    user = "\n".join(filter(None, (headers, movetext, *lines)))
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user},
+    ]
+
+
+def build_commentary_prompt(
+    parsed: pgn_utils.ParsedGame,
+    analysis: list,
+    critical: Mapping[str, str],
+    plies: Sequence[str],
+    model: str,
+    focus_critical: bool = True,
+) -> CommentaryPrompt:
+    """
+    Builds the commentary request of the given plies within the configured
+    token budgets.
+
+    At most COMMENTARY_OUTPUT_TOKENS / COMMENTARY_TOKENS_PER_PLY plies are
+    asked for, so the JSON reply is not cut off, picked by `prioritise_plies`
+    or in order when `focus_critical` is off. Lower priority plies are then
+    dropped until the messages fit in COMMENTARY_INPUT_TOKENS.
+
+    Parameters:
+    - parsed (ParsedGame): The parsed game.
+    - analysis (list): Best move and evaluation after every ply.
+    - critical (Mapping[str, str]): Critical moments, SAN keyed by ply.
+    - plies (Sequence[str]): Plies to explain.
+    - model (str): Model the prompt is for, to count its tokens.
+    - focus_critical (bool): Favour critical plies and their neighbours.
+
+    Returns:
+    - CommentaryPrompt: The messages and the plies they ask about.
+    """
+    limit = max(
+        1,
+        OPENAIConfig.COMMENTARY_OUTPUT_TOKENS // OPENAIConfig.COMMENTARY_TOKENS_PER_PLY,
+    )
+    candidates = list(plies)
+    if focus_critical:
+        candidates = prioritise_plies(
+            plies, critical, OPENAIConfig.COMMENTARY_CONTEXT_PLIES
+        )
+    candidates = candidates[:limit]
+    if not candidates:
+        raise ValueError("No plies to explain")
+
+    for count in range(len(candidates), 0, -1):
+        selected = sorted(candidates[:count], key=int)
+        messages = commentary_messages(parsed, analysis, critical, selected)
+        input_tokens = count_tokens(messages, model)
+        if input_tokens <= OPENAIConfig.COMMENTARY_INPUT_TOKENS:
+            break
+    else:
+        log.warning(f"Commentary prompt of {input_tokens} tokens exceeds the budget")
+    return CommentaryPrompt(
+        messages, selected, input_tokens, OPENAIConfig.COMMENTARY_OUTPUT_TOKENS
+    )
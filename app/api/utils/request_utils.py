@@ -0,0 +1,219 @@
+import asyncio
+import json
+import zlib
+from typing import AsyncIterator, Iterator, Optional
+
+from fastapi import HTTPException, Query, Request
+
+from app.core.config import PGNConfig
+
+# Seconds the client is willing to wait for a response, e.g. "X-Request-Deadline: 2.5"
+DEADLINE_HEADER = "X-Request-Deadline"
+# Seconds between two checks of the client connection
+DISCONNECT_POLL_INTERVAL = 0.5
+# Largest chunk a compressed request body is inflated to at a time
+BODY_CHUNK_SIZE = 64 * 1024
+# Content types of a PGN sent as plain text
+PGN_CONTENT_TYPES = (
+    "text/plain",
+    "application/x-chess-pgn",
+    "application/vnd.chess-pgn",
+)
+
+
+class ClientDisconnected(Exception):
+    """The client closed the connection before the response was ready."""
+
+
+def request_deadline(request: Request) -> Optional[float]:
+    """
+    Event loop time by which the response must be sent, from the optional
+    DEADLINE_HEADER, None without one.
+
+    Raises:
+    - HTTPException: If the header is not a positive number of seconds.
+    """
+    value = request.headers.get(DEADLINE_HEADER)
+    if value is None:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        seconds = 0
+    if not seconds > 0:
+        raise HTTPException(
+            status_code=400, detail=f"{DEADLINE_HEADER} must be a positive number"
+        )
+    return asyncio.get_running_loop().time() + seconds
+
+
+async def wait_while_connected(
+    request: Request, future: asyncio.Future, deadline: float = None
+) -> bool:
+    """
+    Waits for `future` as long as the client is connected, at most until
+    `deadline` (event loop time). The future itself is never cancelled, so it
+    may be shared with other requests.
+
+    Returns:
+    - True once the future is done, False if the deadline passed first.
+
+    Raises:
+    - ClientDisconnected: If the client went away first.
+    """
+    loop = asyncio.get_running_loop()
+    while not future.done():
+        timeout = DISCONNECT_POLL_INTERVAL
+        if deadline is not None:
+            if deadline <= loop.time():
+                return False
+            timeout = min(timeout, deadline - loop.time())
+        await asyncio.wait({future}, timeout=timeout)
+        if not future.done() and await request.is_disconnected():
+            raise ClientDisconnected()
+    return True
+
+
+async def wait_for_request(awaitable, request: Request):
+    """
+    Runs `awaitable` for the lifetime of the request: it is cancelled, and
+    with it any engine search or LLM call it is waiting on, as soon as the
+    client disconnects or the request deadline passes.
+
+    Raises:
+    - ClientDisconnected: If the client went away first.
+    - asyncio.TimeoutError: If the deadline passed first.
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        if not await wait_while_connected(request, task, request_deadline(request)):
+            raise asyncio.TimeoutError()
+        return task.result()
+    finally:
+        task.cancel()
+
+
+class GzipInflater(object):
+    """
+    Decompresses a gzip stream, members included, BODY_CHUNK_SIZE bytes at a
+    time however much a chunk expands.
+    """
+
+    def __init__(self):
+        self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def inflate(self, chunk: bytes) -> Iterator[bytes]:
+        while chunk:
+            if self.decompressor.eof:
+                # The next member of a concatenated gzip file
+                self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            data = self.decompressor.decompress(chunk, BODY_CHUNK_SIZE)
+            # Input left once a member ended is in unused_data
+            chunk = self.decompressor.unconsumed_tail or self.decompressor.unused_data
+            if data:
+                yield data
+
+
+async def inflate_gzip(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    Decompresses a gzip stream with GzipInflater.
+
+    Raises:
+    - HTTPException: If the stream is not valid gzip or is truncated.
+    """
+    inflater = GzipInflater()
+    try:
+        async for chunk in chunks:
+            for data in inflater.inflate(chunk):
+                yield data
+    except zlib.error as e:
+        raise HTTPException(status_code=400, detail=f"Invalid gzip body: {e}")
+    if not inflater.decompressor.eof:
+        raise HTTPException(status_code=400, detail="Truncated gzip body")
+
+
+def body_chunks(request: Request) -> AsyncIterator[bytes]:
+    """
+    Streams the request body, decompressed when it is sent with
+    "Content-Encoding: gzip", without reading it into memory.
+
+    Raises:
+    - HTTPException: 415 for any other content encoding.
+    """
+    encoding = request.headers.get("content-encoding", "identity").lower()
+    if encoding == "gzip":
+        return inflate_gzip(request.stream())
+    if encoding != "identity":
+        raise HTTPException(
+            status_code=415, detail=f"Unsupported content encoding: {encoding}"
+        )
+    return request.stream()
+
+
+async def read_body(request: Request, max_bytes: int) -> bytes:
+    """
+    Reads the request body, decompressed like `body_chunks`, up to
+    `max_bytes` bytes.
+
+    Raises:
+    - HTTPException: 413 as soon as the body is known to be longer, without
+      reading the rest.
+    """
+    too_large = HTTPException(
+        status_code=413, detail=f"Request body larger than {max_bytes} bytes"
+    )
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > max_bytes:
+        raise too_large
+    body = bytearray()
+    async for chunk in body_chunks(request):
+        body += chunk
+        if len(body) > max_bytes:
+            raise too_large
+    return bytes(body)
+
+
+async def read_pgn_body(request: Request) -> str:
+    """
+    Reads a PGN sent as the request body, as plain text (the default) or as
+    a JSON object {"pgn_string": "..."}, optionally gzip-encoded, up to
+    PGN_MAX_BODY_BYTES.
+
+    Raises:
+    - HTTPException: 415 for another content type, 413 for a larger body and
+      400 for a body that is not UTF-8 or not the expected JSON object.
+    """
+    content_type = request.headers.get("content-type", "text/plain")
+    content_type = content_type.split(";")[0].strip().lower()
+    if content_type not in (*PGN_CONTENT_TYPES, "application/json"):
+        raise HTTPException(
+            status_code=415, detail=f"Unsupported content type: {content_type}"
+        )
+    body = await read_body(request, PGNConfig.PGN_MAX_BODY_BYTES)
+    try:
+        if content_type != "application/json":
+            return body.decode("utf-8-sig")
+        pgn_string = json.loads(body)["pgn_string"]
+    except (ValueError, KeyError, TypeError):
+        pgn_string = None
+    if not isinstance(pgn_string, str):
+        raise HTTPException(
+            status_code=400,
+            detail='Expected a UTF-8 PGN or a JSON object {"pgn_string": "..."}',
+        )
+    return pgn_string
+
+
+async def pgn_string_param(
+    request: Request,
+    pgn_string: str = Query(
+        None, description="Deprecated, send the PGN as the request body instead"
+    ),
+) -> str:
+    """
+    Dependency returning the PGN of a request: the `pgn_string` query
+    parameter, kept for existing clients, or else the request body.
+    """
+    if pgn_string is not None:
+        return pgn_string
+    return await read_pgn_body(request)
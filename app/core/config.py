@@ -78,6 +78,157 @@ class OPENAIConfig:
     AZURE_OPENAI_JPEAST_API_BASE: str = env_with_secrets.get(
         "AZURE_OPENAI_JPEAST_API_BASE", ""
     )
+    COMMENTARY_MODEL: str = env_with_secrets.get("COMMENTARY_MODEL", "gpt-3.5-turbo")
+    COMMENTARY_INPUT_TOKENS: int = int(
+        env_with_secrets.get("COMMENTARY_INPUT_TOKENS", "2000")
+    )
+    COMMENTARY_OUTPUT_TOKENS: int = int(
+        env_with_secrets.get("COMMENTARY_OUTPUT_TOKENS", "1000")
+    )
+    COMMENTARY_TOKENS_PER_PLY: int = int(
+        env_with_secrets.get("COMMENTARY_TOKENS_PER_PLY", "50")
+    )
+    COMMENTARY_CONTEXT_PLIES: int = int(
+        env_with_secrets.get("COMMENTARY_CONTEXT_PLIES", "2")
+    )
+    COMMENTARY_MODE: str = env_with_secrets.get("COMMENTARY_MODE", "llm")
+    LOCAL_COMMENTARY_MAX_LOSS: int = int(
+        env_with_secrets.get("LOCAL_COMMENTARY_MAX_LOSS", "20")
+    )
+    COMMENTARY_SEGMENTED: bool = (
+        env_with_secrets.get("COMMENTARY_SEGMENTED", "0") == "1"
+    )
+    COMMENTARY_SEGMENT_PLIES: int = int(
+        env_with_secrets.get("COMMENTARY_SEGMENT_PLIES", "20")
+    )
+    COMMENTARY_CONCURRENCY: int = int(
+        env_with_secrets.get("COMMENTARY_CONCURRENCY", "4")
+    )
+    # Seconds a commentary stream waits for the commentary generated in the
+    # background, polling every COMMENTARY_POLL_INTERVAL seconds
+    COMMENTARY_PENDING_WAIT: float = float(
+        env_with_secrets.get("COMMENTARY_PENDING_WAIT", "120")
+    )
+    COMMENTARY_POLL_INTERVAL: float = float(
+        env_with_secrets.get("COMMENTARY_POLL_INTERVAL", "1")
+    )
+
+
+class LLMConfig:
+    settings = Settings()
+    # Empty uses the OpenAI API; set to point at a compatible server
+    LLM_BASE_URL: str = env_with_secrets.get("LLM_BASE_URL", "")
+    LLM_CONCURRENCY: int = int(env_with_secrets.get("LLM_CONCURRENCY", "8"))
+    LLM_ATTEMPT_TIMEOUT: float = float(
+        env_with_secrets.get("LLM_ATTEMPT_TIMEOUT", "30")
+    )
+    LLM_DEADLINE: float = float(env_with_secrets.get("LLM_DEADLINE", "60"))
+    LLM_MAX_RETRIES: int = int(env_with_secrets.get("LLM_MAX_RETRIES", "2"))
+    LLM_BACKOFF_BASE: float = float(env_with_secrets.get("LLM_BACKOFF_BASE", "0.5"))
+    LLM_BACKOFF_MAX: float = float(env_with_secrets.get("LLM_BACKOFF_MAX", "8"))
+    # Seconds before a duplicate request is sent, 0 disables hedging
+    LLM_HEDGE_AFTER: float = float(env_with_secrets.get("LLM_HEDGE_AFTER", "0"))
+    # Empty means no commentary when the primary model misses its deadline
+    LLM_FALLBACK_MODEL: str = env_with_secrets.get("LLM_FALLBACK_MODEL", "")
+    LLM_FALLBACK_DEADLINE: float = float(
+        env_with_secrets.get("LLM_FALLBACK_DEADLINE", "30")
+    )
+
+
+class StockfishConfig:
+    settings = Settings()
+    STOCKFISH_PATH: str = env_with_secrets.get(
+        "STOCKFISH_PATH", "./stockfish/stockfish-windows-x86-64-avx2.exe"
+    )
+    ENGINE_POOL_SIZE: int = int(env_with_secrets.get("ENGINE_POOL_SIZE", "2"))
+    ENGINE_THREADS: int = int(env_with_secrets.get("ENGINE_THREADS", "1"))
+    ENGINE_HASH_MB: int = int(env_with_secrets.get("ENGINE_HASH_MB", "64"))
+    ANALYSIS_DEPTH: int = int(env_with_secrets.get("ANALYSIS_DEPTH", "20"))
+    ANALYSIS_WORKERS: int = int(env_with_secrets.get("ANALYSIS_WORKERS", "1"))
+    ENGINE_CHECKOUT_TIMEOUT: float = float(
+        env_with_secrets.get("ENGINE_CHECKOUT_TIMEOUT", "30")
+    )
+    # Free engines kept for interactive, then for standard and interactive checkouts
+    ENGINE_RESERVED_INTERACTIVE: int = int(
+        env_with_secrets.get("ENGINE_RESERVED_INTERACTIVE", "1")
+    )
+    ENGINE_RESERVED_STANDARD: int = int(
+        env_with_secrets.get("ENGINE_RESERVED_STANDARD", "0")
+    )
+    # Seconds of waiting that move a checkout up one priority class, 0 for never
+    ENGINE_AGING_SECONDS: float = float(
+        env_with_secrets.get("ENGINE_AGING_SECONDS", "10")
+    )
+    # "fixed" searches every ply to ANALYSIS_DEPTH, "adaptive" sweeps every ply
+    # at ADAPTIVE_SWEEP_DEPTH and re-searches the eval swings at ANALYSIS_DEPTH
+    ANALYSIS_MODE: str = env_with_secrets.get("ANALYSIS_MODE", "fixed")
+    ADAPTIVE_SWEEP_DEPTH: int = int(env_with_secrets.get("ADAPTIVE_SWEEP_DEPTH", "10"))
+    ADAPTIVE_NEIGHBOURS: int = int(env_with_secrets.get("ADAPTIVE_NEIGHBOURS", "1"))
+    # Per game budgets of the adaptive mode, 0 for none
+    ADAPTIVE_TIME_BUDGET: float = float(
+        env_with_secrets.get("ADAPTIVE_TIME_BUDGET", "0")
+    )
+    ADAPTIVE_NODE_BUDGET: int = int(env_with_secrets.get("ADAPTIVE_NODE_BUDGET", "0"))
+
+
+class JobConfig:
+    settings = Settings()
+    JOB_WORKERS: int = int(env_with_secrets.get("JOB_WORKERS", "2"))
+    JOB_QUEUE_SIZE: int = int(env_with_secrets.get("JOB_QUEUE_SIZE", "100"))
+    JOB_TTL: int = int(env_with_secrets.get("JOB_TTL", str(7 * 86400)))
+    # Expected job duration until the first jobs finish, for Retry-After
+    JOB_EXPECTED_SECONDS: float = float(
+        env_with_secrets.get("JOB_EXPECTED_SECONDS", "30")
+    )
+
+
+class PGNConfig:
+    settings = Settings()
+    PGN_MAX_LENGTH: int = int(env_with_secrets.get("PGN_MAX_LENGTH", str(256 * 1024)))
+    # Largest PGN request body once decompressed, JSON escaping included
+    PGN_MAX_BODY_BYTES: int = int(
+        env_with_secrets.get("PGN_MAX_BODY_BYTES", str(512 * 1024))
+    )
+    # Games saved per insert_many of an uploaded PGN file
+    PGN_UPLOAD_BATCH_SIZE: int = int(
+        env_with_secrets.get("PGN_UPLOAD_BATCH_SIZE", "200")
+    )
+    # Invalid games of an upload reported in the response
+    PGN_UPLOAD_MAX_ERRORS: int = int(
+        env_with_secrets.get("PGN_UPLOAD_MAX_ERRORS", "20")
+    )
+
+
+class CacheConfig:
+    settings = Settings()
+    EVAL_CACHE_ENABLED: bool = env_with_secrets.get("EVAL_CACHE_ENABLED", "1") == "1"
+    EVAL_CACHE_TTL: int = int(env_with_secrets.get("EVAL_CACHE_TTL", str(7 * 86400)))
+    EVAL_CACHE_PREFIX: str = env_with_secrets.get("EVAL_CACHE_PREFIX", "eval:v1")
+    FEN_INDEX_LRU_SIZE: int = int(env_with_secrets.get("FEN_INDEX_LRU_SIZE", "512"))
+    COMMENTARY_CACHE_ENABLED: bool = (
+        env_with_secrets.get("COMMENTARY_CACHE_ENABLED", "1") == "1"
+    )
+    COMMENTARY_CACHE_TTL: int = int(
+        env_with_secrets.get("COMMENTARY_CACHE_TTL", str(30 * 86400))
+    )
+    COMMENTARY_CACHE_PREFIX: str = env_with_secrets.get(
+        "COMMENTARY_CACHE_PREFIX", "commentary:v1"
+    )
+    COMMENTARY_CACHE_MAX_BYTES: int = int(
+        env_with_secrets.get("COMMENTARY_CACHE_MAX_BYTES", str(64 * 1024))
+    )
+    POSITION_COMMENTARY_ENABLED: bool = (
+        env_with_secrets.get("POSITION_COMMENTARY_ENABLED", "1") == "1"
+    )
+    POSITION_COMMENTARY_PLIES: int = int(
+        env_with_secrets.get("POSITION_COMMENTARY_PLIES", "16")
+    )
+    POSITION_COMMENTARY_TTL: int = int(
+        env_with_secrets.get("POSITION_COMMENTARY_TTL", str(90 * 86400))
+    )
+    POSITION_COMMENTARY_PREFIX: str = env_with_secrets.get(
+        "POSITION_COMMENTARY_PREFIX", "poscomment:v1"
+    )
 
 
 class RedisConfig:
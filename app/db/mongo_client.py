@@ -2,7 +2,7 @@
 
 import asyncio
 import logging
-from typing import Dict, Optional, Union
+from typing import Dict, List, Optional, Union
 
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorClientSession
 from pymongo import results
@@ -141,6 +141,31 @@ class ZuMongoClient(object):
                 "Unexpected exception", str(e), "Internal Server Error"
             )
 
+    @classmethod
+    async def insert_many(
+        cls,
+        col: str,
+        insert_data: List[Dict],
+        ordered: bool = True,
+        db: str = MongoConfig.MONGO_PROD_DATABASE,
+        session: AsyncIOMotorClientSession = None,
+        handle_exception: bool = True,
+        **kwargs,
+    ) -> results.InsertManyResult:
+        cls.__check_if_database_present(db)
+        try:
+            return await cls.databases[db][col].insert_many(
+                documents=insert_data, ordered=ordered, session=session, **kwargs
+            )
+        except Exception as e:
+            if not handle_exception:
+                raise e
+            if session:
+                session.abort_transaction()
+            exception_utils.log_and_raise_exception(
+                "Unexpected exception", str(e), "Internal Server Error"
+            )
+
     @classmethod
     async def delete_one(
         cls,
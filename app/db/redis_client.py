@@ -310,3 +310,126 @@ class ZuRedisClient(object):
                 exc_info=(type(ex), ex, ex.__traceback__),
             )
             raise ex
+
+    @classmethod
+    async def mget(cls, keys) -> list:
+        """Execute Redis MGET command.
+
+        Returns the values of all specified keys. For every key that does not
+        hold a string value or does not exist, the special value None is
+        returned.
+
+        Args:
+            keys (list): Redis db keys.
+
+        Returns:
+            response (list): Values of the keys, in the same order as requested.
+
+        Raises:
+            aioredis.RedisError: If Redis client failed while executing command.
+
+        """
+        redis_client = cls.redis_client
+
+        cls.log.debug("Preform Redis MGET command, keys: {}".format(len(keys)))
+        try:
+            return await redis_client.mget(keys)
+        except RedisError as ex:
+            cls.log.exception(
+                "Redis MGET command finished with exception",
+                exc_info=(type(ex), ex, ex.__traceback__),
+            )
+            raise ex
+
+    @classmethod
+    async def incrby_many(cls, amounts: dict) -> list:
+        """Execute Redis INCRBY commands in one pipeline.
+
+        Increments the number stored at every key by its amount, with a single
+        round trip to the server.
+
+        Args:
+            amounts (dict): Value to add, keyed by Redis db key.
+
+        Returns:
+            response (list): Values of the keys after the increments.
+
+        Raises:
+            aioredis.RedisError: If Redis client failed while executing command.
+
+        """
+        redis_client = cls.redis_client
+
+        cls.log.debug("Preform Redis INCRBY pipeline, keys: {}".format(len(amounts)))
+        try:
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for key, amount in amounts.items():
+                    pipe.incrby(key, amount)
+                return await pipe.execute()
+        except RedisError as ex:
+            cls.log.exception(
+                "Redis INCRBY pipeline finished with exception",
+                exc_info=(type(ex), ex, ex.__traceback__),
+            )
+            raise ex
+
+    @classmethod
+    async def eval(cls, script: str, keys: list, args: list):
+        """Execute Redis EVAL command.
+
+        Runs a Lua script on the server, atomically with respect to other
+        commands.
+
+        Args:
+            script (str): Lua script.
+            keys (list): Redis db keys, available to the script as KEYS.
+            args (list): Further arguments, available to the script as ARGV.
+
+        Returns:
+            response: Value returned by the script.
+
+        Raises:
+            aioredis.RedisError: If Redis client failed while executing command.
+
+        """
+        redis_client = cls.redis_client
+
+        cls.log.debug("Preform Redis EVAL command, keys: {}".format(len(keys)))
+        try:
+            return await redis_client.eval(script, len(keys), *keys, *args)
+        except RedisError as ex:
+            cls.log.exception(
+                "Redis EVAL command finished with exception",
+                exc_info=(type(ex), ex, ex.__traceback__),
+            )
+            raise ex
+
+    @classmethod
+    async def incrby(cls, key, amount: int = 1) -> int:
+        """Execute Redis INCRBY command.
+
+        Increments the number stored at key by amount. If the key does not
+        exist, it is set to 0 before performing the operation.
+
+        Args:
+            key (str): Redis db key.
+            amount (int): Value to add.
+
+        Returns:
+            response (int): Value of key after the increment.
+
+        Raises:
+            aioredis.RedisError: If Redis client failed while executing command.
+
+        """
+        redis_client = cls.redis_client
+
+        cls.log.debug("Preform Redis INCRBY command, key: {}".format(key))
+        try:
+            return await redis_client.incrby(key, amount)
+        except RedisError as ex:
+            cls.log.exception(
+                "Redis INCRBY command finished with exception",
+                exc_info=(type(ex), ex, ex.__traceback__),
+            )
+            raise ex
@@ -0,0 +1,313 @@
+"""Stockfish engine pool utility."""
+
+import asyncio
+import contextlib
+import itertools
+import logging
+from enum import IntEnum
+from typing import Dict, List, NamedTuple, Optional
+
+import chess
+import chess.engine
+from fastapi import HTTPException
+
+from app.api.utils import exception_utils
+from app.core.config import StockfishConfig
+
+
+class PooledEngine(object):
+    """Stockfish process checked out of the pool.
+
+    Every checkout gets a fresh game token, so python-chess sends
+    ``ucinewgame`` before the first search of the lease and the engine does
+    not carry hash entries or history over from the previous caller.
+
+    Attributes:
+        transport (asyncio.SubprocessTransport): The engine subprocess.
+        engine (chess.engine.UciProtocol): Asyncio UCI protocol of the engine.
+        game (object): Game token passed with every search of this lease.
+
+    """
+
+    def __init__(
+        self,
+        transport: asyncio.SubprocessTransport,
+        engine: chess.engine.UciProtocol,
+    ):
+        self.transport = transport
+        self.engine = engine
+        self.game = object()
+
+    def new_game(self):
+        """Start a new game on the next search."""
+        self.game = object()
+
+    async def analyse(
+        self, board: chess.Board, limit: chess.engine.Limit, **kwargs
+    ) -> chess.engine.InfoDict:
+        return await self.engine.analyse(board, limit, game=self.game, **kwargs)
+
+    async def quit(self):
+        try:
+            await asyncio.wait_for(self.engine.quit(), timeout=5)
+        except Exception:
+            self.transport.close()
+
+
+class EnginePriority(IntEnum):
+    """Scheduling class of an engine checkout, most urgent first."""
+
+    INTERACTIVE = 0
+    STANDARD = 1
+    BULK = 2
+
+
+class EngineWaiter(NamedTuple):
+    """A checkout waiting for a free engine."""
+
+    priority: EnginePriority
+    since: float
+    sequence: int
+    future: asyncio.Future
+
+
+class ZuEnginePool(object):
+    """Define Stockfish engine pool.
+
+    Keeps ``ENGINE_POOL_SIZE`` Stockfish processes running for the lifetime of
+    the app so analyses reuse warm engines instead of spawning one per call.
+    Engines are driven through python-chess's asyncio UCI protocol, so a
+    search never blocks the event loop.
+
+    Free engines go to the most urgent waiting checkout, oldest first. The
+    last ``ENGINE_RESERVED_INTERACTIVE`` free engines are kept for interactive
+    checkouts, and the last ``ENGINE_RESERVED_STANDARD`` before those for
+    standard and interactive ones. A checkout moves up one class for every
+    ``ENGINE_AGING_SECONDS`` it waits, so bulk work cannot starve.
+
+    Attributes:
+        engines (list): All engine processes owned by the pool.
+        idle (list, optional): Engines currently available.
+        waiters (list): Checkouts waiting for an engine.
+        engine_id (str): Name reported by the engine, e.g. ``Stockfish 16``.
+        log (logging.Logger): Logging handler for this class.
+
+    """
+
+    engines: List[PooledEngine] = []
+    idle: Optional[List[PooledEngine]] = None
+    waiters: List[EngineWaiter] = []
+    sequence = itertools.count()
+    promotion: Optional[asyncio.TimerHandle] = None
+    engine_id: str = ""
+    log: logging.Logger = logging.getLogger(__name__)
+
+    @classmethod
+    async def _popen_engine(cls) -> PooledEngine:
+        transport, engine = await chess.engine.popen_uci(StockfishConfig.STOCKFISH_PATH)
+        await engine.configure(
+            {
+                "Threads": StockfishConfig.ENGINE_THREADS,
+                "Hash": StockfishConfig.ENGINE_HASH_MB,
+            }
+        )
+        return PooledEngine(transport, engine)
+
+    @classmethod
+    async def open_engine_pool(cls, size: int = None):
+        """Start the engine processes.
+
+        Args:
+            size (int, optional): Number of engines. Defaults to
+                ``StockfishConfig.ENGINE_POOL_SIZE``.
+
+        """
+        if cls.idle is not None:
+            return
+        size = size or StockfishConfig.ENGINE_POOL_SIZE
+        cls.idle = []
+        cls.waiters = []
+        for _ in range(size):
+            try:
+                pooled = await cls._popen_engine()
+            except Exception as e:
+                cls.log.exception(f"Failed to start Stockfish engine: {str(e)}")
+                continue
+            cls.engines.append(pooled)
+            cls.idle.append(pooled)
+            cls.engine_id = pooled.engine.id.get("name", "")
+        cls.log.debug(f"Engine pool opened with {len(cls.engines)} engines")
+
+    @classmethod
+    async def close_engine_pool(cls):
+        if cls.idle is None:
+            return
+        cls.log.debug("Closing engine pool")
+        for waiter in cls.waiters:
+            if not waiter.future.done():
+                waiter.future.set_exception(
+                    HTTPException(status_code=503, detail="Chess engine unavailable")
+                )
+        if cls.promotion is not None:
+            cls.promotion.cancel()
+        await asyncio.gather(*(pooled.quit() for pooled in cls.engines))
+        cls.engines = []
+        cls.idle = None
+        cls.waiters = []
+
+    @classmethod
+    async def _replace(cls, pooled: PooledEngine) -> Optional[PooledEngine]:
+        cls.engines.remove(pooled)
+        pooled.transport.close()
+        try:
+            fresh = await cls._popen_engine()
+        except Exception as e:
+            cls.log.exception(f"Failed to restart Stockfish engine: {str(e)}")
+            return None
+        cls.engines.append(fresh)
+        return fresh
+
+    @classmethod
+    def _reserved_above(cls, priority: EnginePriority) -> int:
+        """Free engines a checkout of `priority` must leave to more urgent ones."""
+        reserved = {
+            EnginePriority.INTERACTIVE: 0,
+            EnginePriority.STANDARD: StockfishConfig.ENGINE_RESERVED_INTERACTIVE,
+            EnginePriority.BULK: StockfishConfig.ENGINE_RESERVED_INTERACTIVE
+            + StockfishConfig.ENGINE_RESERVED_STANDARD,
+        }[priority]
+        # Every class can use at least one engine
+        return min(reserved, len(cls.engines) - 1)
+
+    @classmethod
+    def _effective_priority(cls, waiter: EngineWaiter, now: float) -> EnginePriority:
+        aging = StockfishConfig.ENGINE_AGING_SECONDS
+        promotions = int((now - waiter.since) // aging) if aging > 0 else 0
+        return EnginePriority(max(0, waiter.priority - promotions))
+
+    @classmethod
+    def _dispatch(cls):
+        """Hand free engines to the most urgent waiters they may go to."""
+        now = asyncio.get_running_loop().time()
+        cls.waiters = [waiter for waiter in cls.waiters if not waiter.future.done()]
+        while cls.idle and cls.waiters:
+            waiter = min(
+                cls.waiters,
+                key=lambda w: (cls._effective_priority(w, now), w.sequence),
+            )
+            priority = cls._effective_priority(waiter, now)
+            if len(cls.idle) <= cls._reserved_above(priority):
+                cls._dispatch_on_promotion(waiter, now)
+                return
+            cls.waiters.remove(waiter)
+            waiter.future.set_result(cls.idle.pop())
+
+    @classmethod
+    def _dispatch_on_promotion(cls, waiter: EngineWaiter, now: float):
+        """Dispatch again when `waiter` moves up a class, as reserved engines
+        may sit idle until then.
+        """
+        aging = StockfishConfig.ENGINE_AGING_SECONDS
+        if aging <= 0 or cls._effective_priority(waiter, now) == 0:
+            return
+        if cls.promotion is not None:
+            cls.promotion.cancel()
+        delay = aging - (now - waiter.since) % aging
+        cls.promotion = asyncio.get_running_loop().call_later(delay, cls._dispatch)
+
+    @classmethod
+    def is_wanted(cls, priority: EnginePriority) -> bool:
+        """Whether a more urgent checkout is waiting for an engine, so a long
+        running holder of `priority` should hand its engine back.
+        """
+        now = asyncio.get_running_loop().time()
+        return any(
+            cls._effective_priority(waiter, now) < priority
+            for waiter in cls.waiters
+            if not waiter.future.done()
+        )
+
+    @classmethod
+    async def _acquire(cls, priority: EnginePriority, timeout: Optional[float]):
+        loop = asyncio.get_running_loop()
+        waiter = EngineWaiter(
+            priority, loop.time(), next(cls.sequence), loop.create_future()
+        )
+        cls.waiters.append(waiter)
+        cls._dispatch()
+        try:
+            return await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+        except asyncio.CancelledError:
+            cls._abandon(waiter)
+            raise
+        except asyncio.TimeoutError:
+            cls._abandon(waiter)
+            exception_utils.raise_exception("Chess engine busy, try again", 503)
+
+    @classmethod
+    def _abandon(cls, waiter: EngineWaiter):
+        if waiter.future.done() and not waiter.future.cancelled():
+            # The engine was handed over just as the wait ended
+            cls._release(waiter.future.result())
+        waiter.future.cancel()
+
+    @classmethod
+    def _release(cls, pooled: PooledEngine):
+        if cls.idle is None:
+            return
+        cls.idle.append(pooled)
+        cls._dispatch()
+
+    @classmethod
+    @contextlib.asynccontextmanager
+    async def checkout(
+        cls,
+        timeout: float = None,
+        priority: EnginePriority = EnginePriority.STANDARD,
+    ):
+        """Borrow an engine for the duration of the ``async with`` block.
+
+        The engine goes back to the pool on exit. An engine that died during
+        the lease is replaced by a fresh process.
+
+        Args:
+            timeout (float, optional): Seconds to wait for a free engine.
+                Defaults to ``StockfishConfig.ENGINE_CHECKOUT_TIMEOUT``, bulk
+                checkouts wait as long as it takes.
+            priority (EnginePriority): Scheduling class of the checkout.
+
+        Yields:
+            PooledEngine: The checked out engine.
+
+        Raises:
+            HTTPException: If the pool is closed, empty or exhausted.
+
+        """
+        if not cls.engines:
+            exception_utils.raise_exception("Chess engine unavailable", 503)
+        if timeout is None and priority != EnginePriority.BULK:
+            timeout = StockfishConfig.ENGINE_CHECKOUT_TIMEOUT
+        pooled = await cls._acquire(priority, timeout)
+
+        pooled.new_game()
+        try:
+            yield pooled
+        except chess.engine.EngineTerminatedError:
+            pooled = await cls._replace(pooled)
+            raise
+        finally:
+            if pooled is not None:
+                cls._release(pooled)
+
+    @classmethod
+    def stats(cls) -> Dict:
+        """Engine usage, and the checkouts waiting per scheduling class."""
+        waiting = {priority.name.lower(): 0 for priority in EnginePriority}
+        for waiter in cls.waiters:
+            if not waiter.future.done():
+                waiting[waiter.priority.name.lower()] += 1
+        return {
+            "engines": len(cls.engines),
+            "idle": len(cls.idle or []),
+            "waiting": waiting,
+        }
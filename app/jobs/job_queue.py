@@ -0,0 +1,215 @@
+"""Asynchronous job queue utility."""
+
+import asyncio
+import logging
+import math
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from app.api.utils import exception_utils
+from app.core.config import JobConfig
+from app.core.mongo_config import MongoConfig
+from app.db.mongo_client import ZuMongoClient
+from app.models.job import JobStatus
+
+
+class ZuJobQueue(object):
+    """Define the in-process job queue.
+
+    Submitted jobs wait in a bounded asyncio queue that ``JOB_WORKERS`` worker
+    tasks drain, so a burst of submissions cannot start more work at once than
+    the workers allow. A full queue rejects submissions with a 429. The status
+    and result of every job are stored in the ``jobs`` collection, so any app
+    process can report on any job. Jobs still queued when the process stops are
+    lost, and expire from the collection after ``JOB_TTL`` seconds.
+
+    Attributes:
+        collection (str): Mongo collection of the jobs.
+        queue (asyncio.Queue, optional): Jobs waiting for a worker.
+        workers (list): The worker tasks.
+        stopping (bool): Whether the workers are being cancelled.
+        average_seconds (float): Moving average of the job durations.
+        log (logging.Logger): Logging handler for this class.
+
+    """
+
+    collection: str = "jobs"
+    queue: Optional[asyncio.Queue] = None
+    workers: List[asyncio.Task] = []
+    stopping: bool = False
+    average_seconds: float = JobConfig.JOB_EXPECTED_SECONDS
+    log: logging.Logger = logging.getLogger(__name__)
+
+    @classmethod
+    async def ensure_indexes(cls):
+        for keys, options in (
+            ("id", {"unique": True}),
+            ("expires_at", {"expireAfterSeconds": 0}),
+        ):
+            await ZuMongoClient.call_func(
+                "create_index",
+                db=MongoConfig.MONGO_PROD_DATABASE,
+                col=cls.collection,
+                keys=keys,
+                **options,
+            )
+
+    @classmethod
+    async def start(cls, workers: int = None):
+        """Start the worker tasks.
+
+        Args:
+            workers (int, optional): Number of workers. Defaults to
+                ``JobConfig.JOB_WORKERS``.
+
+        """
+        if cls.queue is not None:
+            return
+        cls.queue = asyncio.Queue(maxsize=JobConfig.JOB_QUEUE_SIZE)
+        cls.workers = [
+            asyncio.ensure_future(cls._work())
+            for _ in range(workers or JobConfig.JOB_WORKERS)
+        ]
+        cls.log.debug(f"Job queue started with {len(cls.workers)} workers")
+
+    @classmethod
+    async def stop(cls):
+        if cls.queue is None:
+            return
+        cls.stopping = True
+        for worker in cls.workers:
+            worker.cancel()
+        await asyncio.gather(*cls.workers, return_exceptions=True)
+        cls.workers = []
+        cls.queue = None
+        cls.stopping = False
+
+    @classmethod
+    def retry_after(cls) -> int:
+        """Seconds until the queue has room again, estimated from recent jobs."""
+        waves = cls.queue.qsize() / max(1, len(cls.workers))
+        return max(1, math.ceil(waves * cls.average_seconds))
+
+    @classmethod
+    async def submit(
+        cls, kind: str, handler: Callable[..., Awaitable[Any]], **kwargs
+    ) -> str:
+        """Queue a job.
+
+        Args:
+            kind (str): Name of the job type, stored with the job.
+            handler (Callable): Coroutine function running the job; its return
+                value is stored as the job result.
+            **kwargs: Arguments of the handler.
+
+        Returns:
+            str: The job id.
+
+        Raises:
+            HTTPException: 503 if the queue is not running, 429 with a
+                Retry-After header if it is full.
+
+        """
+        if cls.queue is None:
+            exception_utils.raise_exception("Job queue unavailable", 503)
+        if cls.queue.full():
+            cls._reject()
+        now = datetime.utcnow()
+        job_id = uuid.uuid4().hex
+        await ZuMongoClient.insert_one(
+            col=cls.collection,
+            insert_data={
+                "id": job_id,
+                "kind": kind,
+                "status": JobStatus.QUEUED.value,
+                "created_at": now,
+                "expires_at": now + timedelta(seconds=JobConfig.JOB_TTL),
+            },
+        )
+        try:
+            cls.queue.put_nowait((job_id, handler, kwargs))
+        except asyncio.QueueFull:
+            # Filled up while the job was being stored
+            await ZuMongoClient.delete_one(
+                col=cls.collection, filter_data={"id": job_id}
+            )
+            cls._reject()
+        return job_id
+
+    @classmethod
+    def _reject(cls):
+        raise HTTPException(
+            status_code=429,
+            detail="Too many queued jobs, try again later",
+            headers={"Retry-After": str(cls.retry_after())},
+        )
+
+    @classmethod
+    async def get(cls, job_id: str) -> Optional[Dict]:
+        return await ZuMongoClient.find_one(
+            col=cls.collection,
+            filter_data={"id": job_id},
+            project={"_id": 0, "expires_at": 0},
+        )
+
+    @classmethod
+    async def _set(cls, job_id: str, **fields):
+        try:
+            await ZuMongoClient.update_one(
+                col=cls.collection,
+                filter_data={"id": job_id},
+                update_data={"$set": fields},
+                handle_exception=False,
+            )
+        except Exception as e:
+            cls.log.exception(f"Failed to update job {job_id}: {str(e)}")
+
+    @classmethod
+    async def _fail(cls, job_id: str, error: str):
+        await cls._set(
+            job_id,
+            status=JobStatus.FAILED.value,
+            error=error,
+            finished_at=datetime.utcnow(),
+        )
+
+    @classmethod
+    async def _work(cls):
+        while True:
+            job: Tuple[str, Callable, Dict] = await cls.queue.get()
+            try:
+                await cls._run(*job)
+            finally:
+                cls.queue.task_done()
+
+    @classmethod
+    async def _run(cls, job_id: str, handler: Callable, kwargs: Dict):
+        start = time.perf_counter()
+        await cls._set(
+            job_id, status=JobStatus.RUNNING.value, started_at=datetime.utcnow()
+        )
+        try:
+            result = await handler(**kwargs)
+        except asyncio.CancelledError:
+            if cls.stopping:
+                raise
+            # Work the handler waited on was cancelled; the worker goes on
+            cls.log.warning(f"Job {job_id} cancelled")
+            await cls._fail(job_id, "Cancelled")
+            return
+        except Exception as e:
+            cls.log.exception(f"Job {job_id} failed: {str(e)}")
+            await cls._fail(job_id, str(e))
+            return
+        await cls._set(
+            job_id,
+            status=JobStatus.DONE.value,
+            result=result,
+            finished_at=datetime.utcnow(),
+        )
+        seconds = time.perf_counter() - start
+        cls.average_seconds = 0.8 * cls.average_seconds + 0.2 * seconds
@@ -0,0 +1,186 @@
+"""LLM gateway utility."""
+
+import asyncio
+import logging
+import random
+from typing import AsyncIterator, Dict, List, Optional, Set
+
+import openai
+from openai import AsyncOpenAI
+
+from app.core.config import LLMConfig, OPENAIConfig
+
+# Errors worth another attempt; anything else (auth, bad request) is raised
+RETRYABLE_ERRORS = (
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+class ZuLLMGateway(object):
+    """Shared chat completion client with deadlines, retries and hedging.
+
+    Every request holds the process-wide semaphore while it is in flight, so
+    at most ``LLMConfig.LLM_CONCURRENCY`` requests reach the upstream at once.
+    A call retries connection errors, timeouts, rate limits and 5xx responses
+    with full-jitter exponential backoff, and may send a hedged duplicate
+    request when the first one is slower than ``LLMConfig.LLM_HEDGE_AFTER``.
+    When the whole call misses its deadline it falls back to
+    ``LLMConfig.LLM_FALLBACK_MODEL``, then to no reply.
+
+    Attributes:
+        client (AsyncOpenAI): OpenAI compatible client, without retries of its own.
+        semaphore (asyncio.Semaphore): Caps the requests in flight.
+
+    """
+
+    client: AsyncOpenAI = AsyncOpenAI(
+        api_key=OPENAIConfig.OPENAI_KEY,
+        base_url=LLMConfig.LLM_BASE_URL or None,
+        timeout=LLMConfig.LLM_ATTEMPT_TIMEOUT,
+        max_retries=0,
+    )
+    semaphore: Optional[asyncio.Semaphore] = None
+    log: logging.Logger = logging.getLogger(__name__)
+
+    @classmethod
+    def get_semaphore(cls) -> asyncio.Semaphore:
+        if cls.semaphore is None:
+            cls.semaphore = asyncio.Semaphore(LLMConfig.LLM_CONCURRENCY)
+        return cls.semaphore
+
+    @classmethod
+    async def _create(cls, **kwargs):
+        async with cls.get_semaphore():
+            return await cls.client.chat.completions.create(**kwargs)
+
+    @classmethod
+    async def _first_success(cls, tasks: Set[asyncio.Task]):
+        error = None
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+
+    @classmethod
+    async def _hedged(cls, hedge_after: float, **kwargs):
+        """Send the request, and a duplicate if no reply came within `hedge_after`
+        seconds. The first successful reply wins; the other request is cancelled.
+        """
+        if not hedge_after:
+            return await cls._create(**kwargs)
+        first = asyncio.ensure_future(cls._create(**kwargs))
+        done, _ = await asyncio.wait({first}, timeout=hedge_after)
+        if done:
+            return first.result()
+        cls.log.info(f"Hedging {kwargs.get('model')} request after {hedge_after}s")
+        second = asyncio.ensure_future(cls._create(**kwargs))
+        try:
+            return await cls._first_success({first, second})
+        finally:
+            first.cancel()
+            second.cancel()
+
+    @classmethod
+    async def _with_retries(cls, hedge_after: float, **kwargs):
+        for attempt in range(LLMConfig.LLM_MAX_RETRIES + 1):
+            try:
+                return await cls._hedged(hedge_after, **kwargs)
+            except RETRYABLE_ERRORS as e:
+                if attempt == LLMConfig.LLM_MAX_RETRIES:
+                    raise e
+                backoff = min(
+                    LLMConfig.LLM_BACKOFF_MAX, LLMConfig.LLM_BACKOFF_BASE * 2**attempt
+                )
+                cls.log.warning(f"LLM request failed, retrying: {e!r}")
+                await asyncio.sleep(random.uniform(0, backoff))
+
+    @classmethod
+    def _models(cls, model: str, deadline: float, fallback_model: str):
+        """Models to ask in turn, with the deadline of each."""
+        models = [(model, deadline or LLMConfig.LLM_DEADLINE)]
+        if fallback_model is None:
+            fallback_model = LLMConfig.LLM_FALLBACK_MODEL
+        if fallback_model:
+            models.append((fallback_model, LLMConfig.LLM_FALLBACK_DEADLINE))
+        return models
+
+    @classmethod
+    async def chat(
+        cls,
+        messages: List[Dict[str, str]],
+        model: str,
+        max_tokens: int,
+        deadline: float = None,
+        hedge_after: float = None,
+        fallback_model: str = None,
+    ) -> Optional[str]:
+        """Return the reply of a chat completion.
+
+        Args:
+            messages (list): Chat messages.
+            model (str): Model to ask first.
+            max_tokens (int): Completion token budget.
+            deadline (float, optional): Seconds the primary model has, retries
+                included. Defaults to LLMConfig.LLM_DEADLINE.
+            hedge_after (float, optional): Seconds before a hedged duplicate is
+                sent, 0 disables hedging. Defaults to LLMConfig.LLM_HEDGE_AFTER.
+            fallback_model (str, optional): Model asked when the primary one
+                fails or misses its deadline, empty for none. Defaults to
+                LLMConfig.LLM_FALLBACK_MODEL.
+
+        Returns:
+            str: The reply, None if no model replied in time.
+
+        Raises:
+            openai.APIError: On errors a retry cannot fix.
+
+        """
+        if hedge_after is None:
+            hedge_after = LLMConfig.LLM_HEDGE_AFTER
+        for model_name, model_deadline in cls._models(model, deadline, fallback_model):
+            try:
+                response = await asyncio.wait_for(
+                    cls._with_retries(
+                        hedge_after,
+                        model=model_name,
+                        messages=messages,
+                        max_tokens=max_tokens,
+                    ),
+                    model_deadline,
+                )
+                return response.choices[0].message.content
+            except (asyncio.TimeoutError, *RETRYABLE_ERRORS) as e:
+                cls.log.warning(f"No reply from {model_name}: {e!r}")
+        return None
+
+    @classmethod
+    async def stream(
+        cls,
+        messages: List[Dict[str, str]],
+        model: str,
+        max_tokens: int,
+        deadline: float = None,
+    ) -> AsyncIterator[str]:
+        """Yield the text of a streamed chat completion as it arrives.
+
+        The stream must start within `deadline` seconds (defaults to
+        LLMConfig.LLM_DEADLINE); after that every chunk must arrive within the
+        client timeout. Streams are not retried or hedged, since part of the
+        reply may already have been forwarded.
+
+        """
+        async with cls.get_semaphore():
+            stream = await asyncio.wait_for(
+                cls.client.chat.completions.create(
+                    model=model, messages=messages, max_tokens=max_tokens, stream=True
+                ),
+                deadline or LLMConfig.LLM_DEADLINE,
+            )
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
@@ -19,11 +19,16 @@ from starlette.requests import Request
 from starlette.responses import JSONResponse
 
 from app.api import api
-from app.core.config import auth_jwt_settings, env_with_secrets, settings
+from app.api.utils import chess_utils, request_utils
+from app.api.utils.cache_utils import CommentaryCache
+from app.core.config import RedisConfig, auth_jwt_settings, env_with_secrets, settings
 from app.core.docs_config import set_custom_openapi
 from app.core.log_config import setup_logging
 from app.core.mongo_config import MongoConfig
 from app.db.mongo_client import ZuMongoClient
+from app.db.redis_client import ZuRedisClient
+from app.engine.engine_pool import ZuEnginePool
+from app.jobs.job_queue import ZuJobQueue
 
 app = FastAPI(title=settings.PROJECT_NAME, description=settings.PROJECT_DESCRIPTION)
 
@@ -33,6 +38,8 @@ setup_logging(json_logs=LOG_JSON_FORMAT, log_level=LOG_LEVEL)
 access_logger = structlog.stdlib.get_logger("api.access")
 error_logger = structlog.get_logger("api.error")
 default_logger = structlog.get_logger("default")
+# Query parameters kept out of logs and APM events: a PGN can be several KB
+REDACTED_QUERY_PARAMS = ("pgn_string",)
 
 set_custom_openapi(app)
 
@@ -74,11 +81,25 @@ app.include_router(api.api_router)
 async def startup():
     await ZuMongoClient.open_mongo_client()
     await ZuMongoClient.open_database(MongoConfig.MONGO_PROD_DATABASE)
+    await chess_utils.ensure_indexes()
+    await CommentaryCache.ensure_indexes()
+    if RedisConfig.REDIS_HOST:
+        ZuRedisClient.open_redis_client()
+    await ZuEnginePool.open_engine_pool()
+    await ZuJobQueue.ensure_indexes()
+    await ZuJobQueue.start()
 
 
 @app.on_event("shutdown")
 async def shutdown():
+    await ZuJobQueue.stop()
     await ZuMongoClient.close_mongo_client()
+    await ZuRedisClient.close_redis_client()
+    await ZuEnginePool.close_engine_pool()
+
+
+def loggable_url(request: Request) -> str:
+    return str(request.url.remove_query_params(REDACTED_QUERY_PARAMS))
 
 
 @app.exception_handler(AuthJWTException)
@@ -88,7 +109,7 @@ def authjwt_exception_handler(request: Request, exc: AuthJWTException) -> JSONRe
         f"An unhandled authjwt exception occurred {str(exc)} {exc.message}",  # type: ignore
         exc_info=True,
         http={
-            "url": str(request.get("url", "")),
+            "url": loggable_url(request),
             "path": str(request.get("path", "")),
             "method": request.get("method", ""),
             "type": request.get("type", ""),
@@ -113,7 +134,7 @@ async def value_error_exception_handler(
         f"An unhandled exception occurred {str(exc)}",
         exc_info=True,
         http={
-            "url": str(request.get("url", "")),
+            "url": loggable_url(request),
             "path": str(request.get("path", "")),
             "method": request.get("method", ""),
             "type": request.get("type", ""),
@@ -126,6 +147,15 @@ async def value_error_exception_handler(
     )
 
 
+@app.exception_handler(request_utils.ClientDisconnected)
+async def client_disconnected_exception_handler(
+    request: Request, exc: request_utils.ClientDisconnected
+) -> Response:
+    # Nobody reads the response; 499 marks the request in the access log
+    default_logger.info("Client disconnected, request abandoned")
+    return Response(status_code=499)
+
+
 @app.middleware("http")
 async def logging_middleware(request: Request, call_next) -> Response:
     start_time_ns = time.perf_counter_ns()
@@ -182,7 +212,7 @@ async def catch_all_exception_handler(request: Request, exc: Exception):
         f"An unhandled exception occurred {str(exc)}",
         exc_info=True,
         http={
-            "url": str(request.url),
+            "url": loggable_url(request),
             "method": request.method,
             "request_id": request_id,
         },
@@ -212,7 +242,12 @@ if "ELASTIC_APM_SERVER_URL" in env_with_secrets:
                     "^GET /openapi.json",
                     "^GET /ping",
                 ],
-                "SANITIZE_FIELD_NAMES": ["*token*", "token", "authorization"],
+                "SANITIZE_FIELD_NAMES": [
+                    "*token*",
+                    "token",
+                    "authorization",
+                    *REDACTED_QUERY_PARAMS,
+                ],
             }
         )
         app.add_middleware(ElasticAPM, client=elastic_apm)
@@ -0,0 +1,35 @@
+from enum import Enum
+
+
+class CommentaryStatus(str, Enum):
+    """
+    Progress of the LLM commentary of an analysed game, stored in the
+    `commentary_status` field of its `analysis` document. PARTIAL commentary
+    is missing some of the plies the model was asked about.
+    """
+
+    PENDING = "pending"
+    DONE = "done"
+    PARTIAL = "partial"
+    FAILED = "failed"
+
+
+class CommentaryMode(str, Enum):
+    """
+    How the commentary of a game is generated: by the model, by local
+    templates, or by templates with critical moments escalated to the model.
+    """
+
+    LLM = "llm"
+    HYBRID = "hybrid"
+    LOCAL = "local"
+
+
+class AnalysisMode(str, Enum):
+    """
+    How deep the engine searches a game: every ply to the same depth, or a
+    shallow sweep followed by deep searches around the eval swings.
+    """
+
+    FIXED = "fixed"
+    ADAPTIVE = "adaptive"
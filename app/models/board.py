@@ -0,0 +1,39 @@
+from typing import List, Optional
+
+from pydantic import BaseModel, Field, root_validator
+
+# Most plies a single batch board request can return
+MAX_BOARD_PLIES = 1024
+
+
+class BoardsRequest(BaseModel):
+    """
+    Batch board request: one game, identified by `pgn_id` or given as
+    `pgn_string`, and the plies to return, either listed in `plies` or as the
+    inclusive range `start`..`end`. Without either, every ply is returned.
+    At most MAX_BOARD_PLIES plies can be requested at once.
+    """
+
+    pgn_id: Optional[str] = None
+    pgn_string: Optional[str] = None
+    plies: Optional[List[int]] = Field(None, max_items=MAX_BOARD_PLIES)
+    start: Optional[int] = Field(None, ge=0)
+    end: Optional[int] = Field(None, ge=0)
+    include_evals: bool = False
+
+    @root_validator
+    def check_game_source(cls, values):
+        if bool(values.get("pgn_id")) == bool(values.get("pgn_string")):
+            raise ValueError("Provide exactly one of pgn_id or pgn_string")
+        if values.get("plies") is not None and (
+            values.get("start") is not None or values.get("end") is not None
+        ):
+            raise ValueError("Provide either plies or a start/end range")
+        return values
+
+    @root_validator
+    def check_range_length(cls, values):
+        start, end = values.get("start"), values.get("end")
+        if start is not None and end is not None and end - start >= MAX_BOARD_PLIES:
+            raise ValueError(f"Request at most {MAX_BOARD_PLIES} plies at once")
+        return values
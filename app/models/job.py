@@ -0,0 +1,13 @@
+from enum import Enum
+
+
+class JobStatus(str, Enum):
+    """
+    Progress of an asynchronous job, stored in the `status` field of its `jobs`
+    document.
+    """
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
@@ -0,0 +1,123 @@
+"""
+Accuracy and cost of the adaptive two-pass analysis against fixed depth.
+
+Every game is analysed at a fixed --reference-depth (ANALYSIS_DEPTH by
+default), then in fixed mode and in adaptive mode with the given budgets.
+Each mode is compared with the reference: the share of plies with the same
+best move, the mean eval error in centipawns (clipped at +/-1000), and the
+recall of the reference's critical moments. The evaluation cache is off, so
+every search runs, and every checkout starts the engines on a fresh hash.
+
+    STOCKFISH_PATH=/usr/games/stockfish python -m benchmarks.adaptive_analysis \\
+        --pgn data.pgn --time-budget 5
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import chess.engine
+import chess.pgn
+
+from app.api.utils import chess_utils, pgn_utils
+from app.core.config import CacheConfig, StockfishConfig
+from app.engine.engine_pool import ZuEnginePool
+
+EVAL_CLIP = 1000
+
+
+def read_games(path: str):
+    with open(path) as pgn_file:
+        while True:
+            game = chess.pgn.read_game(pgn_file)
+            if game is None:
+                return
+            yield pgn_utils.parse_pgn(str(game))
+
+
+def clipped(score) -> int:
+    cp = chess_utils.score_to_cp(score) or 0
+    return max(-EVAL_CLIP, min(EVAL_CLIP, cp))
+
+
+def compare(reference: list, analysis: list) -> dict:
+    same_moves = sum(ref[0] == got[0] for ref, got in zip(reference, analysis))
+    errors = [
+        abs(clipped(ref[1]) - clipped(got[1])) for ref, got in zip(reference, analysis)
+    ]
+    expected = set(chess_utils.find_critical_moments(reference))
+    found = set(chess_utils.find_critical_moments(analysis))
+    return {
+        "best_move": same_moves / len(reference),
+        "eval_error": statistics.mean(errors),
+        "critical_recall": len(expected & found) / len(expected) if expected else 1.0,
+    }
+
+
+async def fixed(parsed, depth: int, workers: int):
+    start = time.perf_counter()
+    results = await chess_utils.analyse_fens(
+        list(parsed.fens), workers=workers, limit=chess.engine.Limit(depth=depth)
+    )
+    analysis = [(r.best_move, chess_utils.white_score(r.score)) for r in results]
+    nodes = sum(r.nodes or 0 for r in results)
+    return analysis, nodes, time.perf_counter() - start
+
+
+async def adaptive(parsed, workers: int, time_budget: float, node_budget: int):
+    result = await chess_utils.analyse_game_adaptive(
+        parsed, workers=workers, time_budget=time_budget, node_budget=node_budget
+    )
+    return result.analysis, result.nodes, result.seconds
+
+
+def report(name: str, rows: list):
+    print(
+        f"{name:>9}: {statistics.mean(r['seconds'] for r in rows):7.2f}s "
+        f"{statistics.mean(r['nodes'] for r in rows) / 1e6:8.2f}M nodes "
+        f"best move {statistics.mean(r['best_move'] for r in rows):6.1%} "
+        f"eval error {statistics.mean(r['eval_error'] for r in rows):6.1f}cp "
+        f"critical recall {statistics.mean(r['critical_recall'] for r in rows):6.1%}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pgn", default="data.pgn")
+    parser.add_argument(
+        "--reference-depth", type=int, default=StockfishConfig.ANALYSIS_DEPTH
+    )
+    parser.add_argument("--workers", type=int, default=StockfishConfig.ENGINE_POOL_SIZE)
+    parser.add_argument("--time-budget", type=float, default=None)
+    parser.add_argument("--node-budget", type=int, default=None)
+    args = parser.parse_args()
+
+    CacheConfig.EVAL_CACHE_ENABLED = False
+    modes = {
+        "fixed": lambda parsed: fixed(
+            parsed, StockfishConfig.ANALYSIS_DEPTH, args.workers
+        ),
+        "adaptive": lambda parsed: adaptive(
+            parsed, args.workers, args.time_budget, args.node_budget
+        ),
+    }
+    rows = {name: [] for name in modes}
+    await ZuEnginePool.open_engine_pool()
+    try:
+        for parsed in read_games(args.pgn):
+            reference, _, _ = await fixed(parsed, args.reference_depth, args.workers)
+            for name, run in modes.items():
+                analysis, nodes, seconds = await run(parsed)
+                rows[name].append(
+                    {"nodes": nodes, "seconds": seconds, **compare(reference, analysis)}
+                )
+    finally:
+        await ZuEnginePool.close_engine_pool()
+
+    for name, mode_rows in rows.items():
+        report(name, mode_rows)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,71 @@
+"""
+Throughput and peak memory of the streaming multi-game PGN ingestion.
+
+Builds archives of --games and 10 x --games copies of the games in --pgn and
+streams each through the /pgn/upload pipeline in 64 KiB chunks: splitting,
+validation, parsing and conversion to 'pgn_data' documents in batches of
+PGN_UPLOAD_BATCH_SIZE, without the database. Peak memory, measured with
+tracemalloc, should be the same for both archive sizes.
+
+    python -m benchmarks.pgn_ingest --pgn data.pgn --games 2000
+"""
+
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+from app.api.utils import chess_utils, pgn_utils
+from app.core.config import PGNConfig
+
+CHUNK_SIZE = 64 * 1024
+
+
+async def archive_chunks(games: list, copies: int):
+    # Generated on the fly, so the archive itself does not count as memory
+    buffer = b""
+    for index in range(copies):
+        buffer += games[index % len(games)].encode() + b"\n\n"
+        while len(buffer) >= CHUNK_SIZE:
+            yield buffer[:CHUNK_SIZE]
+            buffer = buffer[CHUNK_SIZE:]
+    yield buffer
+
+
+async def ingest(games: list, copies: int):
+    tracemalloc.start()
+    start = time.perf_counter()
+    count, batch = 0, []
+    async for pgn_string in pgn_utils.iter_pgn_games(archive_chunks(games, copies)):
+        count += 1
+        parsed = pgn_utils.parse_pgn(pgn_string)
+        if parsed.is_valid:
+            batch.append(chess_utils.parsed_game_to_dict(parsed))
+        if len(batch) >= PGNConfig.PGN_UPLOAD_BATCH_SIZE:
+            batch = []
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{count:>8} games: {count / seconds:8.1f} games/s "
+        f"peak memory {peak / 2**20:6.1f} MiB"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pgn", default="data.pgn")
+    parser.add_argument("--games", type=int, default=2000)
+    args = parser.parse_args()
+
+    async def read_file():
+        with open(args.pgn, "rb") as pgn_file:
+            yield pgn_file.read()
+
+    games = [game async for game in pgn_utils.iter_pgn_games(read_file())]
+    for copies in (args.games, 10 * args.games):
+        await ingest(games, copies)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
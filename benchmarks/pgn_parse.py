@@ -0,0 +1,126 @@
+"""
+Per-request PGN parse cost before and after the single-pass ParsedGame stage.
+
+"before" replays what POST /app/pgn used to do with the same text: the
+validation regex, the char-by-char header loop, the move-number regex split,
+chess.pgn.read_game for the engine, and the regex split again for the
+critical moments. "after" is one pgn_utils.parse_pgn call.
+
+Expect both to take about the same time. The cost of either is dominated
+by rendering a FEN for every ply, which both do; the validation scan is a
+few percent of it. The ParsedGame stage is a structural change: later
+stages reuse the parsed game instead of parsing the PGN again, which this
+benchmark of a single request does not measure.
+
+    python -m benchmarks.pgn_parse --pgn data.pgn --runs 500
+"""
+
+import argparse
+import io
+import re
+import timeit
+
+import chess.pgn
+
+from app.api.utils import pgn_utils
+
+LEGACY_PGN_PATTERN = re.compile(
+    r"""
+    (\[Event\s+".*"\]\s*)?
+    (\[Site\s+".*"\]\s*)?
+    (\[Date\s+"\d{4}\.\d{2}\.\d{2}"\]\s*)?
+    (\[Round\s+".*"\]\s*)?
+    (\[White\s+".*"\]\s*)?
+    (\[Black\s+".*"\]\s*)?
+    (\[Result\s+".*"\]\s*)?
+    (\[CurrentPosition\s+".*"\]\s*)?
+    (\[Timezone\s+".*"\]\s*)?
+    (\[ECO\s+".*"\]\s*)?
+    (\[ECOUrl\s+".*"\]\s*)?
+    (\[UTCDate\s+"\d{4}\.\d{2}\.\d{2}"\]\s*)?
+    (\[UTCTime\s+"\d{2}:\d{2}:\d{2}"\]\s*)?
+    (\[WhiteElo\s+"\d*"\]\s*)?
+    (\[BlackElo\s+"\d*"\]\s*)?
+    (\[TimeControl\s+".*"\]\s*)?
+    (\[Termination\s+".*"\]\s*)?
+    (\[StartTime\s+".*"\]\s*)?
+    (\[EndDate\s+"\d{4}\.\d{2}\.\d{2}"\]\s*)?
+    (\[EndTime\s+".*"\]\s*)?
+    (\[Link\s+".*"\]\s*)?
+    (\[WhiteUrl\s+".*"\]\s*)?
+    (\[WhiteCountry\s+".*"\]\s*)?
+    (\[WhiteTitle\s+".*"\]\s*)?
+    (\[BlackUrl\s+".*"\]\s*)?
+    (\[BlackCountry\s+".*"\]\s*)?
+    (\[BlackTitle\s+".*"\]\s*)?
+    (\d+\.\s+([a-zA-Z0-9+]+(\s+[a-zA-Z0-9+]+)?\s*)+)
+    """,
+    re.VERBOSE,
+)
+
+
+def legacy_pgn_to_dict(pgn_string: str) -> dict:
+    pgn_dict = {}
+    moves_list = []
+    i = 0
+    while i < len(pgn_string):
+        if pgn_string[i] == "[":
+            end_bracket_index = pgn_string.find("]", i)
+            line = pgn_string[i : end_bracket_index + 1]
+            pgn_dict[line.split(" ")[0][1:]] = line.split('"')[1]
+            i = end_bracket_index + 1
+        else:
+            move_start = i
+            while i < len(pgn_string) and pgn_string[i] != "[":
+                i += 1
+            move_data = pgn_string[move_start:i].strip()
+            if move_data:
+                moves_list.append(move_data)
+    if moves_list:
+        pgn_dict["Moves"] = moves_list
+    return pgn_dict
+
+
+def legacy_pgn_to_moves_dict(pgn_string: str) -> dict:
+    moves_dict = {}
+    moves_list = [m.strip() for m in re.split(r"\d+\.", pgn_string) if m.strip()]
+    move_counter = 1
+    for move in moves_list:
+        for individual_move in [m for m in move.split(" ") if m]:
+            moves_dict[move_counter] = individual_move
+            move_counter += 1
+    return moves_dict
+
+
+def before(pgn_string: str):
+    LEGACY_PGN_PATTERN.match(pgn_string)
+    pgn_dict = legacy_pgn_to_dict(pgn_string)
+    legacy_pgn_to_moves_dict(pgn_dict["Moves"][0])
+    game = chess.pgn.read_game(io.StringIO(pgn_string))
+    board = game.board()
+    for move in game.mainline_moves():
+        board.push(move)
+        board.fen()
+    legacy_pgn_to_moves_dict(pgn_string)
+
+
+def after(pgn_string: str):
+    pgn_utils.parse_pgn(pgn_string)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pgn", default="data.pgn")
+    parser.add_argument("--runs", type=int, default=500)
+    args = parser.parse_args()
+
+    with open(args.pgn) as pgn_file:
+        pgn = pgn_file.read()
+
+    for name, func in (("before", before), ("after", after)):
+        seconds = min(timeit.repeat(lambda: func(pgn), number=args.runs, repeat=3))
+        print(f"{name:>6}: {seconds / args.runs * 1e6:10.1f} us per request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Worst-case time of the tokenizing PGN validator on adversarial inputs.
+
+Each input shape is validated at 256 KB, 512 KB and 1 MB with the length
+cap lifted; time should grow linearly with size.
+
+    python -m benchmarks.pgn_validation
+"""
+
+import time
+
+from app.api.utils import pgn_utils
+
+SHAPES = {
+    "whitespace": lambda n: " " * n,
+    "digits": lambda n: "1" * n,
+    "unclosed comment": lambda n: "{" + "a" * (n - 1),
+    "unclosed header": lambda n: '[Event "' + "a" * (n - 8),
+    "brackets": lambda n: "[" * n,
+    "moves": lambda n: ("1. e4 e5 " * (n // 9 + 1))[:n],
+    "annotated san": lambda n: ("Nbxd7+!? " * (n // 9 + 1))[:n],
+    "nested variations": lambda n: ("1. e4 (" * (n // 7 + 1))[:n],
+}
+
+
+def main():
+    sizes = [256 * 1024, 512 * 1024, 1024 * 1024]
+    print(f"{'shape':>18} " + " ".join(f"{size // 1024:>8}KB" for size in sizes))
+    for name, make in SHAPES.items():
+        timings = []
+        for size in sizes:
+            pgn = make(size)
+            start = time.perf_counter()
+            try:
+                pgn_utils.validate_pgn(pgn, max_length=size)
+            except pgn_utils.PGNValidationError:
+                pass
+            timings.append((time.perf_counter() - start) * 1000)
+        print(f"{name:>18} " + " ".join(f"{ms:>8.1f}ms" for ms in timings))
+
+
+if __name__ == "__main__":
+    main()
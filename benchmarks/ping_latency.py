@@ -0,0 +1,110 @@
+"""
+Measures /ping latency while full-game analyses run concurrently.
+
+Runs the same load twice against an in-process app: once with the old
+blocking SimpleEngine loop inside the coroutine and once through the pooled
+asyncio engines. With the pool, /ping p99 should stay flat.
+
+    STOCKFISH_PATH=/usr/games/stockfish python -m benchmarks.ping_latency
+"""
+
+import argparse
+import asyncio
+import io
+import statistics
+import time
+
+import chess
+import chess.engine
+import chess.pgn
+import httpx
+from fastapi import FastAPI
+
+from app.api.utils import chess_utils, pgn_utils
+from app.core.config import StockfishConfig
+from app.engine.engine_pool import ZuEnginePool
+
+
+async def blocking_best_moves(game):
+    # The pre-pool implementation: synchronous engine I/O on the event loop
+    board = game.board()
+    best_moves = []
+    with chess.engine.SimpleEngine.popen_uci(StockfishConfig.STOCKFISH_PATH) as engine:
+        for move in game.mainline_moves():
+            board.push(move)
+            result = engine.play(board, chess.engine.Limit(time=0.1))
+            info = engine.analyse(board, chess.engine.Limit(depth=20))
+            best_moves.append((result.move.uci(), info["score"].white().score()))
+    return best_moves
+
+
+def build_app(mode: str) -> FastAPI:
+    bench_app = FastAPI()
+
+    @bench_app.get("/ping")
+    async def ping():
+        return {"ping": "pong"}
+
+    @bench_app.post("/analyse")
+    async def analyse(pgn_string: str):
+        if mode == "blocking":
+            return await blocking_best_moves(
+                chess.pgn.read_game(io.StringIO(pgn_string))
+            )
+        return await chess_utils.get_best_moves(pgn_utils.parse_pgn(pgn_string))
+
+    return bench_app
+
+
+async def run(mode: str, pgn: str, games: int, pings: int):
+    client = httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=build_app(mode)),
+        base_url="http://bench",
+        timeout=None,
+    )
+    latencies = []
+
+    async def ping_loop():
+        for _ in range(pings):
+            start = time.perf_counter()
+            await client.get("/ping")
+            latencies.append((time.perf_counter() - start) * 1000)
+            await asyncio.sleep(0.01)
+
+    analyses = [
+        client.post("/analyse", params={"pgn_string": pgn}) for _ in range(games)
+    ]
+    start = time.perf_counter()
+    await asyncio.gather(ping_loop(), *analyses)
+    elapsed = time.perf_counter() - start
+    await client.aclose()
+
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(
+        f"{mode:>9}: /ping p50={statistics.median(latencies):8.2f}ms "
+        f"p99={p99:8.2f}ms max={latencies[-1]:8.2f}ms "
+        f"({games} games in {elapsed:.1f}s)"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pgn", default="data.pgn")
+    parser.add_argument("--games", type=int, default=4)
+    parser.add_argument("--pings", type=int, default=300)
+    args = parser.parse_args()
+
+    with open(args.pgn) as pgn_file:
+        pgn = pgn_file.read()
+
+    await run("blocking", pgn, args.games, args.pings)
+    await ZuEnginePool.open_engine_pool()
+    try:
+        await run("pooled", pgn, args.games, args.pings)
+    finally:
+        await ZuEnginePool.close_engine_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,98 @@
+"""
+Interactive best-move latency while the engine pool is saturated by bulk work.
+
+Starts --bulk full-game analyses, more than the pool can run at once, then
+asks for the best move of single positions every --interval seconds, like
+/get_best_move does. Requests that hit ENGINE_CHECKOUT_TIMEOUT are counted
+as timeouts. Runs the same load twice: once with every checkout in
+the same class and no reservations, where an interactive request queues
+behind whole games, and once with the games as bulk and the single positions
+as interactive checkouts. With priorities, interactive p95 should stay close
+to the time of one search. The evaluation cache is off, so every search runs.
+
+    STOCKFISH_PATH=/usr/games/stockfish python -m benchmarks.priority_latency \\
+        --pgn data.pgn --bulk 8
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from fastapi import HTTPException
+
+from app.api.utils import chess_utils, pgn_utils
+from app.core.config import CacheConfig, StockfishConfig
+from app.engine.engine_pool import EnginePriority, ZuEnginePool
+
+
+async def run(mode: str, parsed, bulk: int, requests: int, interval: float):
+    prioritised = mode == "priority"
+    bulk_priority = EnginePriority.BULK if prioritised else EnginePriority.STANDARD
+    interactive_priority = (
+        EnginePriority.INTERACTIVE if prioritised else EnginePriority.STANDARD
+    )
+    fens = list(parsed.fens)
+    games = [
+        asyncio.ensure_future(chess_utils.analyse_fens(fens, priority=bulk_priority))
+        for _ in range(bulk)
+    ]
+    # Let the games take every engine first
+    await asyncio.sleep(0.5)
+
+    latencies, failures = [], 0
+
+    async def interactive(fen: str):
+        nonlocal failures
+        start = time.perf_counter()
+        try:
+            await chess_utils.analyse_fens(
+                [fen], workers=1, priority=interactive_priority
+            )
+        except HTTPException:
+            failures += 1
+            return
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    asked = []
+    for index in range(requests):
+        asked.append(asyncio.ensure_future(interactive(fens[index % len(fens)])))
+        await asyncio.sleep(interval)
+    await asyncio.gather(*asked)
+    await asyncio.gather(*games)
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else float("nan")
+    print(
+        f"{mode:>9}: interactive p50={statistics.median(latencies or [0]):9.1f}ms "
+        f"p95={p95:9.1f}ms max={max(latencies, default=0):9.1f}ms "
+        f"({failures} of {requests} timed out)"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pgn", default="data.pgn")
+    parser.add_argument("--bulk", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--interval", type=float, default=0.1)
+    args = parser.parse_args()
+
+    with open(args.pgn) as pgn_file:
+        parsed = pgn_utils.parse_pgn(pgn_file.read())
+
+    CacheConfig.EVAL_CACHE_ENABLED = False
+    reserved = StockfishConfig.ENGINE_RESERVED_INTERACTIVE
+    await ZuEnginePool.open_engine_pool()
+    try:
+        StockfishConfig.ENGINE_RESERVED_INTERACTIVE = 0
+        await run("fifo", parsed, args.bulk, args.requests, args.interval)
+        StockfishConfig.ENGINE_RESERVED_INTERACTIVE = max(1, reserved)
+        await run("priority", parsed, args.bulk, args.requests, args.interval)
+    finally:
+        StockfishConfig.ENGINE_RESERVED_INTERACTIVE = reserved
+        await ZuEnginePool.close_engine_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,441 @@
+import asyncio
+import json
+
+import chess
+import chess.engine
+import pytest
+from fastapi import BackgroundTasks, FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from pydantic import ValidationError
+
+from app.api.api import api_router
+from app.api.controllers import app
+from app.api.utils import chess_utils, openai_utils, pgn_utils, request_utils
+from app.core.config import OPENAIConfig, StockfishConfig
+from app.engine.engine_pool import ZuEnginePool
+from app.models.analysis import CommentaryMode
+from app.models.board import BoardsRequest
+
+PGN = "1. e4 e5 2. Nf3 Nc6 *"
+# The fake_analysis fixture replaces it in every test
+run_analysis = app.run_analysis
+
+
+class FakeRequest:
+    def __init__(self, disconnected=False):
+        self.headers = {}
+        self.disconnected = disconnected
+
+    async def is_disconnected(self):
+        return self.disconnected
+
+
+@pytest.fixture(autouse=True)
+def fake_analysis(monkeypatch):
+    release = asyncio.Event()
+
+    async def run_analysis(parsed, workers=None, on_result=None, priority=None):
+        await release.wait()
+        return app.AnalysisRun(
+            {"message": "PGN saved successfully"}, "id", [], {}, False
+        )
+
+    async def get_analysed_game(game_hash):
+        return None
+
+    monkeypatch.setattr(app, "run_analysis", run_analysis)
+    monkeypatch.setattr(app, "get_analysed_game", get_analysed_game)
+    monkeypatch.setattr(request_utils, "DISCONNECT_POLL_INTERVAL", 0.01)
+    return release
+
+
+async def disconnecting_request():
+    with pytest.raises(request_utils.ClientDisconnected):
+        await app.analyse_pgn(PGN, BackgroundTasks(), FakeRequest(disconnected=True))
+
+
+@pytest.mark.asyncio
+async def test_a_disconnecting_request_does_not_cancel_a_job_analysis(fake_analysis):
+    job = asyncio.ensure_future(app.run_analysis_job(pgn_utils.parse_pgn(PGN)))
+    await asyncio.sleep(0)
+    await disconnecting_request()
+    fake_analysis.set()
+    assert (await job)["message"] == "PGN saved successfully"
+
+
+@pytest.mark.asyncio
+async def test_a_job_keeps_an_analysis_started_by_a_request(fake_analysis):
+    request = asyncio.ensure_future(disconnecting_request())
+    await asyncio.sleep(0)
+    job = asyncio.ensure_future(app.run_analysis_job(pgn_utils.parse_pgn(PGN)))
+    await request
+    fake_analysis.set()
+    assert (await job)["message"] == "PGN saved successfully"
+
+
+@pytest.mark.asyncio
+async def test_a_stream_waits_for_the_pending_commentary(monkeypatch):
+    documents = iter(
+        [
+            {"commentary_status": "pending"},
+            {"commentary_status": "done", "openai_analysis": {"1": "e4 opens"}},
+        ]
+    )
+
+    async def fetch_analysis(pgn_id):
+        return next(documents)
+
+    async def stream_game_commentary(*args):
+        raise AssertionError("The model was asked again")
+        yield
+
+    monkeypatch.setattr(chess_utils, "fetch_analysis", fetch_analysis)
+    monkeypatch.setattr(openai_utils, "stream_game_commentary", stream_game_commentary)
+    monkeypatch.setattr(OPENAIConfig, "COMMENTARY_POLL_INTERVAL", 0.01)
+
+    document = {"commentary_status": "pending", "analysis": [], "critical_moments": {}}
+    parsed = pgn_utils.parse_pgn(PGN)
+    lines = [line async for line in app.commentary_lines("id", document, parsed)]
+    assert lines == [
+        app.ndjson_line({"ply": "1", "text": "e4 opens"}),
+        app.ndjson_line({"commentary_status": "done"}),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_the_analysis_response_leaves_out_the_fen_index(monkeypatch):
+    async def save_pgn_to_db(pgn_dict):
+        return pgn_dict["id"]
+
+    async def get_best_moves(parsed, **kwargs):
+        return [["e7e5", 30]] * len(parsed.sans)
+
+    async def save_analysis(*args, **kwargs):
+        return True
+
+    monkeypatch.setattr(app, "save_pgn_to_db", save_pgn_to_db)
+    monkeypatch.setattr(chess_utils, "get_best_moves", get_best_moves)
+    monkeypatch.setattr(chess_utils, "save_analysis", save_analysis)
+
+    run = await run_analysis(pgn_utils.parse_pgn(PGN))
+    assert "fens" not in run.response["data"]
+    assert run.response["data"]["Moves"]["1"] == "e4"
+
+
+def test_a_board_range_is_capped():
+    with pytest.raises(ValidationError):
+        BoardsRequest(pgn_string=PGN, start=0, end=1_000_000_000)
+
+
+@pytest.mark.asyncio
+async def test_get_boards_of_a_range():
+    response = await app.get_boards(BoardsRequest(pgn_string=PGN, start=1, end=2))
+    parsed = pgn_utils.parse_pgn(PGN)
+    assert response["boards"] == [
+        {"ply": 1, "fen": parsed.fens[0]},
+        {"ply": 2, "fen": parsed.fens[1]},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_get_boards_rejects_plies_outside_the_game(monkeypatch):
+    async def get_fen_index(pgn_id):
+        return ["fen"] * 5
+
+    monkeypatch.setattr(chess_utils, "get_fen_index", get_fen_index)
+    with pytest.raises(HTTPException) as error:
+        await app.get_boards(BoardsRequest(pgn_id="id", start=2, end=900))
+    assert error.value.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_get_boards_with_evals(monkeypatch):
+    async def get_cached_evals(fens, plies, pgn_id=None):
+        return [30 for _ in plies]
+
+    monkeypatch.setattr(chess_utils, "get_cached_evals", get_cached_evals)
+    response = await app.get_boards(
+        BoardsRequest(pgn_string=PGN, plies=[0, 4], include_evals=True)
+    )
+    assert [board["eval"] for board in response["boards"]] == [30, 30]
+
+
+@pytest.mark.asyncio
+async def test_get_board_by_id(monkeypatch):
+    async def get_fen_index(pgn_id):
+        return ["start", "after e4"] if pgn_id == "id" else None
+
+    monkeypatch.setattr(chess_utils, "get_fen_index", get_fen_index)
+    assert await app.get_board_by_id("id", 1) == {
+        "fen": "after e4",
+        "pgn_id": "id",
+        "ply": 1,
+    }
+    for pgn_id, ply, status_code in (("id", 2, 400), ("other", 0, 404)):
+        with pytest.raises(HTTPException) as error:
+            await app.get_board_by_id(pgn_id, ply)
+        assert error.value.status_code == status_code
+
+
+@pytest.fixture
+def client():
+    api = FastAPI()
+    api.include_router(api_router)
+    return TestClient(api)
+
+
+@pytest.fixture
+def analyses(monkeypatch):
+    documents = {"id": {"pgn_id": "id", "commentary_status": "pending"}}
+
+    async def find_one(col, filter_data, project=None):
+        document = documents.get(filter_data["pgn_id"])
+        return dict(document) if document else None
+
+    async def update_one(col, filter_data, update_data):
+        documents[filter_data["pgn_id"]].update(update_data["$set"])
+
+    monkeypatch.setattr(chess_utils.ZuMongoClient, "find_one", find_one)
+    monkeypatch.setattr(chess_utils.ZuMongoClient, "update_one", update_one)
+    return documents
+
+
+@pytest.mark.asyncio
+async def test_commentary_goes_from_pending_to_done(
+    fake_analysis, analyses, client, monkeypatch
+):
+    async def run_analysis(parsed, workers=None, on_result=None, priority=None):
+        await fake_analysis.wait()
+        return app.AnalysisRun({}, "id", [], {}, True)
+
+    async def analyze_chess_game(parsed, analysis, critical_moments, plies=None):
+        return {"1": "e4 opens"}
+
+    monkeypatch.setattr(app, "run_analysis", run_analysis)
+    monkeypatch.setattr(openai_utils, "analyze_chess_game", analyze_chess_game)
+
+    parsed = pgn_utils.parse_pgn(PGN)
+    in_flight = app.InFlightAnalysis(parsed)
+    commenting = asyncio.ensure_future(
+        app.comment_when_analysed(in_flight, parsed, CommentaryMode.LLM)
+    )
+    await asyncio.sleep(0)
+    response = client.get("/app/commentary", params={"pgn_id": "id"})
+    assert response.json()["commentary_status"] == "pending"
+
+    fake_analysis.set()
+    await commenting
+    response = client.get("/app/commentary", params={"pgn_id": "id"})
+    assert response.json() == {
+        "pgn_id": "id",
+        "commentary_status": "done",
+        "openai_analysis": {"1": "e4 opens"},
+        "commentary_error": None,
+    }
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "error, status, commentary",
+    [
+        (RuntimeError("OpenAI is down"), "failed", None),
+        (
+            openai_utils.IncompleteCommentary({"1": "e4 opens"}, ["2"]),
+            "partial",
+            {"1": "e4 opens"},
+        ),
+    ],
+)
+async def test_a_commentary_error_is_stored(
+    analyses, client, monkeypatch, error, status, commentary
+):
+    async def analyze_chess_game(parsed, analysis, critical_moments, plies=None):
+        raise error
+
+    monkeypatch.setattr(openai_utils, "analyze_chess_game", analyze_chess_game)
+
+    parsed = pgn_utils.parse_pgn(PGN)
+    await app.generate_commentary("id", parsed, [], {}, CommentaryMode.LLM)
+    response = client.get("/app/commentary", params={"pgn_id": "id"})
+    assert response.json() == {
+        "pgn_id": "id",
+        "commentary_status": status,
+        "openai_analysis": commentary,
+        "commentary_error": str(error),
+    }
+
+
+def test_an_older_analysis_reports_its_commentary_done(analyses, client):
+    analyses["old"] = {"pgn_id": "old", "openai_analysis": {"1": "e4 opens"}}
+
+    response = client.get("/app/commentary", params={"pgn_id": "old"})
+    assert response.json()["commentary_status"] == "done"
+    assert response.json()["openai_analysis"] == {"1": "e4 opens"}
+    response = client.get("/app/commentary", params={"pgn_id": "missing"})
+    assert response.status_code == 404
+
+
+class ScoringEngine:
+    """Pooled engine scoring every position from a table of centipawns."""
+
+    def __init__(self, scores: dict):
+        self.scores = scores
+
+    def new_game(self):
+        pass
+
+    async def analyse(self, board, limit, **kwargs):
+        if board.fen() not in self.scores:
+            raise RuntimeError("Engine crashed")
+        return {
+            "pv": [next(iter(board.legal_moves))],
+            "score": chess.engine.PovScore(
+                chess.engine.Cp(self.scores[board.fen()]), chess.WHITE
+            ),
+        }
+
+
+@pytest.fixture
+def engine_pool(monkeypatch):
+    fens = pgn_utils.parse_pgn(PGN).fens
+    # The evaluation swings when White plays Nf3
+    scores = dict(zip(fens, (20, 20, 400, 400)))
+    engines = [ScoringEngine(scores) for _ in range(2)]
+    monkeypatch.setattr(ZuEnginePool, "engines", list(engines))
+    monkeypatch.setattr(ZuEnginePool, "idle", list(engines))
+    monkeypatch.setattr(ZuEnginePool, "waiters", [])
+    monkeypatch.setattr(StockfishConfig, "ENGINE_RESERVED_INTERACTIVE", 0)
+    monkeypatch.setattr(StockfishConfig, "ENGINE_RESERVED_STANDARD", 0)
+    return scores
+
+
+@pytest.fixture
+def stored_games(monkeypatch):
+    saved, commented = [], []
+
+    async def fetch_analysis_by_hash(game_hash):
+        return None
+
+    async def save_pgn_to_db(pgn_dict):
+        return "id"
+
+    async def save_analysis(analysis, pgn_id, *args, **kwargs):
+        saved.append((pgn_id, analysis))
+        return True
+
+    async def generate_commentary(pgn_id, *args):
+        commented.append(pgn_id)
+
+    monkeypatch.setattr(chess_utils, "fetch_analysis_by_hash", fetch_analysis_by_hash)
+    monkeypatch.setattr(app, "save_pgn_to_db", save_pgn_to_db)
+    monkeypatch.setattr(chess_utils, "save_analysis", save_analysis)
+    monkeypatch.setattr(app, "generate_commentary", generate_commentary)
+    return saved, commented
+
+
+def stream_events(client, path: str, method: str = "GET", **request) -> list:
+    if method == "GET":
+        request["params"] = {"pgn_string": PGN}
+    events = []
+    with client.stream(method, path, **request) as response:
+        assert response.headers["content-type"].startswith("text/event-stream")
+        body = "".join(response.iter_text())
+    for block in body.strip().split("\n\n"):
+        event, data = (line.split(": ", 1)[1] for line in block.split("\n"))
+        events.append((event, json.loads(data)))
+    return events
+
+
+def test_the_analysis_stream_sends_plies_then_critical_moments_and_summary(
+    client, engine_pool, stored_games
+):
+    events = stream_events(client, "/app/pgn/stream")
+
+    assert [event for event, _ in events] == ["ply"] * 4 + [
+        "critical_moments",
+        "summary",
+    ]
+    assert sorted(data["ply"] for _, data in events[:4]) == [1, 2, 3, 4]
+    assert events[4][1] == {"3": "Nf3"}
+    assert events[5][1] == {
+        "plies": 4,
+        "critical_moments": 1,
+        "pgn_id": "id",
+        "commentary_status": "pending",
+    }
+    saved, commented = stored_games
+    assert [pgn_id for pgn_id, _ in saved] == ["id"]
+    assert commented == ["id"]
+
+
+def test_a_failed_analysis_ends_the_stream_with_an_error(
+    client, engine_pool, stored_games
+):
+    engine_pool.clear()
+
+    assert stream_events(client, "/app/get_best_moves/stream") == [
+        ("error", {"detail": "Engine crashed"})
+    ]
+    assert stream_events(client, "/app/pgn/stream") == [
+        ("error", {"detail": "Engine crashed"})
+    ]
+    assert stored_games == ([], [])
+
+
+def test_an_analysed_game_is_replayed(client, stored_games, monkeypatch):
+    async def fetch_analysis_by_hash(game_hash):
+        return {
+            "pgn_id": "old",
+            "analysis": [["e7e5", 20], ["g1f3", 20], ["b8c6", 400], ["f1b5", 400]],
+            "critical_moments": {"3": "Nf3"},
+        }
+
+    monkeypatch.setattr(chess_utils, "fetch_analysis_by_hash", fetch_analysis_by_hash)
+    # An empty pool fails any search
+    monkeypatch.setattr(ZuEnginePool, "engines", [])
+
+    events = stream_events(client, "/app/pgn/stream")
+    assert events[:2] == [
+        ("ply", {"ply": 1, "best_move": "e7e5", "eval": 20}),
+        ("ply", {"ply": 2, "best_move": "g1f3", "eval": 20}),
+    ]
+    assert events[-2:] == [
+        ("critical_moments", {"3": "Nf3"}),
+        (
+            "summary",
+            {
+                "plies": 4,
+                "critical_moments": 1,
+                "pgn_id": "old",
+                "commentary_status": "done",
+            },
+        ),
+    ]
+    assert stored_games == ([], [])
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        {"content": PGN, "headers": {"content-type": "text/plain"}},
+        {"json": {"pgn_string": PGN}},
+    ],
+)
+def test_the_streams_read_the_pgn_from_a_post_body(
+    client, engine_pool, stored_games, body
+):
+    events = stream_events(client, "/app/get_best_moves/stream", "POST", **body)
+    assert [event for event, _ in events] == ["ply"] * 4 + [
+        "critical_moments",
+        "summary",
+    ]
+    events = stream_events(client, "/app/pgn/stream", "POST", **body)
+    assert events[-1] == (
+        "summary",
+        {
+            "plies": 4,
+            "critical_moments": 1,
+            "pgn_id": "id",
+            "commentary_status": "pending",
+        },
+    )
@@ -0,0 +1,197 @@
+import json
+from collections import OrderedDict
+
+import pytest
+
+from app.api.utils.cache_utils import CommentaryCache, EvalCache, FenIndexLRU
+from app.core.config import CacheConfig
+from app.db.mongo_client import ZuMongoClient
+from app.db.redis_client import ZuRedisClient
+
+
+class FakePipeline(object):
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    def incrby(self, key, amount):
+        self.commands.append((key, amount))
+
+    async def execute(self):
+        self.redis.round_trips += 1
+        results = []
+        for key, amount in self.commands:
+            self.redis.values[key] = int(self.redis.values.get(key) or 0) + amount
+            results.append(self.redis.values[key])
+        return results
+
+
+class FakeRedis(object):
+    """In-memory Redis that runs the eval cache script in Python."""
+
+    def __init__(self):
+        self.values = {}
+        self.round_trips = 0
+
+    async def get(self, key):
+        value = self.values.get(key)
+        return value.encode() if value is not None else None
+
+    async def set(self, name, value, ex=None):
+        self.values[name] = value
+        return True
+
+    async def mget(self, keys, *args):
+        self.round_trips += 1
+        return [self.values.get(key) for key in [*keys, *args]]
+
+    async def eval(self, script, numkeys, *keys_and_args):
+        self.round_trips += 1
+        keys, args = keys_and_args[:numkeys], keys_and_args[numkeys:]
+        for index, key in enumerate(keys):
+            depth, entry = args[2 * index], args[2 * index + 1]
+            stored = self.values.get(key)
+            if not stored or (json.loads(stored).get("depth") or 0) <= depth:
+                self.values[key] = entry
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+@pytest.fixture(autouse=True)
+def fen_index_lru(monkeypatch):
+    monkeypatch.setattr(FenIndexLRU, "entries", OrderedDict())
+    monkeypatch.setattr(CacheConfig, "FEN_INDEX_LRU_SIZE", 2)
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    redis = FakeRedis()
+    monkeypatch.setattr(ZuRedisClient, "redis_client", redis)
+    monkeypatch.setattr(CacheConfig, "EVAL_CACHE_ENABLED", True)
+    monkeypatch.setattr(EvalCache, "hits", 0)
+    monkeypatch.setattr(EvalCache, "misses", 0)
+    return redis
+
+
+@pytest.fixture
+def commentary_cache(monkeypatch):
+    documents = {}
+
+    async def find_one(col, filter_data, project=None):
+        document = documents.get(filter_data["key"])
+        return document and {"commentary": document["commentary"]}
+
+    async def update_one(col, filter_data, update_data, upsert, handle_exception):
+        documents[filter_data["key"]] = update_data["$set"]
+
+    monkeypatch.setattr(ZuMongoClient, "find_one", find_one)
+    monkeypatch.setattr(ZuMongoClient, "update_one", update_one)
+    monkeypatch.setattr(CacheConfig, "COMMENTARY_CACHE_ENABLED", True)
+    for counter in ("hits", "mongo_hits", "misses"):
+        monkeypatch.setattr(CommentaryCache, counter, 0)
+    return documents
+
+
+def test_fen_index_lru_evicts_the_least_recently_used_game():
+    FenIndexLRU.put("a", ["fen a"])
+    FenIndexLRU.put("b", ["fen b"])
+    assert FenIndexLRU.get("a") == ["fen a"]
+    FenIndexLRU.put("c", ["fen c"])
+
+    assert FenIndexLRU.get("b") is None
+    assert FenIndexLRU.get("a") == ["fen a"]
+    assert FenIndexLRU.get("c") == ["fen c"]
+
+
+@pytest.mark.asyncio
+async def test_eval_cache_keeps_the_deepest_search(redis):
+    key = EvalCache.key(0x1234, "Stockfish 16")
+
+    await EvalCache.set_many({key: {"depth": 20, "score": "+0.30"}})
+    await EvalCache.set_many({key: {"depth": 12, "score": "+0.10"}})
+    assert json.loads(redis.values[key]) == {"depth": 20, "score": "+0.30"}
+
+    await EvalCache.set_many({key: {"depth": 24, "score": "+0.25"}})
+    assert json.loads(redis.values[key]) == {"depth": 24, "score": "+0.25"}
+
+
+@pytest.mark.asyncio
+async def test_eval_cache_serves_searches_up_to_the_cached_depth(redis):
+    shallow, deep, missing = (EvalCache.key(h, "sf") for h in (1, 2, 3))
+    await EvalCache.set_many(
+        {shallow: {"depth": 10, "score": "+0.1"}, deep: {"depth": 18, "score": "-0.2"}}
+    )
+
+    entries = await EvalCache.get_many([shallow, deep, missing], 18)
+    assert entries == [None, {"depth": 18, "score": "-0.2"}, None]
+
+    entries = await EvalCache.get_many([shallow, deep, missing], 10)
+    assert entries[:2] == [
+        {"depth": 10, "score": "+0.1"},
+        {"depth": 18, "score": "-0.2"},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_eval_cache_counts_hits_and_misses_in_one_round_trip(redis):
+    hit, miss = EvalCache.key(1, "sf"), EvalCache.key(2, "sf")
+    await EvalCache.set_many({hit: {"depth": 12}})
+    redis.round_trips = 0
+
+    await EvalCache.get_many([hit, miss, miss], 12)
+    # One MGET for the entries, one pipeline for both counters
+    assert redis.round_trips == 2
+
+    stats = await EvalCache.stats()
+    assert stats["process"] == {"hits": 1, "misses": 2, "hit_rate": 1 / 3}
+    assert stats["shared"] == {"hits": 1, "misses": 2, "hit_rate": 1 / 3}
+
+
+def test_commentary_cache_key_ignores_whitespace_and_header_order():
+    key = CommentaryCache.key("gpt", "v1", {"White": "a", "Black": "b"}, "1. e4  e5\n")
+    assert key == CommentaryCache.key(
+        "gpt", "v1", {"Black": "b", "White": "a"}, "1. e4 e5"
+    )
+    assert key.startswith(f"{CacheConfig.COMMENTARY_CACHE_PREFIX}:")
+    assert key != CommentaryCache.key(
+        "gpt", "v2", {"White": "a", "Black": "b"}, "1. e4 e5"
+    )
+    assert key != CommentaryCache.key(
+        "gpt-4", "v1", {"White": "a", "Black": "b"}, "1. e4 e5"
+    )
+
+
+@pytest.mark.asyncio
+async def test_commentary_cache_falls_back_to_mongo(redis, commentary_cache):
+    await CommentaryCache.set("key", {"1": "e4 opens"})
+    assert commentary_cache["key"]["commentary"] == {"1": "e4 opens"}
+
+    # Redis lost the entry, Mongo still has it
+    redis.values.clear()
+    assert await CommentaryCache.get("key") == {"1": "e4 opens"}
+    assert json.loads(redis.values["key"]) == {"1": "e4 opens"}
+    assert await CommentaryCache.get("key") == {"1": "e4 opens"}
+    assert await CommentaryCache.get("other") is None
+
+    stats = CommentaryCache.stats()
+    assert (stats["redis_hits"], stats["mongo_hits"], stats["misses"]) == (1, 1, 1)
+
+
+@pytest.mark.asyncio
+async def test_commentary_cache_skips_empty_and_oversized_commentary(
+    redis, commentary_cache, monkeypatch
+):
+    monkeypatch.setattr(CacheConfig, "COMMENTARY_CACHE_MAX_BYTES", 32)
+
+    await CommentaryCache.set("empty", {})
+    await CommentaryCache.set("large", {"1": "e4 " * 20})
+    assert redis.values == {}
+    assert commentary_cache == {}
+    assert await CommentaryCache.get("large") is None
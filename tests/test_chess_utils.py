@@ -0,0 +1,258 @@
+import asyncio
+from collections import OrderedDict
+
+import chess
+import chess.engine
+import pytest
+
+from app.api.utils import chess_utils, pgn_utils
+from app.core.config import StockfishConfig
+from app.engine.engine_pool import ZuEnginePool
+
+PGN = "1. e4 e5 2. Nf3 Nc6 3. Bb5 a6 4. Ba4 Nf6 5. O-O Be7 *"
+# A blunder on ply 6 (index 5), then the game goes on quietly
+EVALS = [30, 25, 30, 25, 30, 400, 390, 395, 380, 385]
+
+
+def test_find_critical_moments_handles_mates():
+    analysis = [("a", 30), ("b", "Mate in 3 by Black"), ("c", "N/A"), ("d", 20)]
+    assert chess_utils.find_critical_moments(analysis) == [1]
+
+
+def test_swing_positions_take_neighbours_nearest_first():
+    analysis = [("a", score) for score in EVALS]
+    assert chess_utils.swing_positions(analysis, 0) == [4, 5]
+    assert chess_utils.swing_positions(analysis, 2) == [4, 5, 3, 6, 2, 7]
+
+
+def test_deep_limit_shares_the_budget():
+    limit = chess_utils.deep_limit(4, 2, seconds_left=2.0, nodes_left=4000)
+    assert limit.depth == StockfishConfig.ANALYSIS_DEPTH
+    assert limit.time == 1.0
+    assert limit.nodes == 1000
+    assert chess_utils.deep_limit(4, 2, seconds_left=-0.1) is None
+    assert chess_utils.deep_limit(4, 2, nodes_left=3) is None
+
+
+@pytest.mark.asyncio
+async def test_adaptive_analysis_searches_swings_deeper(monkeypatch):
+    parsed = pgn_utils.parse_pgn(PGN)
+    indexes = {fen: index for index, fen in enumerate(parsed.fens)}
+    searched = []
+
+    async def analyse_fens(fens, workers=None, limit=None, on_result=None, **kwargs):
+        searched.append((limit.depth, [indexes[fen] for fen in fens]))
+        return [
+            chess_utils.PositionAnalysis(
+                "a2a3",
+                chess.engine.PovScore(
+                    chess.engine.Cp(EVALS[indexes[fen]]), chess.WHITE
+                ),
+                ["a2a3"],
+                limit.depth,
+                100,
+            )
+            for fen in fens
+        ]
+
+    monkeypatch.setattr(chess_utils, "analyse_fens", analyse_fens)
+    monkeypatch.setattr(StockfishConfig, "ADAPTIVE_NEIGHBOURS", 1)
+    result = await chess_utils.analyse_game_adaptive(parsed, node_budget=10000)
+
+    sweep = StockfishConfig.ADAPTIVE_SWEEP_DEPTH
+    deep = StockfishConfig.ANALYSIS_DEPTH
+    assert searched == [(sweep, list(range(10))), (deep, [4, 5, 3, 6])]
+    assert result.deep_plies == [4, 5, 6, 7]
+    assert result.depths == [sweep] * 3 + [deep] * 4 + [sweep] * 3
+    assert result.nodes == 1400
+    assert result.analysis[5] == ("a2a3", 400)
+
+
+def test_select_plies():
+    assert chess_utils.select_plies(11, [0, 4, 10]) == [0, 4, 10]
+    assert chess_utils.select_plies(11, start=3, end=5) == [3, 4, 5]
+    assert chess_utils.select_plies(11, start=8) == [8, 9, 10]
+    assert chess_utils.select_plies(3) == [0, 1, 2]
+
+
+@pytest.mark.parametrize(
+    "plies, start, end",
+    [([0, 11], None, None), (None, 5, 11), (None, 0, 1_000_000_000)],
+)
+def test_select_plies_rejects_plies_outside_the_game(plies, start, end):
+    with pytest.raises(ValueError, match="exceed the total moves"):
+        chess_utils.select_plies(11, plies, start, end)
+
+
+def test_select_plies_caps_the_range(monkeypatch):
+    monkeypatch.setattr(chess_utils, "MAX_BOARD_PLIES", 4)
+    assert chess_utils.select_plies(11, start=0, end=3) == [0, 1, 2, 3]
+    with pytest.raises(ValueError, match="at most 4 plies"):
+        chess_utils.select_plies(11, start=0, end=4)
+
+
+@pytest.mark.asyncio
+async def test_get_cached_evals_reads_the_stored_analysis(monkeypatch):
+    async def fetch_analysis(pgn_id):
+        return {"analysis": [["e7e5", 30], ["g1f3", 25]]}
+
+    monkeypatch.setattr(chess_utils, "fetch_analysis", fetch_analysis)
+    evals = await chess_utils.get_cached_evals(["a", "b", "c", "d"], [0, 1, 2, 3], "id")
+    assert evals == [None, 30, 25, None]
+
+
+@pytest.mark.asyncio
+async def test_get_cached_evals_falls_back_to_the_eval_cache(monkeypatch):
+    mate = chess_utils.PositionAnalysis(
+        "d8h4", chess.engine.PovScore(chess.engine.Mate(-1), chess.WHITE), [], 20, 0
+    )
+
+    async def get_many(keys, min_depth):
+        return [chess_utils.position_to_dict(mate), None]
+
+    monkeypatch.setattr(chess_utils.EvalCache, "get_many", get_many)
+    parsed = pgn_utils.parse_pgn(PGN)
+    evals = await chess_utils.get_cached_evals(list(parsed.fens[:2]), [1, 2])
+    assert evals == ["Mate in 1 by Black", None]
+
+
+@pytest.fixture
+def pgn_data(monkeypatch):
+    documents, updates = {}, []
+
+    async def find_one(col, filter_data, project=None):
+        return documents.get(filter_data["id"])
+
+    async def update_one(col, filter_data, update_data):
+        updates.append((filter_data["id"], update_data["$set"]["fens"]))
+
+    monkeypatch.setattr(chess_utils.ZuMongoClient, "find_one", find_one)
+    monkeypatch.setattr(chess_utils.ZuMongoClient, "update_one", update_one)
+    monkeypatch.setattr(chess_utils.FenIndexLRU, "entries", OrderedDict())
+    return documents, updates
+
+
+@pytest.mark.asyncio
+async def test_get_fen_index_reads_the_stored_index_once(pgn_data):
+    documents, updates = pgn_data
+    documents["id"] = {"id": "id", "fens": ["a", "b"]}
+
+    assert await chess_utils.get_fen_index("id") == ["a", "b"]
+    del documents["id"]
+    assert await chess_utils.get_fen_index("id") == ["a", "b"]
+    assert await chess_utils.get_fen_index("other") is None
+    assert updates == []
+
+
+@pytest.mark.asyncio
+async def test_get_fen_index_backfills_legacy_moves_up_to_the_result(pgn_data):
+    documents, updates = pgn_data
+    moves = {"1": "e4", "2": "e5", "3": "Nf3", "4": "1-0", "5": "{a comment"}
+    documents["legacy"] = {"id": "legacy", "Moves": moves}
+
+    fens = await chess_utils.get_fen_index("legacy")
+    assert fens == [chess.STARTING_FEN, *pgn_utils.parse_pgn("1. e4 e5 2. Nf3 *").fens]
+    assert updates == [("legacy", fens)]
+
+
+class StubEngine:
+    """Engine answering every search with the given info."""
+
+    def __init__(self, info: dict):
+        self.info = info
+        self.searches = []
+
+    async def analyse(self, board, limit, **kwargs):
+        self.searches.append((board.fen(), limit))
+        return self.info
+
+
+@pytest.mark.asyncio
+async def test_analyse_position_takes_the_best_move_from_the_pv():
+    board = chess.Board()
+    pv = [chess.Move.from_uci("e2e4"), chess.Move.from_uci("e7e5")]
+    engine = StubEngine(
+        {
+            "pv": pv,
+            "score": chess.engine.PovScore(chess.engine.Cp(35), chess.WHITE),
+            "depth": 20,
+            "nodes": 12345,
+        }
+    )
+    limit = chess.engine.Limit(depth=20)
+
+    result = await chess_utils.analyse_position(engine, board, limit)
+    assert engine.searches == [(board.fen(), limit)]
+    assert result.best_move == "e2e4"
+    assert result.pv == ["e2e4", "e7e5"]
+    assert (result.depth, result.nodes) == (20, 12345)
+    assert chess_utils.white_score(result.score) == 35
+
+
+@pytest.mark.asyncio
+async def test_analyse_position_reports_mates_from_whites_point_of_view():
+    board = chess.Board()
+    board.push_san("e4")
+    # The engine scores from the side to move, here Black
+    engine = StubEngine(
+        {
+            "pv": [chess.Move.from_uci("e7e5")],
+            "score": chess.engine.PovScore(chess.engine.Mate(2), chess.BLACK),
+        }
+    )
+    result = await chess_utils.analyse_position(engine, board)
+    assert chess_utils.white_score(result.score) == "Mate in 2 by Black"
+
+
+@pytest.mark.asyncio
+async def test_analyse_position_of_a_finished_game_has_no_best_move():
+    board = chess.Board()
+    for san in ("f3", "e5", "g4", "Qh4#"):
+        board.push_san(san)
+    engine = StubEngine(
+        {"score": chess.engine.PovScore(chess.engine.Mate(0), chess.WHITE)}
+    )
+    result = await chess_utils.analyse_position(engine, board)
+    assert result.best_move is None
+    assert result.pv == []
+
+
+class DelayedEngine:
+    """Pooled engine whose searches take the given seconds per position."""
+
+    def __init__(self, delays: dict, searches: dict):
+        self.delays, self.searches = delays, searches
+
+    def new_game(self):
+        pass
+
+    async def analyse(self, board, limit, **kwargs):
+        ply, delay = self.delays[board.fen()]
+        self.searches["running"] += 1
+        self.searches["peak"] = max(self.searches["peak"], self.searches["running"])
+        await asyncio.sleep(delay)
+        self.searches["running"] -= 1
+        self.searches["finished"].append(ply)
+        return {"pv": [next(iter(board.legal_moves))], "nodes": ply}
+
+
+@pytest.mark.asyncio
+async def test_analyse_fens_keeps_ply_order_across_workers(monkeypatch):
+    fens = list(pgn_utils.parse_pgn(PGN).fens)
+    # Early plies take longest, so the workers finish them out of order
+    delays = {fen: (ply, 0.01 * (len(fens) - ply)) for ply, fen in enumerate(fens)}
+    searches = {"running": 0, "peak": 0, "finished": []}
+    engines = [DelayedEngine(delays, searches) for _ in range(2)]
+    monkeypatch.setattr(ZuEnginePool, "engines", list(engines))
+    monkeypatch.setattr(ZuEnginePool, "idle", list(engines))
+    monkeypatch.setattr(ZuEnginePool, "waiters", [])
+    monkeypatch.setattr(StockfishConfig, "ENGINE_RESERVED_INTERACTIVE", 0)
+    monkeypatch.setattr(StockfishConfig, "ENGINE_RESERVED_STANDARD", 0)
+
+    results = await chess_utils.analyse_fens(fens, workers=8)
+
+    assert [result.nodes for result in results] == list(range(len(fens)))
+    assert searches["finished"] != sorted(searches["finished"])
+    # Eight workers were asked for, but the pool only has two engines
+    assert chess_utils.pool_workers(8) == 2
+    assert searches["peak"] == 2
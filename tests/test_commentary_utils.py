@@ -0,0 +1,116 @@
+import pytest
+
+from app.api.utils import commentary_utils, openai_utils, pgn_utils
+from app.api.utils.cache_utils import CommentaryCache, PositionCommentaryCache
+from app.llm.llm_gateway import ZuLLMGateway
+from app.models.analysis import CommentaryMode
+
+PGN = "1. e4 e5 2. Nf3 Nc6 3. Bc4 Nd4 4. Nxe5 Qg5 5. O-O Qxe5 1-0"
+# Best move and eval after every ply: 3... Nd4 is dubious, 5. O-O drops the knight
+ANALYSIS = [
+    ["e7e5", 30],
+    ["g1f3", 25],
+    ["b8c6", 30],
+    ["f1c4", 25],
+    ["g8f6", 40],
+    ["f3e5", 120],
+    ["d8g5", 150],
+    ["e5f7", 140],
+    ["d8e5", -150],
+    ["d2d3", -160],
+]
+
+
+@pytest.mark.parametrize(
+    "score, expected",
+    [(35, 35), ("Mate in 2 by White", 10000), ("Mate in 1 by Black", -10000)]
+    + [("N/A", None), (None, None)],
+)
+def test_score_to_cp(score, expected):
+    assert commentary_utils.score_to_cp(score) == expected
+
+
+def test_local_commentary_describes_every_ply():
+    parsed = pgn_utils.parse_pgn(PGN)
+    commentary, escalate = commentary_utils.local_commentary(parsed, ANALYSIS, {})
+
+    assert list(commentary) == [str(ply) for ply in range(1, 11)]
+    assert commentary["3"].startswith("Nf3, the engine's top choice.")
+    assert commentary["7"].startswith("Nxe5 captures a pawn")
+    assert "castles kingside, a blunder. Nxf7 was stronger." in commentary["9"]
+    assert commentary["10"].startswith("Qxe5 captures a knight")
+    assert escalate == ["6", "9"]
+
+
+@pytest.mark.asyncio
+async def test_local_mode_does_not_ask_the_model(monkeypatch):
+    async def analyze_chess_game(*args, **kwargs):
+        raise AssertionError("The model was asked")
+
+    monkeypatch.setattr(openai_utils, "analyze_chess_game", analyze_chess_game)
+    commentary = await commentary_utils.generate_game_commentary(
+        pgn_utils.parse_pgn(PGN), ANALYSIS, {}, CommentaryMode.LOCAL
+    )
+    assert len(commentary) == 10
+
+
+@pytest.mark.asyncio
+async def test_hybrid_mode_escalates_critical_plies(monkeypatch):
+    requested = []
+
+    async def analyze_chess_game(parsed, analysis, blunders, plies=None):
+        requested.extend(plies)
+        return {ply: f"model {ply}" for ply in plies}
+
+    monkeypatch.setattr(openai_utils, "analyze_chess_game", analyze_chess_game)
+    commentary = await commentary_utils.generate_game_commentary(
+        pgn_utils.parse_pgn(PGN), ANALYSIS, {"8": "Qg5"}, CommentaryMode.HYBRID
+    )
+    assert requested == ["6", "8", "9"]
+    assert commentary["8"] == "model 8"
+    assert commentary["7"].startswith("Nxe5")
+
+
+@pytest.mark.asyncio
+async def test_hybrid_mode_keeps_templates_of_missing_plies(monkeypatch):
+    async def analyze_chess_game(parsed, analysis, blunders, plies=None):
+        raise openai_utils.IncompleteCommentary({"6": "model 6"}, ["9"])
+
+    monkeypatch.setattr(openai_utils, "analyze_chess_game", analyze_chess_game)
+    with pytest.raises(openai_utils.IncompleteCommentary) as error:
+        await commentary_utils.generate_game_commentary(
+            pgn_utils.parse_pgn(PGN), ANALYSIS, {}, CommentaryMode.HYBRID
+        )
+    assert error.value.missing == ["9"]
+    assert error.value.commentary["6"] == "model 6"
+    assert "a blunder" in error.value.commentary["9"]
+
+
+@pytest.mark.asyncio
+async def test_hybrid_mode_keeps_templates_when_the_model_misses_its_deadline(
+    monkeypatch,
+):
+    async def chat(messages, model, max_tokens):
+        return None
+
+    async def get(key):
+        return None
+
+    async def set(key, commentary):
+        raise AssertionError("Commentary without the model was cached")
+
+    async def get_many(keys):
+        return [None] * len(keys)
+
+    monkeypatch.setattr(ZuLLMGateway, "chat", chat)
+    monkeypatch.setattr(CommentaryCache, "get", get)
+    monkeypatch.setattr(CommentaryCache, "set", set)
+    monkeypatch.setattr(PositionCommentaryCache, "get_many", get_many)
+
+    with pytest.raises(openai_utils.IncompleteCommentary) as error:
+        await commentary_utils.generate_game_commentary(
+            pgn_utils.parse_pgn(PGN), ANALYSIS, {}, CommentaryMode.HYBRID
+        )
+    assert error.value.missing == ["6", "9"]
+    assert len(error.value.commentary) == 10
+    assert "a blunder" in error.value.commentary["9"]
@@ -0,0 +1,231 @@
+import asyncio
+
+import chess
+import chess.engine
+import pytest
+import pytest_asyncio
+from fastapi import HTTPException
+
+from app.core.config import StockfishConfig
+from app.engine.engine_pool import EnginePriority, PooledEngine, ZuEnginePool
+
+
+class FakeEngine:
+    def new_game(self):
+        pass
+
+    async def quit(self):
+        pass
+
+
+class FakeTransport:
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeProtocol:
+    """UCI protocol recording the game token of every search."""
+
+    def __init__(self):
+        self.games = []
+
+    async def analyse(self, board, limit, game=None, **kwargs):
+        self.games.append(game)
+        return {}
+
+    async def quit(self):
+        pass
+
+
+@pytest_asyncio.fixture
+async def pool(monkeypatch):
+    engines = [FakeEngine(), FakeEngine()]
+    monkeypatch.setattr(ZuEnginePool, "engines", list(engines))
+    monkeypatch.setattr(ZuEnginePool, "idle", list(engines))
+    monkeypatch.setattr(ZuEnginePool, "waiters", [])
+    monkeypatch.setattr(StockfishConfig, "ENGINE_RESERVED_INTERACTIVE", 1)
+    monkeypatch.setattr(StockfishConfig, "ENGINE_RESERVED_STANDARD", 0)
+    monkeypatch.setattr(StockfishConfig, "ENGINE_AGING_SECONDS", 10)
+    yield engines
+    await ZuEnginePool.close_engine_pool()
+
+
+async def hold(priority: EnginePriority, release: asyncio.Event, held: list):
+    async with ZuEnginePool.checkout(priority=priority) as engine:
+        held.append((priority, engine))
+        await release.wait()
+
+
+@pytest.mark.asyncio
+async def test_bulk_leaves_the_reserved_engine_to_interactive(pool):
+    release, held = asyncio.Event(), []
+    bulk = [
+        asyncio.ensure_future(hold(EnginePriority.BULK, release, held))
+        for _ in range(2)
+    ]
+    await asyncio.sleep(0)
+    assert held == [(EnginePriority.BULK, pool[1])]
+    assert ZuEnginePool.is_wanted(EnginePriority.INTERACTIVE) is False
+    assert ZuEnginePool.is_wanted(EnginePriority.BULK) is False
+
+    async with ZuEnginePool.checkout(priority=EnginePriority.INTERACTIVE) as engine:
+        assert engine is pool[0]
+    assert ZuEnginePool.stats()["waiting"]["bulk"] == 1
+
+    release.set()
+    await asyncio.gather(*bulk)
+    assert len(held) == 2
+    assert len(ZuEnginePool.idle) == 2
+
+
+@pytest.mark.asyncio
+async def test_waiting_bulk_checkouts_age_into_the_reserve(pool, monkeypatch):
+    monkeypatch.setattr(StockfishConfig, "ENGINE_AGING_SECONDS", 0.05)
+    release, held = asyncio.Event(), []
+    bulk = [
+        asyncio.ensure_future(hold(EnginePriority.BULK, release, held))
+        for _ in range(2)
+    ]
+    await asyncio.sleep(0)
+    assert len(held) == 1
+    # Two promotions take bulk to interactive, which may use the last engine
+    await asyncio.sleep(0.15)
+    assert len(held) == 2
+    release.set()
+    await asyncio.gather(*bulk)
+
+
+@pytest.mark.asyncio
+async def test_more_urgent_waiters_are_served_first(pool):
+    release, held = asyncio.Event(), []
+    holders = [
+        asyncio.ensure_future(hold(EnginePriority.INTERACTIVE, release, held))
+        for _ in range(2)
+    ]
+    await asyncio.sleep(0)
+    order = []
+
+    async def wait(priority):
+        async with ZuEnginePool.checkout(timeout=1, priority=priority):
+            order.append(priority)
+
+    waiting = [
+        asyncio.ensure_future(wait(priority))
+        for priority in (EnginePriority.STANDARD, EnginePriority.INTERACTIVE)
+    ]
+    await asyncio.sleep(0)
+    assert ZuEnginePool.is_wanted(EnginePriority.STANDARD)
+    release.set()
+    await asyncio.gather(*holders, *waiting)
+    assert order == [EnginePriority.INTERACTIVE, EnginePriority.STANDARD]
+
+
+@pytest.mark.asyncio
+async def test_checkout_times_out_with_a_503(pool):
+    release, held = asyncio.Event(), []
+    holders = [
+        asyncio.ensure_future(hold(EnginePriority.INTERACTIVE, release, held))
+        for _ in range(2)
+    ]
+    await asyncio.sleep(0)
+    with pytest.raises(HTTPException) as error:
+        async with ZuEnginePool.checkout(timeout=0.01):
+            pass
+    assert error.value.status_code == 503
+    assert ZuEnginePool.stats()["waiting"]["standard"] == 0
+    release.set()
+    await asyncio.gather(*holders)
+    assert len(ZuEnginePool.idle) == 2
+
+
+@pytest.mark.asyncio
+async def test_checkout_without_engines_is_a_503(monkeypatch):
+    monkeypatch.setattr(ZuEnginePool, "engines", [])
+    with pytest.raises(HTTPException) as error:
+        async with ZuEnginePool.checkout():
+            pass
+    assert error.value.status_code == 503
+
+
+@pytest.mark.asyncio
+async def test_every_lease_starts_a_new_game(monkeypatch):
+    protocol = FakeProtocol()
+    engine = PooledEngine(FakeTransport(), protocol)
+    monkeypatch.setattr(ZuEnginePool, "engines", [engine])
+    monkeypatch.setattr(ZuEnginePool, "idle", [engine])
+    monkeypatch.setattr(ZuEnginePool, "waiters", [])
+
+    for _ in range(2):
+        async with ZuEnginePool.checkout() as pooled:
+            await pooled.analyse(chess.Board(), chess.engine.Limit(depth=1))
+            await pooled.analyse(chess.Board(), chess.engine.Limit(depth=1))
+    await ZuEnginePool.close_engine_pool()
+
+    first, second = protocol.games[:2], protocol.games[2:]
+    # python-chess sends ucinewgame whenever the game token changes
+    assert first[0] is first[1] and second[0] is second[1]
+    assert first[0] is not second[0]
+
+
+@pytest.mark.asyncio
+async def test_a_dead_engine_is_replaced(monkeypatch):
+    dead = PooledEngine(FakeTransport(), FakeProtocol())
+    fresh = PooledEngine(FakeTransport(), FakeProtocol())
+
+    async def popen_engine():
+        return fresh
+
+    monkeypatch.setattr(ZuEnginePool, "engines", [dead])
+    monkeypatch.setattr(ZuEnginePool, "idle", [dead])
+    monkeypatch.setattr(ZuEnginePool, "waiters", [])
+    monkeypatch.setattr(ZuEnginePool, "_popen_engine", popen_engine)
+
+    with pytest.raises(chess.engine.EngineTerminatedError):
+        async with ZuEnginePool.checkout():
+            raise chess.engine.EngineTerminatedError("engine process died")
+    assert dead.transport.closed
+    assert ZuEnginePool.engines == [fresh]
+    assert ZuEnginePool.idle == [fresh]
+    await ZuEnginePool.close_engine_pool()
+
+
+@pytest.mark.asyncio
+async def test_an_engine_that_cannot_restart_leaves_the_pool(monkeypatch):
+    dead = PooledEngine(FakeTransport(), FakeProtocol())
+
+    async def popen_engine():
+        raise FileNotFoundError("stockfish")
+
+    monkeypatch.setattr(ZuEnginePool, "engines", [dead])
+    monkeypatch.setattr(ZuEnginePool, "idle", [dead])
+    monkeypatch.setattr(ZuEnginePool, "waiters", [])
+    monkeypatch.setattr(ZuEnginePool, "_popen_engine", popen_engine)
+
+    with pytest.raises(chess.engine.EngineTerminatedError):
+        async with ZuEnginePool.checkout():
+            raise chess.engine.EngineTerminatedError("engine process died")
+    assert ZuEnginePool.engines == []
+    assert ZuEnginePool.idle == []
+    await ZuEnginePool.close_engine_pool()
+
+
+@pytest.mark.asyncio
+async def test_closing_the_pool_fails_waiting_checkouts(pool):
+    release, held = asyncio.Event(), []
+    holders = [
+        asyncio.ensure_future(hold(EnginePriority.INTERACTIVE, release, held))
+        for _ in range(2)
+    ]
+    await asyncio.sleep(0)
+    waiting = asyncio.ensure_future(hold(EnginePriority.BULK, release, held))
+    await asyncio.sleep(0)
+
+    await ZuEnginePool.close_engine_pool()
+    with pytest.raises(HTTPException) as error:
+        await waiting
+    assert error.value.status_code == 503
+    release.set()
+    await asyncio.gather(*holders)
+    assert ZuEnginePool.idle is None
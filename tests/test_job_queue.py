@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+import pytest_asyncio
+from fastapi import HTTPException
+
+from app.core.config import JobConfig
+from app.db.mongo_client import ZuMongoClient
+from app.jobs.job_queue import ZuJobQueue
+
+
+class FakeJobs:
+    """In-memory stand-in for the jobs collection."""
+
+    def __init__(self):
+        self.documents = {}
+
+    async def insert_one(self, col, insert_data, **kwargs):
+        self.documents[insert_data["id"]] = dict(insert_data)
+
+    async def find_one(self, col, filter_data, project=None, **kwargs):
+        document = self.documents.get(filter_data["id"])
+        return document and {k: v for k, v in document.items() if k not in project}
+
+    async def update_one(self, col, filter_data, update_data=None, **kwargs):
+        self.documents[filter_data["id"]].update(update_data["$set"])
+
+    async def delete_one(self, col, filter_data, **kwargs):
+        self.documents.pop(filter_data["id"], None)
+
+
+@pytest_asyncio.fixture
+async def jobs(monkeypatch):
+    fake = FakeJobs()
+    for name in ("insert_one", "find_one", "update_one", "delete_one"):
+        monkeypatch.setattr(ZuMongoClient, name, getattr(fake, name))
+    monkeypatch.setattr(JobConfig, "JOB_QUEUE_SIZE", 2)
+    monkeypatch.setattr(ZuJobQueue, "average_seconds", 10.0)
+    yield fake
+    await ZuJobQueue.stop()
+
+
+async def wait_until_finished(job_id: str) -> dict:
+    while True:
+        job = await ZuJobQueue.get(job_id)
+        if job["status"] in ("done", "failed"):
+            return job
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_jobs_store_their_result_or_error(jobs):
+    async def double(value):
+        if value < 0:
+            raise ValueError("negative")
+        return value * 2
+
+    await ZuJobQueue.start(workers=2)
+    done = await ZuJobQueue.submit("double", double, value=21)
+    failed = await ZuJobQueue.submit("double", double, value=-1)
+
+    job = await wait_until_finished(done)
+    assert (job["status"], job["result"], job["kind"]) == ("done", 42, "double")
+    job = await wait_until_finished(failed)
+    assert (job["status"], job["error"]) == ("failed", "negative")
+    assert "expires_at" not in job
+
+
+@pytest.mark.asyncio
+async def test_full_queue_is_rejected_with_retry_after(jobs):
+    release = asyncio.Event()
+
+    async def blocked():
+        await release.wait()
+
+    await ZuJobQueue.start(workers=1)
+    running = await ZuJobQueue.submit("blocked", blocked)
+    await asyncio.sleep(0.01)
+    queued = [await ZuJobQueue.submit("blocked", blocked) for _ in range(2)]
+
+    with pytest.raises(HTTPException) as rejected:
+        await ZuJobQueue.submit("blocked", blocked)
+    assert rejected.value.status_code == 429
+    assert rejected.value.headers == {"Retry-After": "20"}
+    assert len(jobs.documents) == 3
+
+    release.set()
+    for job_id in (running, *queued):
+        assert (await wait_until_finished(job_id))["status"] == "done"
+
+
+@pytest.mark.asyncio
+async def test_cancelled_handler_fails_the_job_and_keeps_the_worker(jobs):
+    async def cancelled():
+        raise asyncio.CancelledError()
+
+    async def double(value):
+        return value * 2
+
+    await ZuJobQueue.start(workers=1)
+    first = await ZuJobQueue.submit("cancelled", cancelled)
+    second = await ZuJobQueue.submit("double", double, value=2)
+
+    job = await wait_until_finished(first)
+    assert (job["status"], job["error"]) == ("failed", "Cancelled")
+    assert (await wait_until_finished(second))["result"] == 4
@@ -0,0 +1,142 @@
+import asyncio
+import json
+import time
+
+import pytest
+import pytest_asyncio
+from openai import AsyncOpenAI
+
+from app.core.config import LLMConfig
+from app.llm.llm_gateway import ZuLLMGateway
+
+MESSAGES = [{"role": "user", "content": "1. e4"}]
+
+
+class FakeOpenAIServer:
+    """Local OpenAI compatible chat completions server.
+
+    Every request takes the next (delay, status, content) step of `script`;
+    the last step repeats.
+    """
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.models = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def start(self) -> str:
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}/v1"
+
+    async def stop(self):
+        self.server.close()
+
+    async def read_request(self, reader) -> dict:
+        headers = await reader.readuntil(b"\r\n\r\n")
+        length = 0
+        for line in headers.decode().split("\r\n"):
+            if line.lower().startswith("content-length:"):
+                length = int(line.split(":")[1])
+        return json.loads(await reader.readexactly(length))
+
+    async def handle(self, reader, writer):
+        request = await self.read_request(reader)
+        self.models.append(request["model"])
+        delay, status, content = self.script[
+            min(len(self.models), len(self.script)) - 1
+        ]
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(delay)
+            body = json.dumps(
+                {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion",
+                    "created": 0,
+                    "model": request["model"],
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": content},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                }
+            ).encode()
+            writer.write(
+                f"HTTP/1.1 {status} X\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+            writer.close()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self.in_flight -= 1
+
+
+@pytest_asyncio.fixture
+async def serve(monkeypatch):
+    monkeypatch.setattr(LLMConfig, "LLM_BACKOFF_BASE", 0.01)
+    monkeypatch.setattr(LLMConfig, "LLM_HEDGE_AFTER", 0)
+    monkeypatch.setattr(LLMConfig, "LLM_FALLBACK_MODEL", "")
+    monkeypatch.setattr(ZuLLMGateway, "semaphore", None)
+    servers = []
+
+    async def serve(*script):
+        server = FakeOpenAIServer(script)
+        client = AsyncOpenAI(api_key="x", base_url=await server.start(), max_retries=0)
+        monkeypatch.setattr(ZuLLMGateway, "client", client)
+        servers.append(server)
+        return server
+
+    yield serve
+    for server in servers:
+        await server.stop()
+
+
+@pytest.mark.asyncio
+async def test_chat_retries_server_errors(serve):
+    server = await serve((0, 500, ""), (0, 200, "ok"))
+    assert await ZuLLMGateway.chat(MESSAGES, "gpt-a", 10) == "ok"
+    assert len(server.models) == 2
+
+
+@pytest.mark.asyncio
+async def test_chat_hedges_slow_requests(serve):
+    server = await serve((1, 200, "slow"), (0, 200, "fast"))
+    start = time.perf_counter()
+    assert await ZuLLMGateway.chat(MESSAGES, "gpt-a", 10, hedge_after=0.05) == "fast"
+    assert time.perf_counter() - start < 0.5
+    assert len(server.models) == 2
+
+
+@pytest.mark.asyncio
+async def test_chat_falls_back_after_the_deadline(serve):
+    server = await serve((1, 200, "late"), (0, 200, "fallback"))
+    reply = await ZuLLMGateway.chat(
+        MESSAGES, "gpt-a", 10, deadline=0.1, fallback_model="gpt-b"
+    )
+    assert reply == "fallback"
+    assert server.models == ["gpt-a", "gpt-b"]
+
+
+@pytest.mark.asyncio
+async def test_chat_without_fallback_returns_none(serve):
+    await serve((1, 200, "late"))
+    assert await ZuLLMGateway.chat(MESSAGES, "gpt-a", 10, deadline=0.1) is None
+
+
+@pytest.mark.asyncio
+async def test_chat_caps_requests_in_flight(serve, monkeypatch):
+    monkeypatch.setattr(LLMConfig, "LLM_CONCURRENCY", 2)
+    server = await serve((0.1, 200, "ok"))
+    replies = await asyncio.gather(
+        *(ZuLLMGateway.chat(MESSAGES, "gpt-a", 10) for _ in range(5))
+    )
+    assert replies == ["ok"] * 5
+    assert server.max_in_flight == 2
@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+from app.api.utils import openai_utils, pgn_utils
+from app.api.utils.cache_utils import CommentaryCache, PositionCommentaryCache
+from app.core.config import OPENAIConfig
+
+PARSED = pgn_utils.parse_pgn("1. e4 e5 2. Nf3 Nc6 *")
+ANALYSIS = [["e7e5", 30], ["g1f3", 25], ["b8c6", 30], ["f1c4", 25]]
+PLIES = ["1", "2", "3", "4"]
+
+
+@pytest.fixture(autouse=True)
+def caches(monkeypatch):
+    cached = {}
+
+    async def get(key):
+        return cached.get(key)
+
+    async def set(key, commentary):
+        cached[key] = commentary
+
+    async def get_many(keys):
+        return [None] * len(keys)
+
+    async def set_many(entries):
+        pass
+
+    monkeypatch.setattr(CommentaryCache, "get", get)
+    monkeypatch.setattr(CommentaryCache, "set", set)
+    monkeypatch.setattr(PositionCommentaryCache, "get_many", get_many)
+    monkeypatch.setattr(PositionCommentaryCache, "set_many", set_many)
+    return cached
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("reply", [["1. e4 is good"], "1. e4 is good", None])
+async def test_a_reply_that_is_not_an_object_fails(reply):
+    async def request(parsed, analysis, blunders, model, plies):
+        return reply
+
+    with pytest.raises(ValueError):
+        await openai_utils.comment_uncovered_plies(
+            PARSED, ANALYSIS, {}, "model", request, PLIES
+        )
+
+
+@pytest.mark.asyncio
+async def test_non_text_entries_are_dropped():
+    async def request(parsed, analysis, blunders, model, plies):
+        return {"1": "e4 opens", "2": {"text": "e5"}, "3": "Nf3", "4": "Nc6"}
+
+    commentary = await openai_utils.comment_uncovered_plies(
+        PARSED, ANALYSIS, {}, "model", request, PLIES
+    )
+    assert commentary == {"1": "e4 opens", "3": "Nf3", "4": "Nc6"}
+
+
+@pytest.mark.asyncio
+async def test_a_failed_segment_is_not_cached(caches, monkeypatch):
+    async def request_game_commentary(
+        parsed, analysis, blunders, model, plies, focus_critical=True
+    ):
+        if "3" in plies:
+            raise TimeoutError("Segment timed out")
+        return {ply: f"Ply {ply}" for ply in plies}
+
+    monkeypatch.setattr(OPENAIConfig, "COMMENTARY_SEGMENT_PLIES", 2)
+    monkeypatch.setattr(
+        openai_utils, "request_game_commentary", request_game_commentary
+    )
+
+    with pytest.raises(openai_utils.IncompleteCommentary) as error:
+        await openai_utils.analyze_chess_game(PARSED, ANALYSIS, {}, segmented=True)
+    assert error.value.commentary == {"1": "Ply 1", "2": "Ply 2"}
+    assert error.value.missing == ["3", "4"]
+    assert caches == {}
+
+
+@pytest.mark.asyncio
+async def test_no_reply_within_the_deadline_is_not_cached(caches, monkeypatch):
+    async def chat(messages, model, max_tokens):
+        return None
+
+    monkeypatch.setattr(openai_utils.ZuLLMGateway, "chat", chat)
+
+    with pytest.raises(asyncio.TimeoutError):
+        await openai_utils.analyze_chess_game(PARSED, ANALYSIS, {}, segmented=False)
+    assert caches == {}
+
+
+@pytest.mark.asyncio
+async def test_a_reply_missing_plies_is_not_cached(caches, monkeypatch):
+    async def chat(messages, model, max_tokens):
+        return '{"1": "e4 opens", "2": "e5 mirrors"}'
+
+    monkeypatch.setattr(openai_utils.ZuLLMGateway, "chat", chat)
+
+    with pytest.raises(openai_utils.IncompleteCommentary) as error:
+        await openai_utils.analyze_chess_game(PARSED, ANALYSIS, {}, segmented=False)
+    assert error.value.commentary == {"1": "e4 opens", "2": "e5 mirrors"}
+    assert error.value.missing == ["3", "4"]
+    assert caches == {}
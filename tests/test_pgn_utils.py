@@ -0,0 +1,148 @@
+import random
+import time
+
+import pytest
+
+from app.api.utils import pgn_utils
+from app.core.config import PGNConfig
+
+SCHOLARS_MATE = "1. e4 e5 2. Qh5 Nc6 3. Bc4 Nf6 4. Qxf7# 1-0"
+
+
+@pytest.mark.parametrize(
+    "pgn",
+    [
+        SCHOLARS_MATE,
+        '[Event "Live Chess"]\n[White "a"]\n\n1. d4 d5 *',
+        "1.e4 {best by test} e5 (1... c5 2. Nf3) 2. Nf3 $1 Nc6!? *",
+        "1. e4 d5 2. exd5 e6 3. dxe6 Ke7 4. exf7 Kd6 5. fxg8=Q 1-0",
+        "1. e4 e5 2. Nf3 Nc6 3. Bb5 a6 4. Ba4 Nf6 5. O-O 1/2-1/2",
+    ],
+)
+def test_validate_pgn_accepts(pgn):
+    pgn_utils.validate_pgn(pgn)
+
+
+@pytest.mark.parametrize(
+    "pgn, message, line, column",
+    [
+        ("hello", "Unexpected character", 1, 1),
+        ('[Event "x"]', "No moves found", 1, 12),
+        ("1. e4 (", "Unclosed variation", 1, 8),
+        ("1. e4 ))", "Unmatched ')'", 1, 7),
+        ('1. e4 e5\n[Event "x"]', "Header after the first move", 2, 1),
+        ("1. e4 e5 1-0 2. Nf3", "Unexpected text after the result", 1, 14),
+        ("1. e4 {unclosed", "Unclosed comment", 1, 7),
+        ('[Event "x\n1. e4', "Malformed header", 1, 1),
+    ],
+)
+def test_validate_pgn_reports_position(pgn, message, line, column):
+    with pytest.raises(pgn_utils.PGNValidationError) as excinfo:
+        pgn_utils.validate_pgn(pgn)
+    assert excinfo.value.message == message
+    assert (excinfo.value.line, excinfo.value.column) == (line, column)
+
+
+def test_validate_pgn_enforces_max_length():
+    with pytest.raises(pgn_utils.PGNValidationError):
+        pgn_utils.validate_pgn(SCHOLARS_MATE, max_length=10)
+
+
+@pytest.mark.parametrize(
+    "pgn",
+    [
+        " " * 2**20,
+        "1" * 2**20,
+        "{" + "a" * (2**20 - 1),
+        '[Event "' + "a" * (2**20 - 8),
+        ("1. e4 e5 " * 2**17)[: 2**20],
+        "1. " + "a1 " * (2**20 // 3 - 1),
+    ],
+)
+def test_validate_pgn_is_bounded_on_1mb_inputs(pgn):
+    start = time.perf_counter()
+    try:
+        pgn_utils.validate_pgn(pgn, max_length=2**20)
+    except pgn_utils.PGNValidationError:
+        pass
+    assert time.perf_counter() - start < 5
+
+
+def test_validate_pgn_fuzz():
+    fragments = ["1.", " ", "e4", "Nf3", "{", "}", "(", ")", "[", '"', "]", "#"]
+    fragments += ["=Q", "1-0", "*", "$1", ";", "\n", "x", "O-O", "Event", "9"]
+    rng = random.Random(1234)
+    for _ in range(2000):
+        pgn = "".join(rng.choice(fragments) for _ in range(rng.randint(0, 40)))
+        try:
+            pgn_utils.validate_pgn(pgn)
+        except pgn_utils.PGNValidationError as e:
+            assert 0 <= e.position <= len(pgn)
+
+
+def test_parse_pgn():
+    parsed = pgn_utils.parse_pgn('[White "a"]\n\n' + SCHOLARS_MATE)
+    assert parsed.is_valid
+    assert dict(parsed.headers) == {"White": "a"}
+    assert parsed.sans[-1] == "Qxf7#"
+    assert parsed.ucis[0] == "e2e4"
+    assert len(parsed.fens) == 7
+    assert parsed.fen_at(0) == parsed.start_fen
+
+
+def test_parse_pgn_illegal_move():
+    parsed = pgn_utils.parse_pgn("1. e4 e5 2. Ke3")
+    assert not parsed.is_valid
+
+
+def test_game_hash_ignores_headers_and_annotations():
+    annotated = (
+        '[Event "x"]\n\n1. e4 {best} e5!? 2. Qh5 (2. Nf3) Nc6 3. Bc4 Nf6 4. Qxf7# 1-0'
+    )
+    assert pgn_utils.parse_pgn(annotated).game_hash == (
+        pgn_utils.parse_pgn(SCHOLARS_MATE).game_hash
+    )
+    assert pgn_utils.parse_pgn("1. e4 e5 *").game_hash != (
+        pgn_utils.parse_pgn("1. d4 d5 *").game_hash
+    )
+
+
+ARCHIVE = (
+    '﻿[Event "a"]\n[White "x"]\n\n1. e4 {a comment\n[%clk 0:03:00] wrapped} e5 *\n\n'
+    '[Event "b"]\n\n1. d4 ; [not a header\nd5 1-0\n'
+    '[Event "c"]\n\n' + SCHOLARS_MATE
+)
+
+
+async def chunks_of(data: bytes, size: int):
+    for start in range(0, len(data), size):
+        yield data[start : start + size]
+
+
+async def read_games(data: bytes, size: int) -> list:
+    return [game async for game in pgn_utils.iter_pgn_games(chunks_of(data, size))]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("size", [1, 5, 64 * 1024])
+async def test_iter_pgn_games_splits_at_headers_after_movetext(size):
+    games = await read_games(ARCHIVE.encode(), size)
+    assert [pgn_utils.parse_pgn(game).headers["Event"] for game in games] == [
+        "a",
+        "b",
+        "c",
+    ]
+    assert all(pgn_utils.parse_pgn(game).is_valid for game in games)
+    assert games[0].startswith('[Event "a"]')
+
+
+@pytest.mark.asyncio
+async def test_iter_pgn_games_cuts_games_over_the_limit(monkeypatch):
+    monkeypatch.setattr(PGNConfig, "PGN_MAX_LENGTH", 200)
+    long_game = '[Event "long"]\n\n' + "1. Nf3 Nf6 2. Ng1 Ng8\n" * 50 + "*\n"
+    data = (long_game + '[Event "short"]\n\n1. e4 *\n').encode()
+    games = await read_games(data, 100)
+    assert len(games) == 2
+    assert len(games[0]) <= 200 + len("1. Nf3 Nf6 2. Ng1 Ng8\n")
+    assert "longer than 200" in pgn_utils.parse_pgn(games[0]).errors[0]
+    assert games[1] == '[Event "short"]\n\n1. e4 *'
@@ -0,0 +1,60 @@
+import pytest
+
+from app.api.utils import pgn_utils, prompt_utils
+from app.core.config import OPENAIConfig
+
+MOVES = "1. e4 e5 2. Nf3 Nc6 3. Bc4 Nd4 4. Nxe5 Qg5 5. Nxf7 Qxg2 6. Rf1 Qxe4+ 7. Be2 Nf3# 0-1"
+PGN = '[Event "Live Chess"]\n[Site "Chess.com"]\n[White "a"]\n[Black "b"]\n\n' + MOVES
+
+
+@pytest.fixture(autouse=True)
+def estimated_tokens(monkeypatch):
+    monkeypatch.setattr(prompt_utils, "get_encoding", lambda model: None)
+
+
+@pytest.mark.parametrize(
+    "score, expected",
+    [(35, "+35"), (-120, "-120"), (0, "+0"), ("Mate in 2 by White", "#2")]
+    + [("Mate in 1 by Black", "#-1"), (None, "?")],
+)
+def test_format_eval(score, expected):
+    assert prompt_utils.format_eval(score) == expected
+
+
+def test_prioritise_plies():
+    plies = [str(ply) for ply in range(1, 11)]
+    assert prompt_utils.prioritise_plies(plies, {"5": "x", "9": "y"}, 1) == [
+        "5",
+        "9",
+        "4",
+        "6",
+        "8",
+        "10",
+    ]
+    assert prompt_utils.prioritise_plies(plies[:3], {}, 2) == ["1", "2", "3"]
+
+
+def test_build_commentary_prompt_is_compact():
+    analysis = [("e2e4", 30)] * 14
+    plies = [str(ply) for ply in range(1, 15)]
+    prompt = prompt_utils.build_commentary_prompt(
+        pgn_utils.parse_pgn(PGN), analysis, {"8": "Qg5"}, plies, "gpt-3.5-turbo"
+    )
+    user = prompt.messages[1]["content"]
+    assert "Chess.com" not in user
+    assert 'White="a"' in user
+    assert "1.e4 e5 2.Nf3" in user
+    assert "8! Qg5 e2e4 +30" in user
+    assert prompt.plies == ["6", "7", "8", "9", "10"]
+
+
+def test_build_commentary_prompt_fits_budget(monkeypatch):
+    monkeypatch.setattr(OPENAIConfig, "COMMENTARY_INPUT_TOKENS", 220)
+    analysis = [("e2e4", 30)] * 14
+    plies = [str(ply) for ply in range(1, 15)]
+    prompt = prompt_utils.build_commentary_prompt(
+        pgn_utils.parse_pgn(PGN), analysis, {}, plies, "gpt-3.5-turbo"
+    )
+    assert prompt.input_tokens <= 220
+    assert 0 < len(prompt.plies) < len(plies)
+    assert prompt.plies == plies[: len(prompt.plies)]
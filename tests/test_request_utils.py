@@ -0,0 +1,122 @@
+import asyncio
+import gzip
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from app.api.utils import request_utils
+from app.core.config import PGNConfig
+
+
+class FakeRequest:
+    def __init__(self, headers=None, disconnected=False, body=b""):
+        self.headers = headers or {}
+        self.disconnected = disconnected
+        self.body = body
+
+    async def stream(self):
+        for start in range(0, len(self.body), 10):
+            yield self.body[start : start + 10]
+
+    async def is_disconnected(self):
+        return self.disconnected
+
+
+@pytest.fixture(autouse=True)
+def fast_polls(monkeypatch):
+    monkeypatch.setattr(request_utils, "DISCONNECT_POLL_INTERVAL", 0.01)
+
+
+@pytest.mark.asyncio
+async def test_request_deadline():
+    assert request_utils.request_deadline(FakeRequest()) is None
+    loop_time = asyncio.get_running_loop().time()
+    deadline = request_utils.request_deadline(
+        FakeRequest({request_utils.DEADLINE_HEADER: "2.5"})
+    )
+    assert loop_time + 2.5 <= deadline < loop_time + 3
+    for value in ("soon", "0", "-1", "nan"):
+        with pytest.raises(HTTPException):
+            request_utils.request_deadline(
+                FakeRequest({request_utils.DEADLINE_HEADER: value})
+            )
+
+
+@pytest.mark.asyncio
+async def test_wait_for_request_cancels_at_the_deadline():
+    work = asyncio.ensure_future(asyncio.sleep(10))
+    request = FakeRequest({request_utils.DEADLINE_HEADER: "0.05"})
+    with pytest.raises(asyncio.TimeoutError):
+        await request_utils.wait_for_request(work, request)
+    await asyncio.sleep(0)
+    assert work.cancelled()
+
+
+@pytest.mark.asyncio
+async def test_wait_for_request_cancels_when_the_client_leaves():
+    work = asyncio.ensure_future(asyncio.sleep(10))
+    with pytest.raises(request_utils.ClientDisconnected):
+        await request_utils.wait_for_request(work, FakeRequest(disconnected=True))
+    await asyncio.sleep(0)
+    assert work.cancelled()
+
+
+@pytest.mark.asyncio
+async def test_wait_while_connected_leaves_the_future_running():
+    work = asyncio.ensure_future(asyncio.sleep(0.1, result="done"))
+    loop_time = asyncio.get_running_loop().time()
+    request = FakeRequest()
+    assert not await request_utils.wait_while_connected(request, work, loop_time + 0.02)
+    assert await request_utils.wait_while_connected(request, work)
+    assert work.result() == "done"
+
+
+async def read_body(request) -> bytes:
+    return b"".join([chunk async for chunk in request_utils.body_chunks(request)])
+
+
+@pytest.mark.asyncio
+async def test_body_chunks_inflate_gzip_members(monkeypatch):
+    monkeypatch.setattr(request_utils, "BODY_CHUNK_SIZE", 16)
+    text = b"1. e4 e5 2. Nf3 Nc6 " * 20
+    gzipped = {"content-encoding": "gzip"}
+    body = gzip.compress(text) + gzip.compress(text)
+    assert await read_body(FakeRequest(gzipped, body=body)) == text * 2
+    assert await read_body(FakeRequest(body=text)) == text
+    for headers, body, status_code in (
+        (gzipped, gzip.compress(text)[:-4], 400),
+        (gzipped, text, 400),
+        ({"content-encoding": "br"}, text, 415),
+    ):
+        with pytest.raises(HTTPException) as error:
+            await read_body(FakeRequest(headers, body=body))
+        assert error.value.status_code == status_code
+
+
+@pytest.mark.asyncio
+async def test_read_pgn_body(monkeypatch):
+    monkeypatch.setattr(PGNConfig, "PGN_MAX_BODY_BYTES", 100)
+    pgn = "1. e4 e5 *"
+    for headers, body in (
+        ({}, pgn.encode()),
+        ({"content-type": "text/plain; charset=utf-8"}, pgn.encode()),
+        (
+            {"content-type": "application/json"},
+            json.dumps({"pgn_string": pgn}).encode(),
+        ),
+        ({"content-encoding": "gzip"}, gzip.compress(pgn.encode())),
+    ):
+        assert await request_utils.read_pgn_body(FakeRequest(headers, body=body)) == pgn
+    for headers, body, status_code in (
+        ({}, b"1. e4 " * 20, 413),
+        ({"content-length": "1000"}, b"", 413),
+        ({"content-encoding": "gzip"}, gzip.compress(b" " * 1000), 413),
+        ({"content-type": "application/json"}, b'{"pgn": "1. e4"}', 400),
+        ({"content-type": "application/json"}, b'["1. e4"]', 400),
+        ({}, b"\xff\xfe", 400),
+        ({"content-type": "image/png"}, b"1. e4", 415),
+    ):
+        with pytest.raises(HTTPException) as error:
+            await request_utils.read_pgn_body(FakeRequest(headers, body=body))
+        assert error.value.status_code == status_code